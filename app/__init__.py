@@ -23,6 +23,10 @@ def create_app(config_class=Config):
     from app.sync.routes import sync_bp
     app.register_blueprint(sync_bp)
 
+    # Comandos de mantenimiento (flask sync ...)
+    from app.sync.commands import sync_cli
+    app.cli.add_command(sync_cli)
+
     # Asegurarse de crear las tablas si la base de datos está vacía (solo para desarrollo)
     # with app.app_context():
     #     db.create_all() # ¡Solo para desarrollo! No uses esto en producción con una DB existente
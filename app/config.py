@@ -23,6 +23,8 @@ class Config:
         'text/xml',
         'text/plain',
         'application/json',
+        'application/vnd.aps.columnar+json',  # Formato columnar de sincronización
+        'application/msgpack',  # Respuestas de sincronización en MessagePack
         'application/javascript',
         'application/xml+rss',
         'application/atom+xml',
@@ -30,4 +32,58 @@ class Config:
     ]
     COMPRESS_LEVEL = 6  # Nivel de compresión (1-9, 6 es un buen balance)
     COMPRESS_MIN_SIZE = 500  # Solo comprimir respuestas > 500 bytes
-    COMPRESS_ALGORITHM = ['br', 'gzip', 'deflate']  # Prioridad: Brotli, luego gzip, luego deflate
\ No newline at end of file
+    COMPRESS_ALGORITHM = ['br', 'gzip', 'deflate']  # Prioridad: Brotli, luego gzip, luego deflate
+
+    # Caché por proceso de catálogos de traducción (aps_cue_opcion, comunas, barrios, etc.)
+    CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', 3600))  # Segundos; 0 desactiva la caché
+    CATALOG_CACHE_CHECKSUM = True  # Al vencer el TTL, recargar solo si cambia MAX(id)/COUNT(*)
+    CATALOG_CACHE_STAMP_DIR = os.environ.get('CATALOG_CACHE_STAMP_DIR')  # Por defecto <instance>/catalog_cache
+
+    # ETag / If-None-Match en initial-data (304 si el territorio no cambió)
+    SYNC_ETAG_ENABLED = True
+    SYNC_ETAG_CACHE_TTL = int(os.environ.get('SYNC_ETAG_CACHE_TTL', 60))  # Segundos que se reutiliza la huella para emitir ETags
+
+    # Leer la "última visita por familia" de aps_familia_visita_vigente cuando la tabla existe
+    # (se crea y llena con `flask sync rebuild-visitas-vigentes`)
+    SYNC_USE_VISITAS_VIGENTES = True
+    # Segundos que se recuerda que una tabla opcional (visitas vigentes, idempotencia, versiones) no existe
+    SYNC_TABLE_CHECK_TTL = int(os.environ.get('SYNC_TABLE_CHECK_TTL', 30))
+
+    # Consultas de detalle de la página (tablas de persona, ubicaciones, hábitat) en paralelo,
+    # cada una en su conexión y fuera de la transacción de la sesión; 1 (por defecto) las
+    # ejecuta en serie en la sesión, con la misma vista de los datos que el resto de la página
+    SYNC_DETAIL_FETCH_WORKERS = int(os.environ.get('SYNC_DETAIL_FETCH_WORKERS', 1))
+
+    # Máximo de familias por página de initial-data y GET /changes (per_page mayores se recortan)
+    SYNC_MAX_PER_PAGE = int(os.environ.get('SYNC_MAX_PER_PAGE', 1000))
+
+    # Máximo de páginas por descarga por lotes de initial-data (?pages=a-b / ?max_bytes=N)
+    SYNC_BATCH_MAX_PAGES = int(os.environ.get('SYNC_BATCH_MAX_PAGES', 20))
+
+    # Snapshots nocturnos de initial-data por territorio (`flask sync build-snapshots`)
+    SYNC_SNAPSHOT_DIR = os.environ.get('SYNC_SNAPSHOT_DIR')  # Por defecto <instance>/snapshots
+    SYNC_SNAPSHOT_MAX_AGE = int(os.environ.get('SYNC_SNAPSHOT_MAX_AGE', 86400))  # Segundos de vigencia
+    SYNC_SNAPSHOT_PER_PAGE = 500
+
+    # Filas por sentencia INSERT multi-fila al crear registros en POST /changes
+    SYNC_INSERT_CHUNK_ROWS = int(os.environ.get('SYNC_INSERT_CHUNK_ROWS', 500))
+    # Registros 'updated' por SAVEPOINT (un flush por lote) en POST /changes
+    SYNC_UPDATE_CHUNK_ROWS = int(os.environ.get('SYNC_UPDATE_CHUNK_ROWS', 200))
+
+    # Cuerpo de POST /changes: tamaño máximo (413 si se supera) y lectura incremental de los
+    # JSON grandes, aplicando los items por lotes de SYNC_STREAM_BUFFER_ITEMS a medida que llegan
+    SYNC_MAX_BODY_BYTES = int(os.environ.get('SYNC_MAX_BODY_BYTES', 64 * 1024 * 1024))
+    SYNC_STREAM_MIN_BODY_BYTES = int(os.environ.get('SYNC_STREAM_MIN_BODY_BYTES', 1024 * 1024))  # Cuerpos menores: request.json
+    SYNC_STREAM_BUFFER_ITEMS = int(os.environ.get('SYNC_STREAM_BUFFER_ITEMS', 500))
+    SYNC_STREAM_MAX_ITEM_BYTES = int(os.environ.get('SYNC_STREAM_MAX_ITEM_BYTES', 1024 * 1024))  # Máximo por registro
+
+    # Trabajos asíncronos de POST /changes (Prefer: respond-async o ?async=1)
+    SYNC_ASYNC_MIN_ITEMS = int(os.environ.get('SYNC_ASYNC_MIN_ITEMS', 500))  # Registros mínimos para encolar
+    SYNC_JOB_WORKERS = int(os.environ.get('SYNC_JOB_WORKERS', 2))  # Hilos por proceso que aplican trabajos
+    SYNC_JOBS_DIR = os.environ.get('SYNC_JOBS_DIR')  # Por defecto <instance>/sync_jobs
+    SYNC_JOB_RETENTION = int(os.environ.get('SYNC_JOB_RETENTION', 7 * 86400))  # Segundos que se guarda el resultado
+    SYNC_JOB_LEASE = int(os.environ.get('SYNC_JOB_LEASE', 300))  # Segundos sin latido tras los que un trabajo tomado vuelve a la cola
+
+    # Lotes idempotentes de POST /changes (Idempotency-Key): segundos tras los que un lote que
+    # quedó 'processing' (el proceso murió antes del commit) se puede volver a procesar
+    SYNC_IDEMPOTENCY_LOCK_TIMEOUT = int(os.environ.get('SYNC_IDEMPOTENCY_LOCK_TIMEOUT', 900))
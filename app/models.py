@@ -1,5 +1,6 @@
 from flask_jwt_extended import create_access_token, jwt_required, JWTManager, get_jwt_identity
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.mysql import LONGTEXT
 
 # from . import app # Importa la instancia de app desde __init__.py
 
@@ -667,4 +668,71 @@ class ApsCondicionesHabitatFamilia(db.Model):
     # deleted_at = db.Column(db.Date) # Para soft delete (añadir si no existe en tu tabla MySQL)
 
     def __repr__(self):
-        return f"<ApsCondicionesHabitatFamilia {self.id}>"
\ No newline at end of file
+        return f"<ApsCondicionesHabitatFamilia {self.id}>"
+
+
+# Tabla derivada (modelo de lectura) con la última visita activa de cada familia por comuna.
+# No es una tabla del sistema de información: la mantiene post_changes y se crea/reconstruye
+# con `flask sync rebuild-visitas-vigentes` (ver app/sync/visitas_vigentes.py).
+class ApsFamiliaVisitaVigente(db.Model):
+    __tablename__ = 'aps_familia_visita_vigente'
+    aps_ficha_familia_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    base_comuna_corregimiento_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    aps_visita_id = db.Column(db.Integer, nullable=False)
+    fecha_visita = db.Column(db.Date)
+    tiene_personas = db.Column(db.Boolean, nullable=False, default=False) # Alguna persona con apellidos válidos en visitas activas de la comuna
+    familia_valida = db.Column(db.Boolean, nullable=False, default=False) # apellido_familiar no NULL, no vacío, no 'NULL'
+    __table_args__ = (
+        db.Index('idx_visita_vigente_comuna_familia', 'base_comuna_corregimiento_id', 'aps_ficha_familia_id'),
+    )
+
+    def __repr__(self):
+        return f"<ApsFamiliaVisitaVigente {self.aps_ficha_familia_id}/{self.base_comuna_corregimiento_id}>"
+
+
+# Tablas de idempotencia de POST /changes (ver app/sync/idempotency.py). Tampoco son del sistema
+# de información: se crean con `flask sync create-idempotency-tables`.
+class SyncBatch(db.Model):
+    __tablename__ = 'sync_batch'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    idempotency_key = db.Column(db.String(128), nullable=False) # Header Idempotency-Key del cliente
+    request_hash = db.Column(db.String(64), nullable=False) # SHA-256 del cuerpo (detecta reutilizar la clave con otro cuerpo)
+    status = db.Column(db.String(16), nullable=False, default='processing') # processing | done
+    job_id = db.Column(db.String(32)) # Trabajo asíncrono que procesa el lote, si lo hay
+    sync_results = db.Column(db.Text().with_variant(LONGTEXT(), 'mysql')) # JSON de la respuesta
+    created_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'idempotency_key', name='uq_sync_batch_user_key'),
+    )
+
+    def __repr__(self):
+        return f"<SyncBatch {self.user_id}/{self.idempotency_key} {self.status}>"
+
+
+class SyncItem(db.Model):
+    __tablename__ = 'sync_item'
+    id = db.Column(db.Integer, primary_key=True)
+    tabla = db.Column(db.String(64), nullable=False) # Tabla del registro creado (aps_visita, aps_persona, ...)
+    client_uuid = db.Column(db.String(36), nullable=False) # UUID que el móvil asigna al registro creado
+    remote_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    __table_args__ = (
+        db.UniqueConstraint('tabla', 'client_uuid', name='uq_sync_item_tabla_uuid'),
+    )
+
+    def __repr__(self):
+        return f"<SyncItem {self.tabla}/{self.client_uuid} -> {self.remote_id}>"
+
+
+# Versión por comuna de los datos de sincronización (ver app/sync/territory_versions.py). Se crea
+# con `flask sync create-territory-versions`.
+class SyncTerritoryVersion(db.Model):
+    __tablename__ = 'sync_territory_version'
+    base_comuna_corregimiento_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, nullable=False, default=0) # Se incrementa en cada POST /changes que toca la comuna
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<SyncTerritoryVersion {self.base_comuna_corregimiento_id} v{self.version}>"
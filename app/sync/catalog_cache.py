@@ -0,0 +1,167 @@
+# app/sync/catalog_cache.py
+import os
+import tempfile
+import threading
+import time
+from types import MappingProxyType
+
+from flask import current_app
+from sqlalchemy import func
+from app.models import db, ApsCueOpcion, BaseComunaCorregimiento, BaseBarrioVereda, BaseTipoDocumento, \
+                       AuthOficina, ComProfesion
+
+# Catálogos de traducción: nombre -> (modelo, columna con el texto a mostrar).
+# Son tablas de consulta que casi nunca cambian, por eso se mantienen en memoria por proceso.
+CATALOGOS = {
+    "opciones": (ApsCueOpcion, ApsCueOpcion.descripcion),
+    "comunas": (BaseComunaCorregimiento, BaseComunaCorregimiento.nombre),
+    "barrios": (BaseBarrioVereda, BaseBarrioVereda.nombre),
+    "tipos_documento": (BaseTipoDocumento, BaseTipoDocumento.tipo),
+    "oficinas": (AuthOficina, AuthOficina.nombre),
+    "profesiones": (ComProfesion, ComProfesion.tipo),
+}
+
+
+class CatalogCache:
+    """
+    Caché por proceso de los catálogos de traducción {id: texto}.
+
+    - Carga perezosa: cada catálogo se consulta la primera vez que se pide.
+    - TTL: pasado CATALOG_CACHE_TTL segundos la entrada se revalida (0 desactiva la caché).
+    - Sonda de checksum opcional (CATALOG_CACHE_CHECKSUM): al vencer el TTL se consulta
+      MAX(id)/COUNT(*) y solo se recarga la tabla completa si cambió.
+    - Invalidación explícita con invalidate() (solo este proceso) o invalidate_catalogs(), que
+      además toca el archivo de sello del catálogo en catalog_stamp_dir(): cada proceso
+      compara el sello con el de su copia en cada acceso y recarga si cambió.
+
+    Los diccionarios devueltos son de solo lectura y se comparten entre requests.
+    """
+
+    def __init__(self, catalogos):
+        self._catalogos = catalogos
+        self._entradas = {}  # nombre -> {"datos", "checksum", "cargado_en"}
+        self._lock = threading.Lock()
+
+    def get(self, nombre):
+        """
+        Devuelve el catálogo {id: texto} indicado, cargándolo o revalidándolo si hace falta.
+
+        Args:
+            nombre (str): Clave de CATALOGOS ('opciones', 'comunas', ...).
+
+        Returns:
+            Mapping: Diccionario de solo lectura id -> texto.
+        """
+        ttl = current_app.config.get('CATALOG_CACHE_TTL', 3600)
+        if not ttl:
+            return self._load(nombre, None)["datos"]
+
+        sello = _sello(nombre)
+        entrada = self._entradas.get(nombre)
+        if entrada and entrada["sello"] == sello and time.monotonic() - entrada["cargado_en"] < ttl:
+            return entrada["datos"]
+
+        with self._lock:
+            # Otro hilo pudo haberlo recargado mientras esperábamos el lock
+            entrada = self._entradas.get(nombre)
+            ahora = time.monotonic()
+            if entrada and entrada["sello"] == sello and ahora - entrada["cargado_en"] < ttl:
+                return entrada["datos"]
+
+            if entrada and entrada["sello"] == sello and current_app.config.get('CATALOG_CACHE_CHECKSUM', True):
+                modelo, _ = self._catalogos[nombre]
+                if self._checksum(modelo) == entrada["checksum"]:
+                    # La tabla no cambió: se extiende la vigencia sin recargarla
+                    entrada["cargado_en"] = ahora
+                    return entrada["datos"]
+
+            entrada = self._load(nombre, sello)
+            self._entradas[nombre] = entrada
+            return entrada["datos"]
+
+    def invalidate(self, nombre=None):
+        """
+        Descarta un catálogo (o todos si nombre es None) para que se recargue en el próximo acceso.
+
+        Args:
+            nombre (str, optional): Clave de CATALOGOS a invalidar.
+        """
+        with self._lock:
+            if nombre is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(nombre, None)
+
+    def _checksum(self, modelo):
+        maximo, cantidad = db.session.query(func.max(modelo.id), func.count(modelo.id)).one()
+        return (maximo, cantidad)
+
+    def _load(self, nombre, sello):
+        modelo, columna_texto = self._catalogos[nombre]
+        checksum = self._checksum(modelo) if current_app.config.get('CATALOG_CACHE_CHECKSUM', True) else None
+        # Solo se proyectan (id, texto): no se hidratan entidades ORM completas
+        datos = {fila_id: texto for fila_id, texto in db.session.query(modelo.id, columna_texto)}
+        return {
+            "datos": MappingProxyType(datos),
+            "checksum": checksum,
+            "sello": sello,
+            "cargado_en": time.monotonic()
+        }
+
+
+def catalog_stamp_dir():
+    """Directorio de los sellos de invalidación (CATALOG_CACHE_STAMP_DIR o <instance>/catalog_cache)."""
+    return current_app.config.get('CATALOG_CACHE_STAMP_DIR') or os.path.join(current_app.instance_path, 'catalog_cache')
+
+
+def _sello(nombre):
+    # Identifica la última invalidación publicada del catálogo; None si nunca se invalidó
+    try:
+        estado = os.stat(os.path.join(catalog_stamp_dir(), nombre))
+    except FileNotFoundError:
+        return None
+    return (estado.st_ino, estado.st_mtime_ns)
+
+
+catalog_cache = CatalogCache(CATALOGOS)
+
+
+def get_catalog(nombre):
+    """
+    Atajo para catalog_cache.get(nombre).
+
+    Args:
+        nombre (str): Clave de CATALOGOS.
+
+    Returns:
+        Mapping: Diccionario de solo lectura id -> texto.
+    """
+    return catalog_cache.get(nombre)
+
+
+def invalidate_catalogs(nombre=None):
+    """
+    Invalida un catálogo (o todos) en todos los procesos que comparten catalog_stamp_dir():
+    reemplaza su archivo de sello, y cada proceso recarga el catálogo en el próximo acceso.
+
+    Args:
+        nombre (str, optional): Clave de CATALOGOS a invalidar.
+
+    Returns:
+        list[str]: Catálogos invalidados.
+
+    Raises:
+        KeyError: Si el catálogo no existe.
+    """
+    if nombre is not None and nombre not in CATALOGOS:
+        raise KeyError(nombre)
+    nombres = list(CATALOGOS) if nombre is None else [nombre]
+    directorio = catalog_stamp_dir()
+    os.makedirs(directorio, exist_ok=True)
+    for catalogo in nombres:
+        # os.replace cambia el inode aunque dos invalidaciones caigan en el mismo tick del reloj
+        descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix=f".{catalogo}.")
+        os.close(descriptor)
+        os.replace(temporal, os.path.join(directorio, catalogo))
+    catalog_cache.invalidate(nombre)
+    return nombres
@@ -0,0 +1,70 @@
+# app/sync/columnar.py
+from operator import itemgetter
+
+from app.sync.schema import SECTION_COLUMNS, DICTIONARY_COLUMNS
+
+# Tipo de contenido del formato columnar (también se puede pedir con ?format=columnar)
+COLUMNAR_MIMETYPE = 'application/vnd.aps.columnar+json'
+
+
+def encode_columnar(nombre, filas):
+    """
+    Convierte las filas (dicts) de una sección al formato columnar:
+
+        {"columns": [...], "rows": [[...], ...], "dictionaries": {columna: [valores]}}
+
+    Cada fila se envía como arreglo en el orden de SECTION_COLUMNS. En las columnas de
+    DICTIONARY_COLUMNS la celda lleva el índice del valor en dictionaries[columna] (null se
+    mantiene como null), así los textos traducidos que se repiten viajan una sola vez.
+
+    Args:
+        nombre (str): Nombre de la sección (clave de SECTION_COLUMNS).
+        filas (iterable[dict]): Filas serializadas de la sección.
+
+    Returns:
+        dict: Sección en formato columnar.
+
+    Raises:
+        ValueError: Si las claves de las filas no coinciden con el esquema de la sección.
+    """
+    columnas = SECTION_COLUMNS[nombre]
+    extraer = itemgetter(*columnas)
+    posiciones = [(columnas.index(columna), columna) for columna in DICTIONARY_COLUMNS.get(nombre, ())]
+    diccionarios = {columna: {} for _, columna in posiciones}
+
+    rows = []
+    for fila in filas:
+        if not rows and fila.keys() != set(columnas):
+            # Basta validar la primera fila: todas salen del mismo constructor
+            raise ValueError(f"Las filas de '{nombre}' no coinciden con SECTION_COLUMNS: {sorted(set(fila) ^ set(columnas))}")
+        valores = list(extraer(fila))
+        for posicion, columna in posiciones:
+            valor = valores[posicion]
+            if valor is not None:
+                diccionario = diccionarios[columna]
+                valores[posicion] = diccionario.setdefault(valor, len(diccionario))
+        rows.append(valores)
+
+    return {
+        "columns": list(columnas),
+        "rows": rows,
+        # Los dicts conservan el orden de inserción: la posición en la lista es el índice
+        "dictionaries": {columna: list(diccionario) for columna, diccionario in diccionarios.items()}
+    }
+
+
+def columnar_sections(sections):
+    """
+    Envuelve las secciones perezosas de build_initial_data_sections para que cada una
+    devuelva su versión columnar (se sigue evaluando solo al consumirse).
+
+    Args:
+        sections (dict): {nombre: callable que devuelve un iterable de filas}.
+
+    Returns:
+        dict: {nombre: callable que devuelve el dict columnar de la sección}.
+    """
+    def envolver(nombre, section):
+        return lambda: encode_columnar(nombre, section())
+
+    return {nombre: envolver(nombre, section) for nombre, section in sections.items()}
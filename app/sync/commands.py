@@ -0,0 +1,113 @@
+# app/sync/commands.py
+import datetime
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from app.models import db
+from app.sync.visitas_vigentes import rebuild_visitas_vigentes, refresh_visitas_vigentes
+from app.sync.queries import families_changed_since
+from app.sync.snapshots import user_territories, build_snapshot, remove_stale_snapshots
+from app.sync.idempotency import create_idempotency_tables
+from app.sync.territory_versions import create_territory_versions_table
+from app.sync.catalog_cache import CATALOGOS, invalidate_catalogs
+from app.sync.jobs import pending_jobs, run_changes_job, read_job, remove_finished_jobs
+
+sync_cli = AppGroup('sync', help='Tareas de mantenimiento de la sincronización móvil.')
+
+
+@sync_cli.command('rebuild-visitas-vigentes')
+def rebuild_visitas_vigentes_command():
+    """Crea (si no existe) y recalcula completa la tabla aps_familia_visita_vigente."""
+    filas = rebuild_visitas_vigentes()
+    click.echo(f"aps_familia_visita_vigente reconstruida: {filas} filas (familia, comuna).")
+
+
+@sync_cli.command('refresh-visitas-vigentes')
+@click.option('--hours', type=float, default=24, show_default=True,
+              help='Recalcular las familias con registros modificados en las últimas N horas.')
+def refresh_visitas_vigentes_command(hours):
+    """
+    Recalcula en aps_familia_visita_vigente las familias modificadas recientemente. POST
+    /changes la mantiene al día; esto cubre las escrituras hechas fuera de la API (otros
+    sistemas, correcciones directas en la base). Pensado para correr periódicamente con cron.
+    """
+    since = datetime.datetime.now() - datetime.timedelta(hours=hours)
+    familia_ids = [familia_id for familia_id, in db.session.execute(families_changed_since(since))]
+    refresh_visitas_vigentes(familia_ids)
+    db.session.commit()
+    click.echo(f"aps_familia_visita_vigente: {len(set(familia_ids))} familias recalculadas.")
+
+
+@sync_cli.command('create-idempotency-tables')
+def create_idempotency_tables_command():
+    """Crea (si no existen) sync_batch y sync_item para los lotes idempotentes de POST /changes."""
+    create_idempotency_tables()
+    click.echo("Tablas sync_batch y sync_item disponibles.")
+
+
+@sync_cli.command('create-territory-versions')
+def create_territory_versions_command():
+    """
+    Crea (si no existe) sync_territory_version. Sin ella initial-data no emite ETags: los
+    updated_at DATE no distinguen dos cambios del mismo día.
+    """
+    create_territory_versions_table()
+    click.echo("Tabla sync_territory_version disponible.")
+
+
+@sync_cli.command('invalidate-catalogs')
+@click.argument('nombre', required=False, type=click.Choice(sorted(CATALOGOS)))
+def invalidate_catalogs_command(nombre):
+    """
+    Fuerza a todos los procesos a recargar un catálogo de traducción (o todos) en su próximo
+    acceso, p. ej. después de editar aps_cue_opcion o base_barrio_vereda directamente en la base.
+    """
+    nombres = invalidate_catalogs(nombre)
+    click.echo(f"Catálogos invalidados: {', '.join(nombres)}.")
+
+
+@sync_cli.command('build-snapshots')
+@click.option('--per-page', type=int, default=None, help='Familias por página dentro del snapshot.')
+def build_snapshots_command(per_page):
+    """
+    Genera el snapshot comprimido de initial-data de cada territorio (pensado para correr de
+    noche, p. ej. desde cron). initial-data?snapshot=1 lo sirve mientras esté vigente.
+    """
+    per_page = per_page or current_app.config.get('SYNC_SNAPSHOT_PER_PAGE', 500)
+    vigentes = set()
+    errores = 0
+    for comunas in user_territories():
+        try:
+            ruta, total = build_snapshot(comunas, per_page)
+        except Exception as e:
+            db.session.rollback()
+            errores += 1
+            click.echo(f"Error generando el snapshot de las comunas {list(comunas)}: {e}", err=True)
+            continue
+        vigentes.add(ruta)
+        click.echo(f"Comunas {list(comunas)}: {total} familias -> {ruta}")
+
+    if not errores:
+        # Solo se limpian si la corrida fue completa, para no borrar snapshots aún útiles
+        borrados = remove_stale_snapshots(vigentes)
+        if borrados:
+            click.echo(f"Snapshots obsoletos eliminados: {borrados}")
+    else:
+        raise click.ClickException(f"{errores} territorio(s) con error")
+
+
+@sync_cli.command('process-jobs')
+@click.option('--retry-running', is_flag=True, help="Reencolar también los trabajos en 'running' cuyo worker dejó de renovar el lease (SYNC_JOB_LEASE).")
+def process_jobs_command(retry_running):
+    """
+    Aplica los trabajos de POST /changes que quedaron en cola (p. ej. tras reiniciar la
+    aplicación) y borra los terminados hace más de SYNC_JOB_RETENTION segundos.
+    """
+    for job_id in pending_jobs(incluir_en_proceso=retry_running):
+        run_changes_job(job_id)
+        estado = read_job(job_id)
+        click.echo(f"Trabajo {job_id}: {estado['status'] if estado else 'desconocido'}")
+
+    borrados = remove_finished_jobs(current_app.config.get('SYNC_JOB_RETENTION', 7 * 86400))
+    if borrados:
+        click.echo(f"Trabajos antiguos eliminados: {borrados}")
@@ -0,0 +1,149 @@
+# app/sync/entities.py
+# Registro de las tablas que sincroniza POST /changes.
+#
+# Cada sección del cuerpo (familias, visitas, ...) se declara una vez con su modelo, sus campos
+# de fecha y decimales, sus FK a otras secciones y su borrado lógico; app/sync/ingest.py aplica
+# los created/updated/deleted de todas con el mismo código.
+from app.models import ApsFichaFamilia, ApsPersona, ApsVisita, ApsUbicacionFamilia, ApsCondicionesHabitatFamilia, \
+                       ApsPersonaAntecedenteMedico, ApsPersonaComponenteMental, ApsPersonaCondicionesSalud, \
+                       ApsPersonaDatoBasico, ApsPersonaEstilosVidaConducta, ApsPersonaMaternidad, \
+                       ApsPersonaPracticasSaludSaludSexual
+
+
+def _borrado_con_deleted_at(user, ahora):
+    # deleted_at solo se escribe en las tablas que tienen la columna (ver ingest.bulk_soft_delete)
+    return {'deleted_at': ahora.date(), 'updated_at': ahora.date()}
+
+
+class SyncEntity:
+    """
+    Declaración de una sección de POST /changes.
+
+    Args:
+        seccion (str): Clave en el cuerpo y en sync_results ('familias', 'visitas', ...).
+        modelo (Model): Modelo de la tabla.
+        fechas (tuple[str]): Campos de fecha obligatorios al crear (texto isoformat -> date).
+        fechas_opcionales (tuple[str]): Campos de fecha que se convierten si tienen valor.
+        decimales (tuple[str]): Campos que se convierten a float si tienen valor.
+        con_hora (bool): created_at/updated_at son DATETIME en lugar de DATE.
+        padres (dict): {columna FK: sección del padre}. El móvil puede enviar
+            <columna sin _id>_local_id con el ID local de un padre creado en el mismo lote
+            (aps_visita_id -> aps_visita_local_id; aps_ficha_familia -> aps_ficha_familia_local_id).
+        borrado_logico (callable): (user, ahora) -> {columna: valor} del borrado lógico.
+        error_update_sin_remote_id (str): Mensaje de un 'updated' sin remote_id.
+        error_delete_sin_remote_id (str): Mensaje de un 'deleted' sin remote_id.
+    """
+
+    def __init__(self, seccion, modelo, fechas=(), fechas_opcionales=(), decimales=(), con_hora=False,
+                 padres=None, borrado_logico=_borrado_con_deleted_at,
+                 error_update_sin_remote_id="No remote_id provided",
+                 error_delete_sin_remote_id="No remote_id provided"):
+        self.seccion = seccion
+        self.modelo = modelo
+        self.fechas = fechas
+        self.fechas_opcionales = fechas_opcionales
+        self.decimales = decimales
+        self.con_hora = con_hora
+        self.padres = padres or {}
+        self.borrado_logico = borrado_logico
+        self.error_update_sin_remote_id = error_update_sin_remote_id
+        self.error_delete_sin_remote_id = error_delete_sin_remote_id
+
+        self.tabla = modelo.__table__
+        self.columnas = frozenset(self.tabla.columns.keys())
+        self.campos_fecha = frozenset(('created_at', 'updated_at') + fechas + fechas_opcionales)
+        # (columna FK, clave con el local_id del padre, sección del padre); p. ej.
+        # ('aps_visita_id', 'aps_visita_local_id', 'visitas')
+        self.referencias = tuple(
+            (columna, f"{columna[:-3] if columna.endswith('_id') else columna}_local_id", seccion_padre)
+            for columna, seccion_padre in self.padres.items()
+        )
+
+    def marca_de_tiempo(self, ahora):
+        """updated_at del servidor para `ahora` (datetime o date según la columna)."""
+        return ahora if self.con_hora else ahora.date()
+
+    def __repr__(self):
+        return f"<SyncEntity {self.seccion}>"
+
+
+_PADRES_DETALLE = {'aps_persona_id': 'personas', 'aps_visita_id': 'visitas'}
+
+ENTIDADES = (
+    SyncEntity(
+        'familias', ApsFichaFamilia, con_hora=True,
+        borrado_logico=lambda user, ahora: {'vigencia_registro': 0, 'updated_at': ahora},
+        error_update_sin_remote_id="No remote_id provided for update",
+        error_delete_sin_remote_id="No remote_id provided for deletion"
+    ),
+    SyncEntity(
+        'visitas', ApsVisita, fechas=('fecha_visita',),
+        padres={'aps_ficha_familia_id': 'familias'},
+        borrado_logico=lambda user, ahora: {
+            'valido': False, 'updated_at': ahora.date(), 'invalidated_at': ahora.date(), 'invalidated_by': user.id
+        }
+    ),
+    SyncEntity(
+        'personas', ApsPersona, fechas=('fecha_registro',),
+        padres={'aps_ficha_familia_id': 'familias', 'aps_visita_id': 'visitas'},
+        borrado_logico=lambda user, ahora: {'vigencia_registro': False, 'updated_at': ahora.date()}
+    ),
+    SyncEntity('ubicaciones_familia', ApsUbicacionFamilia, padres={'aps_visita_id': 'visitas'}),
+    # La FK a la familia se llama aps_ficha_familia (sin _id), pero la clave local que envía el
+    # móvil es la misma de visitas y personas: aps_ficha_familia_local_id
+    SyncEntity(
+        'condiciones_habitat_familia', ApsCondicionesHabitatFamilia,
+        padres={'aps_visita_id': 'visitas', 'aps_ficha_familia': 'familias'}
+    ),
+    SyncEntity('persona_antecedente_medico', ApsPersonaAntecedenteMedico, padres=_PADRES_DETALLE),
+    SyncEntity('persona_componente_mental', ApsPersonaComponenteMental, padres=_PADRES_DETALLE),
+    SyncEntity(
+        'persona_condiciones_salud', ApsPersonaCondicionesSalud, padres=_PADRES_DETALLE,
+        fechas_opcionales=('fecha_programada_citologia_cervico_uterina',)
+    ),
+    SyncEntity('persona_dato_basico', ApsPersonaDatoBasico, padres=_PADRES_DETALLE),
+    SyncEntity(
+        'persona_estilos_vida_conducta', ApsPersonaEstilosVidaConducta, padres=_PADRES_DETALLE,
+        decimales=('peso', 'talla', 'valor_imc')
+    ),
+    SyncEntity(
+        'persona_maternidad', ApsPersonaMaternidad, padres=_PADRES_DETALLE,
+        fechas_opcionales=('fecha_probable_parto',)
+    ),
+    SyncEntity(
+        'persona_practicas_salud_salud_sexual', ApsPersonaPracticasSaludSaludSexual, padres=_PADRES_DETALLE,
+        fechas_opcionales=('fecha_proxima_vacunacion',)
+    ),
+)
+
+
+def topological_order(entidades):
+    """
+    Ordena las entidades para que cada una se procese después de sus padres (orden de
+    declaración entre las independientes).
+
+    Raises:
+        ValueError: Si un padre no está registrado o hay un ciclo.
+    """
+    secciones = {entidad.seccion for entidad in entidades}
+    pendientes = list(entidades)
+    orden, hechas = [], set()
+    while pendientes:
+        for entidad in pendientes:
+            faltantes = set(entidad.padres.values()) - hechas
+            if faltantes - secciones:
+                raise ValueError(f"{entidad.seccion}: padres no registrados {sorted(faltantes - secciones)}")
+            if not faltantes:
+                break
+        else:
+            raise ValueError(f"Ciclo de dependencias entre {[entidad.seccion for entidad in pendientes]}")
+        pendientes.remove(entidad)
+        orden.append(entidad)
+        hechas.add(entidad.seccion)
+    return tuple(orden)
+
+
+# Orden en que process_changes aplica las secciones (padres antes que hijos)
+ORDEN_ENTIDADES = topological_order(ENTIDADES)
+
+ENTIDADES_POR_SECCION = {entidad.seccion: entidad for entidad in ENTIDADES}
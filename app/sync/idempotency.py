@@ -0,0 +1,152 @@
+# app/sync/idempotency.py
+# Idempotencia de POST /changes.
+#
+# Cuando una subida se corta por timeout el móvil reenvía el mismo cuerpo. Con el header
+# Idempotency-Key el lote queda registrado en sync_batch y un reintento devuelve los
+# sync_results guardados sin volver a procesarlo. Además, cada registro creado puede traer un
+# client_uuid: sync_item guarda su remote_id, así un registro que ya se creó (aunque llegue en
+# otro lote) no se duplica.
+import datetime
+import hashlib
+import json
+from flask import current_app
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from app.models import db, SyncBatch, SyncItem
+from app.sync.table_cache import tables_exist
+
+LOTE_EN_PROCESO = 'processing'
+LOTE_TERMINADO = 'done'
+
+
+def idempotency_available():
+    """
+    Indica si existen sync_batch y sync_item (se crean con `flask sync create-idempotency-tables`).
+    Sin ellas POST /changes ignora Idempotency-Key y client_uuid.
+
+    Un "no existen" no se cachea: si se confiara en él, un worker iniciado antes de crear las
+    tablas aplicaría dos veces los reintentos hasta reiniciarse.
+    """
+    return tables_exist(SyncBatch, SyncItem, max_age=0)
+
+
+def create_idempotency_tables():
+    """Crea sync_batch y sync_item si no existen."""
+    for modelo in (SyncBatch, SyncItem):
+        modelo.__table__.create(db.engine, checkfirst=True)
+
+
+def request_fingerprint(datos):
+    """SHA-256 del cuerpo de la petición."""
+    return hashlib.sha256(datos).hexdigest()
+
+
+def claim_batch(user, clave, huella):
+    """
+    Registra (con commit) el lote `clave` del usuario como en proceso, o devuelve el registro
+    existente si la clave ya se usó. Un lote en proceso sin trabajo asíncrono y más antiguo
+    que SYNC_IDEMPOTENCY_LOCK_TIMEOUT se considera abandonado (el proceso que lo tomó murió
+    antes del commit) y se vuelve a tomar.
+
+    Args:
+        user (User): Usuario que sincroniza.
+        clave (str): Header Idempotency-Key.
+        huella (str): request_fingerprint del cuerpo.
+
+    Returns:
+        tuple: (id del lote tomado, None) o (None, SyncBatch existente).
+    """
+    ahora = datetime.datetime.now()
+    try:
+        lote = SyncBatch(user_id=user.id, idempotency_key=clave, request_hash=huella,
+                         status=LOTE_EN_PROCESO, created_at=ahora)
+        db.session.add(lote)
+        db.session.commit()
+        return lote.id, None
+    except IntegrityError:
+        db.session.rollback()
+
+    existente = SyncBatch.query.filter_by(user_id=user.id, idempotency_key=clave).first()
+    if existente is None:
+        # Se liberó entre el INSERT y la consulta: el cliente puede reintentar
+        return None, None
+
+    limite = ahora - datetime.timedelta(seconds=current_app.config.get('SYNC_IDEMPOTENCY_LOCK_TIMEOUT', 900))
+    if (existente.status == LOTE_EN_PROCESO and existente.job_id is None
+            and existente.request_hash == huella and existente.created_at < limite):
+        existente.created_at = ahora
+        db.session.commit()
+        return existente.id, None
+    return None, existente
+
+
+def attach_job(lote_id, job_id):
+    """Asocia (con commit) el trabajo asíncrono que procesará el lote."""
+    db.session.get(SyncBatch, lote_id).job_id = job_id
+    db.session.commit()
+
+
+def finish_batch(lote_id, sync_results, job_id=None):
+    """
+    Marca el lote como terminado y guarda sus sync_results, en la transacción de los cambios.
+
+    Es la marca que decide quién confirma el lote: el UPDATE solo afecta al lote si sigue en
+    proceso (y, con job_id, si sigue asignado a ese trabajo). Si dos procesos aplicaron el mismo
+    lote (un worker con el lease vencido y el que retomó el trabajo, o un request retomado por
+    claim_batch) el segundo UPDATE espera el commit del primero y ya no encuentra la fila en
+    proceso: ese proceso debe hacer rollback de sus cambios.
+
+    Args:
+        lote_id (int): Lote tomado con claim_batch.
+        sync_results (dict): Resultados a guardar.
+        job_id (str, optional): Trabajo asíncrono que debe tener asignado el lote.
+
+    Returns:
+        bool: Si este proceso quedó como el que confirma el lote.
+    """
+    condiciones = [SyncBatch.id == lote_id, SyncBatch.status == LOTE_EN_PROCESO]
+    if job_id is not None:
+        condiciones.append(SyncBatch.job_id == job_id)
+    resultado = db.session.execute(update(SyncBatch).where(*condiciones).values(
+        status=LOTE_TERMINADO,
+        sync_results=json.dumps(sync_results, ensure_ascii=False, default=str),
+        finished_at=datetime.datetime.now()
+    ).execution_options(synchronize_session=False))
+    return resultado.rowcount == 1
+
+
+def release_batch(lote_id):
+    """Borra (con commit) un lote cuyo procesamiento falló, para que un reintento lo procese."""
+    SyncBatch.query.filter_by(id=lote_id, status=LOTE_EN_PROCESO).delete()
+    db.session.commit()
+
+
+def known_items(tabla, client_uuids):
+    """
+    remote_id de los registros ya creados con esos client_uuid, en una consulta IN.
+
+    Returns:
+        dict: {client_uuid: remote_id}.
+    """
+    if not client_uuids:
+        return {}
+    return dict(db.session.execute(
+        select(SyncItem.client_uuid, SyncItem.remote_id)
+        .where(SyncItem.tabla == tabla, SyncItem.client_uuid.in_(set(client_uuids)))
+    ).all())
+
+
+def record_items(tabla, creados):
+    """
+    Registra los client_uuid de registros recién creados (en la transacción actual).
+
+    Args:
+        tabla (str): Tabla de los registros (p. ej. aps_visita).
+        creados (list[tuple]): (client_uuid, remote_id).
+    """
+    if creados:
+        ahora = datetime.datetime.now()
+        db.session.execute(insert(SyncItem.__table__), [
+            {"tabla": tabla, "client_uuid": client_uuid, "remote_id": remote_id, "created_at": ahora}
+            for client_uuid, remote_id in creados
+        ])
@@ -0,0 +1,614 @@
+# app/sync/ingest.py
+# Aplicación de los cambios de POST /changes: un solo camino (INSERT multi-fila, UPDATE en
+# SAVEPOINT por lote, borrado lógico con IN) para todas las tablas declaradas en
+# app/sync/entities.py.
+import datetime
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app
+from sqlalchemy import insert, text, update
+from app.models import db
+from app.sync.entities import ENTIDADES, ENTIDADES_POR_SECCION, ORDEN_ENTIDADES
+from app.sync.idempotency import idempotency_available, known_items, record_items
+from app.sync.stream_parser import ItemSpool
+from app.sync.visitas_vigentes import refresh_visitas_vigentes, familias_afectadas
+from app.sync.territory_versions import bump_territory_versions
+
+# Campos de control de la app móvil que no son columnas de las tablas
+CAMPOS_SINCRONIZACION = ('remote_id', 'last_modified_at', 'is_synced', 'deleted_at')
+
+# Filas por sentencia INSERT multi-fila si no se configura SYNC_INSERT_CHUNK_ROWS (acotado
+# por max_allowed_packet de MySQL)
+INSERT_CHUNK_ROWS = 500
+
+# IDs por cláusula IN al cargar o actualizar registros existentes
+IN_CHUNK_IDS = 1000
+
+# Registros 'updated' por SAVEPOINT (y flush) si no se configura SYNC_UPDATE_CHUNK_ROWS
+UPDATE_CHUNK_ROWS = 200
+
+# Items leídos del cuerpo que se acumulan antes de aplicarlos si no se configura
+# SYNC_STREAM_BUFFER_ITEMS (ver process_change_stream)
+STREAM_BUFFER_ITEMS = 500
+
+ACCIONES = ('created', 'updated', 'deleted')
+
+# Contadores por proceso: {(seccion, accion): [items, fallidos, segundos]}
+_contadores = {}
+_contadores_lock = threading.Lock()
+
+
+def _fecha(valor):
+    return datetime.datetime.fromisoformat(valor).date()
+
+
+def _preparar(item, entidad, ahora):
+    # Mismas conversiones que hacía post_changes al construir la entidad ORM
+    for clave in item:
+        if clave not in entidad.columnas:
+            raise TypeError(f"{clave!r} is an invalid keyword argument for {entidad.modelo.__name__}")
+
+    if entidad.con_hora:
+        item['created_at'] = datetime.datetime.fromisoformat(item.get('created_at'))
+    else:
+        for campo in entidad.fechas:
+            item[campo] = _fecha(item[campo])
+        item['created_at'] = _fecha(item['created_at'])
+    item['updated_at'] = entidad.marca_de_tiempo(ahora)
+
+    for campo in entidad.fechas_opcionales:
+        if campo in item and item[campo]:
+            item[campo] = _fecha(item[campo])
+    for campo in entidad.decimales:
+        if campo in item and item[campo] is not None:
+            item[campo] = float(item[campo])
+
+
+def _resolver_referencias(item, entidad, ids_locales):
+    # Reemplaza <fk>_local_id (ID local de un padre creado en el mismo lote) por su remote_id
+    for columna, clave_local, seccion_padre in entidad.referencias:
+        if clave_local not in item:
+            continue
+        local_id = item.pop(clave_local)
+        if local_id is None:
+            continue
+        remote_id = ids_locales.get(seccion_padre, {}).get(str(local_id))
+        if remote_id is None:
+            raise LookupError(f"Unresolved reference {clave_local}={local_id!r}: parent record was not created in this batch")
+        item[columna] = remote_id
+
+
+def _autoincremento(conexion):
+    """
+    (auto_increment_increment, innodb_autoinc_lock_mode) de una conexión MySQL. Se consultan
+    una vez por conexión física y se guardan en conexion.info (sobrevive al pool).
+    """
+    if 'sync_autoincremento' not in conexion.info:
+        paso, modo = conexion.execute(text("SELECT @@auto_increment_increment, @@innodb_autoinc_lock_mode")).one()
+        conexion.info['sync_autoincremento'] = (paso or 1, modo)
+    return conexion.info['sync_autoincremento']
+
+
+def _insert_rows(tabla, filas):
+    """
+    Inserta filas con las mismas claves y devuelve sus IDs en orden.
+
+    Con RETURNING ordenado (SQLite, MariaDB, PostgreSQL) es una sola sentencia y los IDs vienen
+    en el resultado. En MySQL un INSERT multi-fila solo informa lastrowid (el ID de la primera
+    fila); los demás se deducen con auto_increment_increment únicamente si
+    innodb_autoinc_lock_mode es 0 o 1, que reservan el bloque completo de un "simple insert".
+    Con el modo 2 (intercalado, el predeterminado desde MySQL 8.0) los IDs de un INSERT
+    concurrente pueden mezclarse, así que se inserta fila por fila.
+    """
+    dialecto = db.session.get_bind().dialect
+    if dialecto.insert_executemany_returning_sort_by_parameter_order:
+        resultado = db.session.execute(insert(tabla).returning(tabla.c.id, sort_by_parameter_order=True), filas)
+        return [fila.id for fila in resultado]
+
+    paso, modo = _autoincremento(db.session.connection())
+    if modo in (0, 1):
+        resultado = db.session.execute(insert(tabla).values(filas))
+        return [resultado.lastrowid + i * paso for i in range(len(filas))]
+    return [db.session.execute(insert(tabla).values(fila)).lastrowid for fila in filas]
+
+
+def _insertar(tabla, lote, usar_uuid):
+    # INSERT del lote y, en la misma transacción, el registro de sus client_uuid
+    ids = _insert_rows(tabla, [fila for _, _, fila, _ in lote])
+    if usar_uuid:
+        record_items(tabla.name, [(client_uuid, remote_id) for (_, _, _, client_uuid), remote_id in zip(lote, ids) if client_uuid])
+    return ids
+
+
+def bulk_create(entidad, items, resultados, ids_locales=None):
+    """
+    Inserta los registros 'created' de una tabla enviados por el móvil con INSERT multi-fila
+    (agrupados por conjunto de columnas) en lugar de un add() + flush() por registro, y agrega
+    a `resultados` lo mismo que antes: por cada item, en orden, su local_id con el remote_id
+    generado y new_last_modified_at, o el error.
+
+    Si un lote falla se reintenta fila por fila (cada intento en un SAVEPOINT) para reportar
+    el error solo en los registros que lo causan; el resto de la sincronización sigue.
+
+    Los items con un client_uuid ya registrado en sync_item no se vuelven a insertar: se
+    responde con su remote_id (y "replayed": true).
+
+    Con `ids_locales` un item puede referenciar a un padre creado antes en el mismo lote con
+    <fk>_local_id (p. ej. aps_visita_local_id en lugar de aps_visita_id, según los `padres`
+    de la entidad): se reemplaza por el remote_id del padre. Si el padre no se creó, el item
+    falla. Los remote_id de los items creados se agregan a `ids_locales` para las tablas
+    siguientes.
+
+    Args:
+        entidad (SyncEntity): Tabla (ver app/sync/entities.py).
+        items (list[dict]): Registros 'created' del móvil (se modifican en el lugar).
+        resultados (list): sync_results[seccion]['created'].
+        ids_locales (dict, optional): {seccion: {str(local_id): remote_id}} del lote.
+    """
+    modelo, tabla = entidad.modelo, entidad.tabla
+    ahora = datetime.datetime.now()
+    tamano_lote = current_app.config.get('SYNC_INSERT_CHUNK_ROWS', INSERT_CHUNK_ROWS)
+
+    # Registros que ya se crearon en una sincronización anterior (mismo client_uuid)
+    usar_uuid = idempotency_available()
+    conocidos = known_items(tabla.name, [item['client_uuid'] for item in items if item.get('client_uuid')]) if usar_uuid else {}
+    repetidos = []
+
+    # (posición en resultados, local_id, fila, client_uuid) de los items válidos, agrupados por columnas
+    grupos = {}
+    for item in items:
+        local_id = item.pop('id')
+        client_uuid = item.pop('client_uuid', None)
+        for campo in CAMPOS_SINCRONIZACION:
+            item.pop(campo, None)
+        if client_uuid in conocidos:
+            resultados.append(None)
+            repetidos.append((len(resultados) - 1, local_id, conocidos[client_uuid]))
+            continue
+        try:
+            if ids_locales is not None:
+                _resolver_referencias(item, entidad, ids_locales)
+            _preparar(item, entidad, ahora)
+        except Exception as e:
+            resultados.append({"local_id": local_id, "status": "failed", "error": str(e)})
+            continue
+        resultados.append(None)  # Se completa después del INSERT, conservando el orden
+        grupos.setdefault(tuple(sorted(item)), []).append((len(resultados) - 1, local_id, item, client_uuid))
+
+    if repetidos:
+        # Se responde como la primera vez, con el updated_at actual del registro
+        updated_at = dict(db.session.query(modelo.id, modelo.updated_at).filter(
+            modelo.id.in_({remote_id for _, _, remote_id in repetidos})
+        ))
+        for posicion, local_id, remote_id in repetidos:
+            valor = updated_at.get(remote_id)
+            resultados[posicion] = {
+                "local_id": local_id,
+                "remote_id": remote_id,
+                "new_last_modified_at": valor.isoformat() if valor and hasattr(valor, 'isoformat') else None,
+                "status": "success",
+                "replayed": True
+            }
+            if ids_locales is not None:
+                ids_locales.setdefault(entidad.seccion, {})[str(local_id)] = remote_id
+
+    for grupo in grupos.values():
+        for inicio in range(0, len(grupo), tamano_lote):
+            lote = grupo[inicio:inicio + tamano_lote]
+            try:
+                with db.session.begin_nested():
+                    ids = _insertar(tabla, lote, usar_uuid)
+            except Exception:
+                ids = []
+                for entrada in lote:
+                    try:
+                        with db.session.begin_nested():
+                            ids.extend(_insertar(tabla, [entrada], usar_uuid))
+                    except Exception as e:
+                        ids.append(e)
+
+            for (posicion, local_id, fila, _), remote_id in zip(lote, ids):
+                if isinstance(remote_id, Exception):
+                    resultados[posicion] = {"local_id": local_id, "status": "failed", "error": str(remote_id)}
+                else:
+                    resultados[posicion] = {
+                        "local_id": local_id,
+                        "remote_id": remote_id,
+                        "new_last_modified_at": fila['updated_at'].isoformat(),
+                        "status": "success"
+                    }
+                    if ids_locales is not None:
+                        ids_locales.setdefault(entidad.seccion, {})[str(local_id)] = remote_id
+
+
+def remote_key(remote_id):
+    """Normaliza un remote_id del móvil (puede llegar como texto) a la clave de load_by_ids."""
+    if isinstance(remote_id, str) and remote_id.isdigit():
+        return int(remote_id)
+    return remote_id
+
+
+def _por_ids(consulta, modelo, ids):
+    # Ejecuta la consulta con `modelo.id IN (...)` por lotes de IN_CHUNK_IDS
+    ids = list(dict.fromkeys(ids))
+    for inicio in range(0, len(ids), IN_CHUNK_IDS):
+        yield from consulta.filter(modelo.id.in_(ids[inicio:inicio + IN_CHUNK_IDS]))
+
+
+def load_by_ids(modelo, items):
+    """
+    Carga en una consulta IN por lote los registros referenciados por los remote_id de los
+    items (en lugar de un Model.query.get por item).
+
+    Args:
+        modelo (Model): Modelo de la tabla.
+        items (list[dict]): Registros 'updated' del móvil; los que no traen remote_id se ignoran.
+
+    Returns:
+        dict: {remote_key(remote_id): instancia}. Los remote_id inexistentes no tienen entrada.
+    """
+    ids = [remote_key(item.get('remote_id')) for item in items if item.get('remote_id')]
+    return {registro.id: registro for registro in _por_ids(modelo.query, modelo, ids)}
+
+
+def _valor_update(entidad, clave, valor):
+    # Conversión de un campo 'updated': fechas (datetime en las columnas con hora) y decimales
+    if clave in ('created_at', 'updated_at') and entidad.con_hora:
+        return datetime.datetime.fromisoformat(valor) if valor else None
+    if clave in entidad.campos_fecha:
+        return _fecha(valor) if valor else None
+    if clave in entidad.decimales and valor is not None:
+        return float(valor)
+    return valor
+
+
+def _fecha_servidor(valor):
+    # updated_at del servidor como date (None o '0000-00-00' -> date.min)
+    if not valor or str(valor) in ("0000-00-00", "None"):
+        return datetime.date.min
+    if not isinstance(valor, datetime.date):
+        try:
+            return valor.date()
+        except Exception:
+            return datetime.date.min
+    return valor
+
+
+def _actualizar(entidad, registro, item, ids_locales, ahora):
+    """
+    Aplica un registro 'updated' sobre la instancia con Last Write Wins por fecha: gana la
+    versión del móvil si su last_modified_at es de un día posterior al updated_at del
+    servidor. Devuelve el resultado del item sin local_id/remote_id.
+    """
+    datos = dict(item)
+    mobile_last_modified_at_str = datos.pop('last_modified_at', None)
+    if ids_locales is not None:
+        _resolver_referencias(datos, entidad, ids_locales)
+
+    mobile_ts = datetime.datetime.fromisoformat(mobile_last_modified_at_str).date() if mobile_last_modified_at_str else datetime.date.min
+    server_ts = _fecha_servidor(registro.updated_at)
+    fecha_servidor = server_ts.date() if isinstance(server_ts, datetime.datetime) else server_ts
+
+    if mobile_ts <= fecha_servidor:
+        return {
+            "new_last_modified_at": server_ts.isoformat(),
+            "status": "success",
+            "conflict_resolved": "skipped_older_mobile_version"
+        }
+
+    for clave, valor in datos.items():
+        if clave in entidad.columnas:
+            setattr(registro, clave, _valor_update(entidad, clave, valor))
+    registro.updated_at = entidad.marca_de_tiempo(ahora)
+    return {
+        "new_last_modified_at": registro.updated_at.isoformat(),
+        "status": "success",
+        "conflict_resolved": "LWW"
+    }
+
+
+def bulk_update(entidad, items, resultados, ids_locales=None):
+    """
+    Aplica los registros 'updated' de una tabla y agrega a `resultados`, en orden, el
+    resultado de cada item. Los registros se cargan con un IN por lote (load_by_ids) y se
+    aplican por lotes de SYNC_UPDATE_CHUNK_ROWS, cada uno en un SAVEPOINT con un solo flush;
+    si un lote falla se deshace y se reintenta item por item, así el error se reporta solo en
+    los registros que lo causan.
+
+    Args:
+        entidad (SyncEntity): Tabla (ver app/sync/entities.py).
+        items (list[dict]): Registros 'updated' del móvil.
+        resultados (list): sync_results[seccion]['updated'].
+        ids_locales (dict, optional): {seccion: {str(local_id): remote_id}} del lote, para
+            resolver <fk>_local_id.
+    """
+    ahora = datetime.datetime.now()
+    tamano_lote = current_app.config.get('SYNC_UPDATE_CHUNK_ROWS', UPDATE_CHUNK_ROWS)
+    registros = load_by_ids(entidad.modelo, items)
+
+    pendientes = []
+    for item in items:
+        local_id = item.pop('id')
+        remote_id = item.pop('remote_id', None)
+        item.pop('is_synced', None)
+        item.pop('deleted_at', None)
+        if not remote_id:
+            resultados.append({"local_id": local_id, "status": "failed", "error": entidad.error_update_sin_remote_id})
+            continue
+        registro = registros.get(remote_key(remote_id))
+        if not registro:
+            resultados.append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server"})
+            continue
+        resultados.append(None)  # Se completa después del flush, conservando el orden
+        pendientes.append((len(resultados) - 1, local_id, remote_id, registro, item))
+
+    def aplicar(lote):
+        # Los errores de la base se reportan al hacer flush dentro del SAVEPOINT
+        with db.session.begin_nested():
+            parciales = [_actualizar(entidad, registro, item, ids_locales, ahora) for _, _, _, registro, item in lote]
+            db.session.flush()
+        return parciales
+
+    for inicio in range(0, len(pendientes), tamano_lote):
+        lote = pendientes[inicio:inicio + tamano_lote]
+        try:
+            parciales = aplicar(lote)
+        except Exception:
+            # El rollback del SAVEPOINT también revierte los atributos modificados del lote
+            parciales = []
+            for entrada in lote:
+                try:
+                    parciales.extend(aplicar([entrada]))
+                except Exception as e:
+                    parciales.append({"status": "failed", "error": str(e)})
+
+        for (posicion, local_id, remote_id, _, _), parcial in zip(lote, parciales):
+            resultados[posicion] = {"local_id": local_id, "remote_id": remote_id, **parcial}
+
+
+def bulk_soft_delete(entidad, items, resultados, valores):
+    """
+    Aplica el borrado lógico de los registros 'deleted' de una tabla con un UPDATE ... WHERE
+    id IN (...) por lote y agrega a `resultados`, en orden, el mismo resultado por item que
+    el borrado registro a registro.
+
+    Args:
+        entidad (SyncEntity): Tabla (ver app/sync/entities.py).
+        items (list[dict]): Registros 'deleted' del móvil.
+        resultados (list): sync_results[seccion]['deleted'].
+        valores (dict): Columnas del borrado lógico (entidad.borrado_logico); las que el
+            modelo no tiene se ignoran. Debe incluir updated_at.
+    """
+    modelo = entidad.modelo
+    valores_update = {columna: valor for columna, valor in valores.items() if columna in entidad.columnas}
+    nuevo_last_modified_at = valores['updated_at'].isoformat()
+
+    pendientes = []
+    for item in items:
+        local_id = item.pop('id')
+        remote_id = item.pop('remote_id', None)
+        if not remote_id:
+            resultados.append({"local_id": local_id, "status": "failed", "error": entidad.error_delete_sin_remote_id})
+            continue
+        resultados.append(None)  # Se completa después del UPDATE, conservando el orden
+        pendientes.append((len(resultados) - 1, local_id, remote_id))
+    if not pendientes:
+        return
+
+    existentes = {registro_id for registro_id, in _por_ids(
+        db.session.query(modelo.id), modelo, [remote_key(remote_id) for _, _, remote_id in pendientes]
+    )}
+
+    encontrados = []
+    for posicion, local_id, remote_id in pendientes:
+        if remote_key(remote_id) in existentes:
+            encontrados.append((posicion, local_id, remote_id))
+        else:
+            resultados[posicion] = {"local_id": local_id, "remote_id": remote_id, "status": "failed",
+                                    "error": "Record not found on server for deletion"}
+
+    for inicio in range(0, len(encontrados), IN_CHUNK_IDS):
+        lote = encontrados[inicio:inicio + IN_CHUNK_IDS]
+        error = None
+        try:
+            with db.session.begin_nested():
+                db.session.execute(
+                    update(modelo)
+                    .where(modelo.id.in_({remote_key(remote_id) for _, _, remote_id in lote}))
+                    .values(**valores_update)
+                )
+        except Exception as e:
+            error = str(e)
+
+        for posicion, local_id, remote_id in lote:
+            if error:
+                resultados[posicion] = {"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": error}
+            else:
+                resultados[posicion] = {
+                    "local_id": local_id,
+                    "remote_id": remote_id,
+                    "status": "success",
+                    "action": "soft_deleted",
+                    "new_last_modified_at": nuevo_last_modified_at
+                }
+
+
+@contextmanager
+def _contar(seccion, accion, resultados):
+    # Suma a los contadores los items agregados a `resultados` y el tiempo del bloque
+    desde = len(resultados)
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        nuevos = resultados[desde:]
+        if nuevos:
+            fallidos = sum(1 for resultado in nuevos if resultado and resultado.get('status') == 'failed')
+            with _contadores_lock:
+                contador = _contadores.setdefault((seccion, accion), [0, 0, 0.0])
+                contador[0] += len(nuevos)
+                contador[1] += fallidos
+                contador[2] += segundos
+
+
+def throughput_stats():
+    """
+    Contadores de POST /changes del proceso desde su inicio, por sección y acción.
+
+    Returns:
+        dict: {seccion: {accion: {"items", "failed", "seconds", "items_per_second"}}}.
+    """
+    with _contadores_lock:
+        copia = {clave: list(valores) for clave, valores in _contadores.items()}
+    estadisticas = {}
+    for (seccion, accion), (items, fallidos, segundos) in sorted(copia.items()):
+        estadisticas.setdefault(seccion, {})[accion] = {
+            "items": items,
+            "failed": fallidos,
+            "seconds": round(segundos, 3),
+            "items_per_second": round(items / segundos, 1) if segundos else None
+        }
+    return estadisticas
+
+
+def _resultados_vacios():
+    return {entidad.seccion: {accion: [] for accion in ACCIONES} for entidad in ENTIDADES}
+
+
+def _aplicar(entidad, accion, items, sync_results, user, ids_locales):
+    # Aplica los items de una sección y acción, sumando a los contadores
+    resultados = sync_results[entidad.seccion][accion]
+    with _contar(entidad.seccion, accion, resultados):
+        if accion == 'created':
+            bulk_create(entidad, items, resultados, ids_locales=ids_locales)
+        elif accion == 'updated':
+            bulk_update(entidad, items, resultados, ids_locales=ids_locales)
+        else:
+            bulk_soft_delete(entidad, items, resultados, entidad.borrado_logico(user, datetime.datetime.now()))
+
+
+def process_changes(changes, user):
+    """
+    Aplica en la sesión los cambios enviados por el móvil (created/updated/deleted por tabla)
+    sin hacer commit. Lo usan POST /changes y los trabajos asíncronos (app/sync/jobs.py).
+
+    Las secciones se procesan en orden de dependencia (ORDEN_ENTIDADES: familias -> visitas
+    -> personas -> ...), así los registros pueden referenciar a padres creados en el mismo
+    lote con <fk>_local_id.
+
+    Args:
+        changes (dict): Cuerpo de POST /changes.
+        user (User): Usuario que sincroniza.
+
+    Returns:
+        dict: sync_results, con el resultado de cada registro por sección y acción.
+    """
+    sync_results = _resultados_vacios()
+    # remote_id de los registros creados en este lote, por sección y local_id
+    ids_locales = {}
+
+    for entidad in ORDEN_ENTIDADES:
+        cambios = changes.get(entidad.seccion)
+        if not cambios:
+            continue
+        for accion in ACCIONES:
+            items = cambios.get(accion) or []
+            if items:
+                _aplicar(entidad, accion, items, sync_results, user, ids_locales)
+
+    return sync_results
+
+
+def _espera_padre(entidad, item, vistas, diferidas):
+    # El item referencia con <fk>_local_id a una sección que todavía no se aplicó
+    return any(
+        item.get(clave_local) is not None and (seccion_padre not in vistas or seccion_padre in diferidas)
+        for _, clave_local, seccion_padre in entidad.referencias
+    )
+
+
+def process_change_stream(items, user):
+    """
+    Como process_changes, pero con los items a medida que se leen del cuerpo
+    (stream_parser.iter_change_items): se acumulan hasta SYNC_STREAM_BUFFER_ITEMS por sección
+    y acción y se aplican, así la memoria no depende del tamaño del cuerpo.
+
+    Los items se aplican en el orden del documento. Si un item referencia con <fk>_local_id a
+    una sección que todavía no llegó (o cuyos 'created' también esperan), ese item y los
+    siguientes de su sección y acción se guardan en un archivo temporal y se aplican al final,
+    en ORDEN_ENTIDADES; el resultado es el mismo que con process_changes. Lo mismo pasa con
+    los 'deleted' de una sección cuyos 'updated' no llegaron antes (las claves de un objeto
+    JSON no tienen orden): process_changes aplica siempre los 'updated' primero.
+
+    Args:
+        items (iterable[tuple]): (seccion, accion, item). Secciones y acciones desconocidas
+            se ignoran.
+        user (User): Usuario que sincroniza.
+
+    Returns:
+        dict: sync_results, como process_changes.
+    """
+    tamano_buffer = current_app.config.get('SYNC_STREAM_BUFFER_ITEMS', STREAM_BUFFER_ITEMS)
+    sync_results = _resultados_vacios()
+    ids_locales = {}
+
+    # Secciones recibidas, secciones con 'created' en espera, items en espera por (entidad, accion)
+    # y secciones de las que ya llegaron 'updated'
+    vistas, diferidas, en_espera, con_updated = set(), set(), {}, set()
+    pendientes, actual = [], None
+    try:
+        for seccion, accion, item in items:
+            entidad = ENTIDADES_POR_SECCION.get(seccion)
+            if entidad is None or accion not in ACCIONES:
+                continue
+            if pendientes and ((entidad, accion) != actual or len(pendientes) >= tamano_buffer):
+                _aplicar(*actual, pendientes, sync_results, user, ids_locales)
+                pendientes = []
+            actual = (entidad, accion)
+            vistas.add(seccion)
+            if accion == 'updated':
+                con_updated.add(seccion)
+
+            # Un 'deleted' no se adelanta a los 'updated' de su sección (pueden ser del mismo registro)
+            espera_updated = accion == 'deleted' and (seccion not in con_updated or (entidad, 'updated') in en_espera)
+            if actual in en_espera or espera_updated or _espera_padre(entidad, item, vistas, diferidas):
+                if actual not in en_espera:
+                    en_espera[actual] = ItemSpool()
+                en_espera[actual].append(item)
+                if accion == 'created':
+                    diferidas.add(seccion)
+                continue
+            pendientes.append(item)
+        if pendientes:
+            _aplicar(*actual, pendientes, sync_results, user, ids_locales)
+
+        for entidad in ORDEN_ENTIDADES:
+            for accion in ACCIONES:
+                if (entidad, accion) not in en_espera:
+                    continue
+                pendientes = []
+                for item in en_espera[(entidad, accion)]:
+                    pendientes.append(item)
+                    if len(pendientes) >= tamano_buffer:
+                        _aplicar(entidad, accion, pendientes, sync_results, user, ids_locales)
+                        pendientes = []
+                if pendientes:
+                    _aplicar(entidad, accion, pendientes, sync_results, user, ids_locales)
+    finally:
+        for espera in en_espera.values():
+            espera.close()
+
+    return sync_results
+
+
+def commit_changes(sync_results):
+    """
+    Commit final de todos los cambios de la sesión. La tabla de lectura de visitas vigentes
+    y las versiones de los territorios tocados (ETag de initial-data) se actualizan en la
+    misma transacción. Si falla, el llamador debe hacer rollback.
+    """
+    refresh_visitas_vigentes(familias_afectadas(sync_results))
+    bump_territory_versions(sync_results)
+    db.session.commit()
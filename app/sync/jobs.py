@@ -0,0 +1,302 @@
+# app/sync/jobs.py
+# Trabajos asíncronos de POST /changes.
+#
+# Con cargas grandes (p. ej. un dispositivo que estuvo una semana sin conexión) el cliente puede
+# pedir el procesamiento asíncrono: el cuerpo se guarda en disco, se responde 202 con el ID del
+# trabajo y un pool de hilos del proceso lo aplica. El estado (y al terminar los sync_results)
+# queda en un archivo JSON por trabajo que consulta GET /jobs/<id>. No necesita servicios
+# externos: basta con que todos los procesos de la aplicación compartan SYNC_JOBS_DIR.
+#
+# Un trabajo en cola es un <id>.body. Para tomarlo, un worker lo renombra a
+# <id>.running.<pid>-<token> (os.rename es atómico: solo un hilo o proceso lo consigue) y mientras
+# lo aplica toca el archivo cada SYNC_JOB_LEASE / 3 segundos. Si el worker muere, el archivo deja
+# de tocarse y pasado SYNC_JOB_LEASE pending_jobs(incluir_en_proceso=True) lo devuelve a la cola.
+#
+# El lease solo evita trabajo repetido: un worker que se detuvo más que el lease (y cuyo trabajo
+# ya retomó otro) todavía puede llegar al commit. Por eso cada trabajo tiene un lote en sync_batch
+# y el commit se condiciona a marcarlo como terminado en la misma transacción (finish_batch):
+# solo uno de los dos confirma los cambios.
+import datetime
+import glob
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app.models import db, User, SyncBatch
+from app.sync.serialization import MSGPACK_MIMETYPES, unpackb
+from app.sync.idempotency import idempotency_available, claim_batch, attach_job, finish_batch, release_batch, \
+                                 LOTE_TERMINADO
+from app.sync.ingest import process_changes, process_change_stream, commit_changes
+from app.sync.stream_parser import iter_change_items, MAX_ITEM_BYTES
+
+ESTADO_EN_COLA = 'queued'
+ESTADO_EN_PROCESO = 'running'
+ESTADO_TERMINADO = 'done'
+ESTADO_FALLIDO = 'failed'
+
+_JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+# Pool compartido por el proceso (se recrea si cambia SYNC_JOB_WORKERS)
+_executor = None
+_executor_workers = None
+_executor_lock = threading.Lock()
+
+
+def jobs_dir():
+    """Directorio de los trabajos (SYNC_JOBS_DIR o <instance>/sync_jobs)."""
+    return current_app.config.get('SYNC_JOBS_DIR') or os.path.join(current_app.instance_path, 'sync_jobs')
+
+
+def _ruta(job_id, extension):
+    return os.path.join(jobs_dir(), f"{job_id}.{extension}")
+
+
+def _tomar(job_id):
+    """
+    Toma un trabajo en cola renombrando su cuerpo.
+
+    Returns:
+        str | None: Ruta del cuerpo tomado, o None si otro worker lo tomó antes (o no existe).
+    """
+    en_proceso = _ruta(job_id, f"running.{os.getpid()}-{uuid.uuid4().hex[:8]}")
+    try:
+        os.rename(_ruta(job_id, 'body'), en_proceso)
+    except FileNotFoundError:
+        return None
+    return en_proceso
+
+
+def _latido(en_proceso, intervalo, detener):
+    # Renueva el lease (mtime del cuerpo tomado) hasta que termina el trabajo o se pierde el archivo
+    while not detener.wait(intervalo):
+        try:
+            os.utime(en_proceso)
+        except FileNotFoundError:
+            return
+
+
+def _devolver_vencidos(job_id, lease):
+    """
+    Devuelve a la cola un trabajo cuyo worker dejó de renovar el lease hace más de `lease`
+    segundos. Indica si lo devolvió.
+    """
+    limite = time.time() - lease
+    for en_proceso in glob.glob(_ruta(job_id, 'running.*')):
+        try:
+            if os.path.getmtime(en_proceso) >= limite:
+                continue
+            # Atómico también entre procesos: si dos lo intentan, solo uno encuentra el archivo
+            os.rename(en_proceso, _ruta(job_id, 'body'))
+        except FileNotFoundError:
+            continue
+        return True
+    return False
+
+
+def _escribir_estado(estado):
+    # Archivo temporal + os.replace: los lectores nunca ven un estado a medias
+    ruta = _ruta(estado['job_id'], 'json')
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(estado, archivo, ensure_ascii=False)
+    os.replace(temporal, ruta)
+
+
+def read_job(job_id):
+    """
+    Lee el estado de un trabajo.
+
+    Returns:
+        dict | None: Estado guardado, o None si el ID no es válido o no existe.
+    """
+    if not _JOB_ID.match(job_id or ''):
+        return None
+    try:
+        with open(_ruta(job_id, 'json'), encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except (OSError, ValueError):
+        return None
+
+
+def count_change_items(changes):
+    """Cantidad de registros (created + updated + deleted de todas las tablas) de un cuerpo de POST /changes."""
+    return sum(
+        len(acciones.get(accion) or [])
+        for acciones in changes.values() if isinstance(acciones, dict)
+        for accion in ('created', 'updated', 'deleted')
+    )
+
+
+def _get_executor(workers):
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sync-job')
+            _executor_workers = workers
+        return _executor
+
+
+def submit_changes_job(datos, mimetype, user, items, lote_id=None):
+    """
+    Guarda el cuerpo de un POST /changes y lo encola en el pool de trabajos del proceso.
+
+    Args:
+        datos (bytes | file): Cuerpo tal como llegó (JSON o msgpack), o un archivo binario
+            con él (stream_parser.spool_body).
+        mimetype (str): Content-Type del cuerpo.
+        user (User): Usuario que sincroniza.
+        items (int): Cantidad de registros del cuerpo (informativo).
+        lote_id (int, optional): Lote idempotente (sync_batch) que procesa el trabajo. Si no se
+            indica y existen las tablas de idempotencia se registra uno interno (clave
+            job:<id>), que es el que decide qué worker confirma los cambios.
+
+    Returns:
+        dict: Estado inicial del trabajo.
+    """
+    job_id = uuid.uuid4().hex
+    if lote_id is None and idempotency_available():
+        # La clave es interna y nunca se reenvía: el job_id hace de huella del cuerpo
+        lote_id, _ = claim_batch(user, f"job:{job_id}", job_id)
+    os.makedirs(jobs_dir(), exist_ok=True)
+    with open(_ruta(job_id, 'body'), 'wb') as archivo:
+        if isinstance(datos, bytes):
+            archivo.write(datos)
+        else:
+            shutil.copyfileobj(datos, archivo)
+
+    estado = {
+        "job_id": job_id,
+        "status": ESTADO_EN_COLA,
+        "user_id": user.id,
+        "mimetype": mimetype,
+        "items": items,
+        "lote_id": lote_id,
+        "created_at": datetime.datetime.now().isoformat()
+    }
+    _escribir_estado(estado)
+    if lote_id:
+        attach_job(lote_id, job_id)
+
+    app = current_app._get_current_object()
+    _get_executor(current_app.config.get('SYNC_JOB_WORKERS', 2)).submit(_run_in_app, app, job_id)
+    return estado
+
+
+def _run_in_app(app, job_id):
+    with app.app_context():
+        run_changes_job(job_id)
+
+
+def run_changes_job(job_id):
+    """
+    Aplica un trabajo encolado con process_changes y guarda sus sync_results (o el error).
+    Los trabajos que no están en cola (ya tomados por otro hilo o proceso) se ignoran.
+
+    Los cambios se confirman solo si finish_batch marca el lote del trabajo en la misma
+    transacción; si otro worker ya lo confirmó se descartan y el estado toma los sync_results
+    guardados en el lote. Sin lote (no existen las tablas de idempotencia) solo queda la
+    verificación del lease antes del commit, que no cubre a un worker detenido justo entre
+    esa verificación y el commit.
+    """
+    en_proceso = _tomar(job_id)
+    if not en_proceso:
+        return
+    estado = read_job(job_id)
+    if not estado:
+        os.remove(en_proceso)
+        return
+    estado.update(status=ESTADO_EN_PROCESO, started_at=datetime.datetime.now().isoformat(), worker=os.getpid())
+    _escribir_estado(estado)
+
+    detener = threading.Event()
+    lease = current_app.config.get('SYNC_JOB_LEASE', 300)
+    threading.Thread(target=_latido, args=(en_proceso, lease / 3, detener), daemon=True,
+                     name=f"sync-job-lease-{job_id[:8]}").start()
+    try:
+        user = db.session.get(User, estado['user_id'])
+        if not user:
+            raise LookupError("Usuario no encontrado para sincronización")
+
+        # Los cuerpos JSON se aplican a medida que se leen del archivo (ver stream_parser)
+        with open(en_proceso, 'rb') as archivo:
+            if estado['mimetype'] in MSGPACK_MIMETYPES:
+                sync_results = process_changes(unpackb(archivo.read()), user)
+            else:
+                max_item_bytes = current_app.config.get('SYNC_STREAM_MAX_ITEM_BYTES', MAX_ITEM_BYTES)
+                sync_results = process_change_stream(iter_change_items(archivo, max_item_bytes=max_item_bytes), user)
+        if not os.path.exists(en_proceso):
+            # El lease venció y el trabajo volvió a la cola: lo confirma quien lo tomó después
+            db.session.rollback()
+            return
+        if estado.get('lote_id') and not finish_batch(estado['lote_id'], sync_results, job_id):
+            # Otro worker confirmó el lote: se responde con lo que él guardó
+            db.session.rollback()
+            lote = db.session.get(SyncBatch, estado['lote_id'])
+            if lote is None or lote.status != LOTE_TERMINADO:
+                raise RuntimeError(f"El lote {estado['lote_id']} del trabajo ya no está en proceso")
+            sync_results = json.loads(lote.sync_results)
+        else:
+            commit_changes(sync_results)
+    except Exception as e:
+        db.session.rollback()
+        if estado.get('lote_id'):
+            release_batch(estado['lote_id'])
+        estado.update(status=ESTADO_FALLIDO, error=str(e))
+    else:
+        estado.update(status=ESTADO_TERMINADO, sync_results=sync_results)
+    finally:
+        detener.set()
+        db.session.remove()
+
+    estado["finished_at"] = datetime.datetime.now().isoformat()
+    _escribir_estado(estado)
+    try:
+        os.remove(en_proceso)
+    except FileNotFoundError:
+        pass
+
+
+def pending_jobs(incluir_en_proceso=False):
+    """
+    IDs de los trabajos en cola (p. ej. los que quedaron sin procesar al reiniciar el proceso),
+    del más antiguo al más nuevo.
+
+    Args:
+        incluir_en_proceso (bool): Incluir también los tomados cuyo worker no renueva el lease
+            hace más de SYNC_JOB_LEASE segundos (interrumpidos a mitad de camino); se vuelven
+            a poner en cola. Los que siguen renovándolo no se tocan.
+    """
+    lease = current_app.config.get('SYNC_JOB_LEASE', 300)
+    trabajos = []
+    for ruta in glob.glob(os.path.join(jobs_dir(), "*.json")):
+        estado = read_job(os.path.basename(ruta)[:-len(".json")])
+        if not estado or estado['status'] not in (ESTADO_EN_COLA, ESTADO_EN_PROCESO):
+            continue
+        if incluir_en_proceso and _devolver_vencidos(estado['job_id'], lease):
+            estado['status'] = ESTADO_EN_COLA
+            _escribir_estado(estado)
+        if os.path.exists(_ruta(estado['job_id'], 'body')):
+            trabajos.append((estado['created_at'], estado['job_id']))
+    return [job_id for _, job_id in sorted(trabajos)]
+
+
+def remove_finished_jobs(max_age):
+    """Borra los trabajos terminados o fallidos hace más de `max_age` segundos. Devuelve cuántos borró."""
+    borrados = 0
+    limite = time.time() - max_age
+    for ruta in glob.glob(os.path.join(jobs_dir(), "*.json")):
+        estado = read_job(os.path.basename(ruta)[:-len(".json")])
+        if estado and estado['status'] in (ESTADO_TERMINADO, ESTADO_FALLIDO) and os.path.getmtime(ruta) < limite:
+            # Cuerpo tomado que quedó si el worker murió justo después de guardar el resultado
+            for en_proceso in glob.glob(_ruta(estado['job_id'], 'running.*')):
+                os.remove(en_proceso)
+            os.remove(ruta)
+            borrados += 1
+    return borrados
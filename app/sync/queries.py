@@ -0,0 +1,586 @@
+# app/sync/queries.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app.models import db, User, ApsFichaFamilia, ApsPersona, ApsVisita, ApsUbicacionFamilia, ApsCondicionesHabitatFamilia, \
+                       ApsPersonaAntecedenteMedico, ApsPersonaComponenteMental, ApsPersonaCondicionesSalud, \
+                       ApsPersonaDatoBasico, ApsPersonaEstilosVidaConducta, ApsPersonaMaternidad, \
+                       ApsPersonaPracticasSaludSaludSexual, ApsFamiliaVisitaVigente
+from sqlalchemy import func, select, union, or_, DateTime
+from app.sync.catalog_cache import CATALOGOS
+from app.sync.visitas_vigentes import visitas_vigentes_disponible
+from app.sync.territory_versions import territory_versions_available, territory_version_select
+
+# Tablas de detalle de persona que participan en la sincronización incremental
+MODELOS_DETALLE_PERSONA = (
+    ApsPersonaAntecedenteMedico, ApsPersonaComponenteMental, ApsPersonaCondicionesSalud,
+    ApsPersonaDatoBasico, ApsPersonaEstilosVidaConducta, ApsPersonaMaternidad,
+    ApsPersonaPracticasSaludSaludSexual
+)
+
+
+def territory_visit_ids_select(user_comuna_ids):
+    """
+    Construye el SELECT (sin ejecutarlo) de los IDs de visitas cuya ubicación
+    pertenece a alguna de las comunas asignadas al usuario.
+
+    Args:
+        user_comuna_ids (list[int]): IDs de base_comuna_corregimiento del territorio del usuario.
+
+    Returns:
+        Select: Sentencia reutilizable como subconsulta en filtros IN.
+    """
+    return select(ApsUbicacionFamilia.aps_visita_id).where(
+        ApsUbicacionFamilia.base_comuna_corregimiento_id.in_(user_comuna_ids)
+    )
+
+
+def _latest_visit_criteria(user_comuna_ids, max_visita_id=None, familias_filtro=None):
+    """
+    Criterios WHERE (sobre ApsVisita unida a ApsFichaFamilia) que definen las visitas
+    candidatas a "última visita" de una familia válida del territorio.
+
+    Una familia es válida si tiene apellido_familiar (no NULL, no vacío, no 'NULL') y al
+    menos una persona con apellidos válidos registrada en una visita activa
+    (estado_ficha == 800) del territorio.
+
+    Args:
+        user_comuna_ids (list[int]): IDs de base_comuna_corregimiento del territorio del usuario.
+        max_visita_id (int, optional): Si se indica, ignora visitas creadas después de ese ID
+            (snapshot de una descarga paginada por cursor).
+        familias_filtro (Select, optional): SELECT de IDs de familia al que se restringe el
+            resultado (p. ej. las familias con cambios, ver families_changed_since).
+
+    Returns:
+        list: Expresiones para usar en .where(*criterios).
+    """
+    visitas_territorio = territory_visit_ids_select(user_comuna_ids)
+
+    visitas_activas_territorio = select(ApsVisita.id).where(
+        ApsVisita.id.in_(visitas_territorio),
+        ApsVisita.estado_ficha == 800  # Solo fichas con estado 'Activa'
+    )
+
+    familias_con_personas = select(ApsPersona.aps_ficha_familia_id).where(
+        ApsPersona.aps_visita_id.in_(visitas_activas_territorio),
+        ApsPersona.apellidos != 'NULL'  # No string 'NULL'
+    )
+
+    criterios = [
+        ApsVisita.id.in_(visitas_territorio),
+        ApsVisita.estado_ficha == 800,
+        ApsFichaFamilia.apellido_familiar.isnot(None),  # No NULL
+        ApsFichaFamilia.apellido_familiar != '',        # No vacío
+        ApsFichaFamilia.apellido_familiar != 'NULL',    # No string 'NULL'
+        ApsFichaFamilia.id.in_(familias_con_personas)
+    ]
+    if max_visita_id is not None:
+        criterios.append(ApsVisita.id <= max_visita_id)
+    if familias_filtro is not None:
+        criterios.append(ApsVisita.aps_ficha_familia_id.in_(familias_filtro))
+    return criterios
+
+
+def _usar_tabla_lectura(max_visita_id=None):
+    # Con el snapshot de un cursor (max_visita_id) la tabla de lectura, que solo guarda la
+    # visita vigente, equivale al cálculo con `id <= max_visita_id` mientras no se hayan creado
+    # visitas después del snapshot; si se crearon, se calcula sobre las tablas base para no
+    # mover familias entre páginas
+    if not visitas_vigentes_disponible():
+        return False
+    if max_visita_id is None:
+        return True
+    return (db.session.query(func.max(ApsVisita.id)).scalar() or 0) <= max_visita_id
+
+
+def latest_visits_subquery(user_comuna_ids, max_visita_id=None, familias_subquery=None, familias_filtro=None):
+    """
+    Resuelve en una sola sentencia SQL el pipeline territorio -> familias válidas ->
+    última visita por familia.
+
+    De las visitas activas del territorio de cada familia válida se conserva la de mayor
+    fecha_visita; los empates se resuelven por el ID más bajo.
+
+    Si la tabla de lectura aps_familia_visita_vigente está disponible se usa en su lugar
+    (ver _latest_visits_from_read_table y _usar_tabla_lectura); lo mismo hacen
+    count_latest_visits y latest_visits_after.
+
+    Args:
+        user_comuna_ids (list[int]): IDs de base_comuna_corregimiento del territorio del usuario.
+        max_visita_id (int, optional): Límite superior de ID de visita (snapshot).
+        familias_subquery (Subquery, optional): Tabla derivada con columna aps_ficha_familia_id
+            que restringe las familias a rankear (p. ej. la página de un cursor).
+        familias_filtro (Select, optional): SELECT de IDs de familia permitidas.
+
+    Returns:
+        Subquery: Columnas aps_visita_id, aps_ficha_familia_id y fecha_visita, una fila por familia.
+    """
+    if _usar_tabla_lectura(max_visita_id):
+        return _latest_visits_from_read_table(user_comuna_ids, familias_subquery, familias_filtro)
+
+    ranked = select(
+        ApsVisita.id.label('aps_visita_id'),
+        ApsVisita.aps_ficha_familia_id,
+        ApsVisita.fecha_visita,
+        func.row_number().over(
+            partition_by=ApsVisita.aps_ficha_familia_id,
+            order_by=(ApsVisita.fecha_visita.desc(), ApsVisita.id.asc())
+        ).label('rn')
+    ).join(
+        ApsFichaFamilia, ApsVisita.aps_ficha_familia_id == ApsFichaFamilia.id
+    )
+    if familias_subquery is not None:
+        ranked = ranked.join(
+            familias_subquery,
+            ApsVisita.aps_ficha_familia_id == familias_subquery.c.aps_ficha_familia_id
+        )
+    ranked = ranked.where(*_latest_visit_criteria(user_comuna_ids, max_visita_id, familias_filtro)).subquery()
+
+    return select(
+        ranked.c.aps_visita_id,
+        ranked.c.aps_ficha_familia_id,
+        ranked.c.fecha_visita
+    ).where(ranked.c.rn == 1).subquery()
+
+
+def latest_visits_page(user_comuna_ids, page, per_page, pages=1):
+    """
+    Obtiene una página de "última visita por familia" del territorio, ordenada por familia,
+    junto con el total de familias (COUNT(*) OVER ()) en la misma consulta.
+
+    Args:
+        user_comuna_ids (list[int]): IDs de comunas del territorio del usuario.
+        page (int): Número de página (base 1).
+        per_page (int): Tamaño de página.
+        pages (int): Páginas consecutivas a traer desde `page` (descarga por lotes).
+
+    Returns:
+        tuple: (filas, total). Cada fila expone aps_visita_id, aps_ficha_familia_id y fecha_visita.
+    """
+    latest = latest_visits_subquery(user_comuna_ids)
+
+    rows = db.session.query(
+        latest.c.aps_visita_id,
+        latest.c.aps_ficha_familia_id,
+        latest.c.fecha_visita,
+        func.count().over().label('total')
+    ).order_by(
+        latest.c.aps_ficha_familia_id
+    ).limit(per_page * pages).offset(max(page - 1, 0) * per_page).all()
+
+    if rows:
+        return rows, rows[0].total
+
+    # Página fuera de rango (o territorio vacío): el total se obtiene aparte
+    total = count_latest_visits(user_comuna_ids) if page > 1 else 0
+    return rows, total
+
+
+def count_latest_visits(user_comuna_ids, max_visita_id=None, familias_filtro=None):
+    """
+    Cuenta las familias válidas del territorio (una "última visita" por familia).
+
+    Args:
+        user_comuna_ids (list[int]): IDs de comunas del territorio del usuario.
+        max_visita_id (int, optional): Límite superior de ID de visita (snapshot).
+        familias_filtro (Select, optional): SELECT de IDs de familia permitidas.
+
+    Returns:
+        int: Total de familias válidas.
+    """
+    if _usar_tabla_lectura(max_visita_id):
+        return db.session.query(func.count()).select_from(
+            _latest_visits_from_read_table(user_comuna_ids, familias_filtro=familias_filtro)
+        ).scalar() or 0
+
+    return db.session.query(
+        func.count(func.distinct(ApsVisita.aps_ficha_familia_id))
+    ).join(
+        ApsFichaFamilia, ApsVisita.aps_ficha_familia_id == ApsFichaFamilia.id
+    ).filter(
+        *_latest_visit_criteria(user_comuna_ids, max_visita_id, familias_filtro)
+    ).scalar() or 0
+
+
+def latest_visits_after(user_comuna_ids, after_familia_id, limit, max_visita_id=None, familias_filtro=None):
+    """
+    Paginación por cursor (keyset): devuelve la última visita de las siguientes `limit`
+    familias válidas con aps_ficha_familia_id mayor que `after_familia_id`.
+
+    Las familias de la página se eligen primero en una tabla derivada con
+    ORDER BY familia LIMIT n (acotada por el índice de aps_ficha_familia_id) y solo sobre
+    ellas se calcula el ROW_NUMBER(), por lo que el costo no crece con el número de página.
+
+    Args:
+        user_comuna_ids (list[int]): IDs de comunas del territorio del usuario.
+        after_familia_id (int or None): Última familia entregada (None para la primera página).
+        limit (int): Número máximo de familias a devolver.
+        max_visita_id (int, optional): Límite superior de ID de visita (snapshot del cursor).
+        familias_filtro (Select, optional): SELECT de IDs de familia permitidas.
+
+    Returns:
+        list: Filas con aps_visita_id, aps_ficha_familia_id y fecha_visita ordenadas por familia.
+    """
+    if _usar_tabla_lectura(max_visita_id):
+        return _latest_visits_after_from_read_table(user_comuna_ids, after_familia_id, limit, familias_filtro)
+
+    familias_pagina = select(
+        ApsVisita.aps_ficha_familia_id
+    ).join(
+        ApsFichaFamilia, ApsVisita.aps_ficha_familia_id == ApsFichaFamilia.id
+    ).where(
+        *_latest_visit_criteria(user_comuna_ids, max_visita_id, familias_filtro)
+    )
+    if after_familia_id is not None:
+        familias_pagina = familias_pagina.where(ApsVisita.aps_ficha_familia_id > after_familia_id)
+    familias_pagina = familias_pagina.group_by(
+        ApsVisita.aps_ficha_familia_id
+    ).order_by(
+        ApsVisita.aps_ficha_familia_id
+    ).limit(limit).subquery()
+
+    latest = latest_visits_subquery(user_comuna_ids, max_visita_id, familias_pagina, familias_filtro)
+
+    return db.session.query(
+        latest.c.aps_visita_id,
+        latest.c.aps_ficha_familia_id,
+        latest.c.fecha_visita
+    ).order_by(latest.c.aps_ficha_familia_id).all()
+
+
+def _read_table_criteria(user_comuna_ids, familias_filtro=None):
+    criterios = [
+        ApsFamiliaVisitaVigente.base_comuna_corregimiento_id.in_(user_comuna_ids),
+        ApsFamiliaVisitaVigente.familia_valida == True
+    ]
+    if familias_filtro is not None:
+        criterios.append(ApsFamiliaVisitaVigente.aps_ficha_familia_id.in_(familias_filtro))
+    return criterios
+
+
+def _latest_visits_from_read_table(user_comuna_ids, familias_subquery=None, familias_filtro=None):
+    """
+    Variante de latest_visits_subquery que lee aps_familia_visita_vigente (una fila por familia
+    y comuna, ver app/sync/visitas_vigentes.py) en lugar de rankear todas las visitas del
+    territorio: solo queda elegir, entre las comunas del usuario, la visita más reciente de
+    cada familia con personas válidas.
+
+    No recibe max_visita_id: la tabla solo guarda la visita vigente, por eso con el snapshot
+    de un cursor solo se usa si no hay visitas posteriores a él (ver _usar_tabla_lectura).
+    """
+    vigente = ApsFamiliaVisitaVigente
+    ranked = select(
+        vigente.aps_visita_id,
+        vigente.aps_ficha_familia_id,
+        vigente.fecha_visita,
+        func.row_number().over(
+            partition_by=vigente.aps_ficha_familia_id,
+            order_by=(vigente.fecha_visita.desc(), vigente.aps_visita_id.asc())
+        ).label('rn'),
+        func.max(vigente.tiene_personas).over(
+            partition_by=vigente.aps_ficha_familia_id
+        ).label('tiene_personas')
+    )
+    if familias_subquery is not None:
+        ranked = ranked.join(
+            familias_subquery,
+            vigente.aps_ficha_familia_id == familias_subquery.c.aps_ficha_familia_id
+        )
+    ranked = ranked.where(*_read_table_criteria(user_comuna_ids, familias_filtro)).subquery()
+
+    return select(
+        ranked.c.aps_visita_id,
+        ranked.c.aps_ficha_familia_id,
+        ranked.c.fecha_visita
+    ).where(ranked.c.rn == 1, ranked.c.tiene_personas == True).subquery()
+
+
+def _latest_visits_after_from_read_table(user_comuna_ids, after_familia_id, limit, familias_filtro=None):
+    # Igual que latest_visits_after: primero las familias de la página, luego su visita vigente
+    vigente = ApsFamiliaVisitaVigente
+    familias_pagina = select(
+        vigente.aps_ficha_familia_id
+    ).where(
+        *_read_table_criteria(user_comuna_ids, familias_filtro)
+    )
+    if after_familia_id is not None:
+        familias_pagina = familias_pagina.where(vigente.aps_ficha_familia_id > after_familia_id)
+    familias_pagina = familias_pagina.group_by(
+        vigente.aps_ficha_familia_id
+    ).having(
+        func.max(vigente.tiene_personas) == True
+    ).order_by(
+        vigente.aps_ficha_familia_id
+    ).limit(limit).subquery()
+
+    latest = _latest_visits_from_read_table(user_comuna_ids, familias_pagina, familias_filtro)
+
+    return db.session.query(
+        latest.c.aps_visita_id,
+        latest.c.aps_ficha_familia_id,
+        latest.c.fecha_visita
+    ).order_by(latest.c.aps_ficha_familia_id).all()
+
+
+def latest_personas_for_families(familia_ids, columnas=None, max_visita_id=None):
+    """
+    Devuelve, para todas las familias indicadas y en una sola consulta, el registro más
+    reciente de cada persona (por numero_documento) según la fecha de su visita.
+
+    Usa ROW_NUMBER() OVER (PARTITION BY aps_ficha_familia_id, numero_documento
+    ORDER BY fecha_visita DESC, id DESC): si dos versiones comparten la fecha de visita
+    gana la de mayor ID, de modo que cada persona aparece exactamente una vez.
+
+    Args:
+        familia_ids (list[int]): IDs de aps_ficha_familia de la página actual.
+        columnas (list[Column], optional): Columnas de ApsPersona a leer. Si se indican se
+            devuelven filas livianas (tuplas con acceso por nombre) en lugar de entidades.
+        max_visita_id (int, optional): Ignora las versiones registradas en visitas creadas
+            después de ese ID (snapshot del cursor).
+
+    Returns:
+        list[ApsPersona] or list[Row]: Versiones vigentes de las personas de esas familias.
+    """
+    if not familia_ids:
+        return []
+
+    ranked = select(
+        ApsPersona.id,
+        func.row_number().over(
+            partition_by=(ApsPersona.aps_ficha_familia_id, ApsPersona.numero_documento),
+            order_by=(ApsVisita.fecha_visita.desc(), ApsPersona.id.desc())
+        ).label('rn')
+    ).join(
+        ApsVisita, ApsPersona.aps_visita_id == ApsVisita.id
+    ).where(
+        ApsPersona.aps_ficha_familia_id.in_(familia_ids),
+        ApsPersona.apellidos != 'NULL',  # Filtro de apellidos válidos
+        *([ApsVisita.id <= max_visita_id] if max_visita_id is not None else [])
+    ).subquery()
+
+    return db.session.query(*(columnas or [ApsPersona])).select_from(ApsPersona).join(
+        ranked, ApsPersona.id == ranked.c.id
+    ).filter(
+        ranked.c.rn == 1
+    ).all()
+
+
+def changed_since(columna, since):
+    """
+    Criterio "modificado desde `since`" para una columna updated_at.
+
+    La mayoría de tablas guardan updated_at como DATE, así que la comparación se hace por
+    día y es inclusiva: un registro modificado el mismo día del token se vuelve a enviar
+    (los upserts del cliente son idempotentes) en lugar de perderse.
+
+    Args:
+        columna (Column): Columna de fecha (DATE o DATETIME).
+        since (datetime): Token de la última sincronización del cliente.
+
+    Returns:
+        ColumnElement: Expresión booleana para usar en .where().
+    """
+    if isinstance(columna.type, DateTime):
+        return columna >= since
+    return columna >= since.date()
+
+
+def families_changed_since(since):
+    """
+    SELECT (sin ejecutar) de los IDs de familia con algún registro modificado desde `since`
+    en la ficha, sus visitas, personas, ubicaciones, condiciones de hábitat o tablas de
+    detalle de persona. Se usa como familias_filtro de las consultas de "última visita".
+
+    Args:
+        since (datetime): Token de la última sincronización del cliente.
+
+    Returns:
+        CompoundSelect: UNION de IDs de aps_ficha_familia.
+    """
+    selects = [
+        select(ApsFichaFamilia.id).where(changed_since(ApsFichaFamilia.updated_at, since)),
+        select(ApsVisita.aps_ficha_familia_id).where(changed_since(ApsVisita.updated_at, since)),
+        select(ApsPersona.aps_ficha_familia_id).where(changed_since(ApsPersona.updated_at, since)),
+        select(ApsVisita.aps_ficha_familia_id).join(
+            ApsUbicacionFamilia, ApsUbicacionFamilia.aps_visita_id == ApsVisita.id
+        ).where(changed_since(ApsUbicacionFamilia.updated_at, since)),
+        select(ApsCondicionesHabitatFamilia.aps_ficha_familia).where(
+            changed_since(ApsCondicionesHabitatFamilia.updated_at, since)
+        ),
+    ]
+    for modelo in MODELOS_DETALLE_PERSONA:
+        selects.append(
+            select(ApsPersona.aps_ficha_familia_id).join(
+                modelo, modelo.aps_persona_id == ApsPersona.id
+            ).where(changed_since(modelo.updated_at, since))
+        )
+    return union(*selects)
+
+
+def tombstones_since(user_comuna_ids, since):
+    """
+    Registros del territorio eliminados lógicamente desde `since`.
+
+    - visitas: valido = 0 (invalidadas), por invalidated_at o updated_at.
+    - personas: vigencia_registro = 0.
+
+    El resto de tablas no tiene columna de borrado lógico en el esquema actual.
+
+    Args:
+        user_comuna_ids (list[int]): IDs de comunas del territorio del usuario.
+        since (datetime): Token de la última sincronización del cliente.
+
+    Returns:
+        dict: {"visitas": [...], "personas": [...]} con id y aps_ficha_familia_id de cada registro.
+    """
+    visitas_territorio = territory_visit_ids_select(user_comuna_ids)
+
+    visitas = db.session.query(ApsVisita.id, ApsVisita.aps_ficha_familia_id).filter(
+        ApsVisita.id.in_(visitas_territorio),
+        ApsVisita.valido == False,  # tinyint(1) = 0
+        or_(
+            changed_since(ApsVisita.invalidated_at, since),
+            changed_since(ApsVisita.updated_at, since)
+        )
+    ).order_by(ApsVisita.id).all()
+
+    personas = db.session.query(ApsPersona.id, ApsPersona.aps_ficha_familia_id).filter(
+        ApsPersona.aps_visita_id.in_(visitas_territorio),
+        ApsPersona.vigencia_registro == False,  # tinyint(1) = 0
+        changed_since(ApsPersona.updated_at, since)
+    ).order_by(ApsPersona.id).all()
+
+    return {
+        "visitas": [{"id": v.id, "aps_ficha_familia_id": v.aps_ficha_familia_id} for v in visitas],
+        "personas": [{"id": p.id, "aps_ficha_familia_id": p.aps_ficha_familia_id} for p in personas]
+    }
+
+
+# {(url de la base, comunas): (huella, momento)} de territory_fingerprint(max_age > 0)
+_huellas = {}
+
+
+def territory_fingerprint(user_comuna_ids, max_age=0):
+    """
+    Huella barata de todo lo que puede cambiar una página de initial-data del territorio:
+    MAX(updated_at), COUNT(*) y MAX(id) de las tablas de sincronización filtradas por el
+    territorio, MAX(updated_at) de usuarios y MAX(id)/COUNT(*) de los catálogos de traducción.
+    Los agregados se resuelven en una sola sentencia de subconsultas escalares, sin leer filas.
+
+    Como casi todos los updated_at son DATE, dos cambios del mismo día no cambian los
+    agregados: por eso se agrega la suma de las versiones de las comunas del territorio, que
+    POST /changes incrementa al confirmar cada lote (ver app/sync/territory_versions.py). Las
+    escrituras hechas fuera de la API solo se detectan con resolución de día (o si cambian
+    COUNT/MAX(id)).
+
+    Args:
+        user_comuna_ids (list[int]): IDs de comunas del territorio del usuario.
+        max_age (int): Segundos durante los que se reutiliza una huella calculada antes en el
+            proceso (0 = calcularla siempre). Solo sirve para emitir ETags: para validar un
+            If-None-Match la huella tiene que ser actual.
+
+    Returns:
+        tuple or None: Valores de la huella (comparables y con repr estable); None si no existe
+            sync_territory_version (sin ella no se distinguen dos cambios del mismo día).
+    """
+    if not territory_versions_available():
+        return None
+
+    clave = (str(db.engine.url), tuple(sorted(user_comuna_ids)))
+    if max_age:
+        huella, calculada = _huellas.get(clave, (None, None))
+        if calculada is not None and time.monotonic() - calculada < max_age:
+            return huella
+
+    visitas_territorio = territory_visit_ids_select(user_comuna_ids)
+    familias_territorio = select(ApsVisita.aps_ficha_familia_id).where(ApsVisita.id.in_(visitas_territorio))
+    personas_territorio = select(ApsPersona.id).where(ApsPersona.aps_ficha_familia_id.in_(familias_territorio))
+
+    # (modelo, criterio de territorio) de cada tabla que aparece en la respuesta
+    tablas = [
+        (ApsFichaFamilia, ApsFichaFamilia.id.in_(familias_territorio)),
+        (ApsVisita, ApsVisita.id.in_(visitas_territorio)),
+        (ApsPersona, ApsPersona.aps_ficha_familia_id.in_(familias_territorio)),
+        (ApsUbicacionFamilia, ApsUbicacionFamilia.aps_visita_id.in_(visitas_territorio)),
+        (ApsCondicionesHabitatFamilia, ApsCondicionesHabitatFamilia.aps_visita_id.in_(visitas_territorio)),
+    ] + [
+        (modelo, modelo.aps_persona_id.in_(personas_territorio)) for modelo in MODELOS_DETALLE_PERSONA
+    ]
+
+    agregados = []
+    for modelo, criterio in tablas:
+        agregados.append(select(func.max(modelo.updated_at)).where(criterio).scalar_subquery())
+        agregados.append(select(func.count(modelo.id)).where(criterio).scalar_subquery())
+        agregados.append(select(func.max(modelo.id)).where(criterio).scalar_subquery())
+    # Las visitas eliminadas lógicamente se marcan con invalidated_at
+    agregados.append(select(func.max(ApsVisita.invalidated_at)).where(ApsVisita.id.in_(visitas_territorio)).scalar_subquery())
+    # Nombres y documentos de usuarios viajan en familias y visitas
+    agregados.append(select(func.max(User.updated_at)).scalar_subquery())
+    agregados.append(territory_version_select(user_comuna_ids))
+    for modelo, _ in CATALOGOS.values():
+        agregados.append(select(func.count(modelo.id)).scalar_subquery())
+        agregados.append(select(func.max(modelo.id)).scalar_subquery())
+
+    fila = db.session.execute(select(*agregados)).one()
+
+    huella = tuple(v.isoformat() if hasattr(v, 'isoformat') else v for v in fila)
+    _huellas[clave] = (huella, time.monotonic())
+    return huella
+
+
+# Pool de hilos por proceso para fetch_concurrently (se recrea si cambia la configuración)
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers):
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sync-fetch')
+            _executor_workers = workers
+        return _executor
+
+
+def fetch_concurrently(consultas):
+    """
+    Ejecuta varias consultas de solo lectura independientes en paralelo, cada una en su
+    propia conexión del pool, de modo que la latencia es la de la consulta más lenta y no
+    la suma de todas.
+
+    El paralelismo lo fija SYNC_DETAIL_FETCH_WORKERS (pool compartido por el proceso, así
+    varias peticiones simultáneas no abren más conexiones que ese límite). Con 1 o menos (el
+    valor por defecto) las consultas se ejecutan una tras otra en la sesión actual. El valor
+    debe ser menor que pool_size + max_overflow del engine.
+
+    Consistencia: en paralelo cada consulta corre en su propia transacción, fuera de la de la
+    sesión. En MySQL (REPEATABLE READ) la sesión lee el snapshot tomado en su primera
+    consulta y cada conexión del pool el de su propio inicio, así que una sincronización
+    confirmada entre medio puede dejar detalles más nuevos (o ausentes) respecto de las visitas
+    y personas de la página. Se cambia latencia por esa ventana: el cliente lo corrige en el
+    siguiente GET /changes, pero si la página debe ser una foto exacta hay que dejar 1.
+
+    Args:
+        consultas (dict): {nombre: Select}.
+
+    Returns:
+        dict: {nombre: list[Row]} con las filas de cada consulta.
+    """
+    workers = current_app.config.get('SYNC_DETAIL_FETCH_WORKERS', 1)
+    if workers <= 1 or len(consultas) <= 1:
+        return {nombre: db.session.execute(consulta).all() for nombre, consulta in consultas.items()}
+
+    # El engine se resuelve aquí: los hilos del pool no tienen contexto de aplicación
+    engine = db.engine
+
+    def ejecutar(consulta):
+        with engine.connect() as conexion:
+            return conexion.execute(consulta).all()
+
+    executor = _get_executor(workers)
+    futuros = {nombre: executor.submit(ejecutar, consulta) for nombre, consulta in consultas.items()}
+    return {nombre: futuro.result() for nombre, futuro in futuros.items()}
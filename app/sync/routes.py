@@ -1,19 +1,481 @@
 # app/sync/routes.py
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, url_for
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from werkzeug.exceptions import RequestEntityTooLarge
 import datetime
-from sqlalchemy import func, and_
+import hashlib
+import json
+from functools import lru_cache
+from sqlalchemy import func, select
 from app.models import db, User, BaseTipoDocumento, BaseComunaCorregimiento, BaseBarrioVereda, \
                       Equipo, EquipoUser, EquipoComunaCorregimiento, \
-                      ApsFichaFamilia, ApsPersona, ApsVisita, ApsUbicacionFamilia, \
-                      ApsPersonaAntecedenteMedico, ApsPersonaComponenteMental, ApsPersonaCondicionesSalud, \
-                      ApsPersonaDatoBasico, ApsPersonaEstilosVidaConducta, ApsPersonaMaternidad, \
-                      ApsPersonaPracticasSaludSaludSexual, ApsCueOpcion, ApsCondicionesHabitatFamilia, \
-                      ComProfesion, AuthOficina
-from app.sync.utils import calculate_total_updated_fields_for_family_ficha, get_descriptions_from_comma_separated_ids
+                      ApsFichaFamilia, ApsVisita, ApsUbicacionFamilia, ApsCondicionesHabitatFamilia, \
+                      ApsPersonaEstilosVidaConducta, ApsCueOpcion, ComProfesion, AuthOficina, SyncBatch
+from app.sync.utils import calculate_total_updated_fields_for_families, decode_comma_separated_ids_bulk, \
+                          encode_sync_cursor, decode_sync_cursor
+from app.sync.catalog_cache import get_catalog
+from app.sync.streaming import stream_json_response, stream_msgpack_response, stream_batch_response
+from app.sync.serialization import msgpack_available, packb, unpackb, MSGPACK_MIMETYPE, MSGPACK_MIMETYPES
+from app.sync.schema import SECCIONES_POR_NOMBRE, HABITAT_TXT_CAMPOS, DETALLES_PERSONA, empty_sections
+from app.sync.columnar import COLUMNAR_MIMETYPE, columnar_sections
+from app.sync.serializers import compile_section_serializers, section_columns, section_serializer
+from app.sync.jobs import submit_changes_job, read_job, count_change_items, ESTADO_EN_COLA, ESTADO_TERMINADO, ESTADO_FALLIDO
+from app.sync.idempotency import idempotency_available, request_fingerprint, claim_batch, finish_batch, release_batch, \
+                                 LOTE_TERMINADO
+from app.sync.ingest import process_changes, process_change_stream, commit_changes, throughput_stats
+from app.sync.stream_parser import InvalidChangesBody, iter_change_items, count_stream_items, spool_body, \
+                                  MAX_ITEM_BYTES
+from app.sync.snapshots import fresh_snapshot_path, snapshot_response
+from app.sync.queries import latest_visits_page, latest_visits_after, count_latest_visits, territory_visit_ids_select, \
+                            latest_personas_for_families, changed_since, families_changed_since, tombstones_since, \
+                            territory_fingerprint, fetch_concurrently
 
 sync_bp = Blueprint('sync_bp', __name__, url_prefix='/api/v1/sync')
 
+# Los serializadores de transactional_data se compilan una vez, al registrar el blueprint
+sync_bp.record_once(lambda state: compile_section_serializers())
+
+
+@sync_bp.errorhandler(RequestEntityTooLarge)
+def payload_too_large(e):
+    return jsonify({"message": "El cuerpo de la petición supera el tamaño máximo permitido",
+                    "error": "payload_too_large",
+                    "max_bytes": request.max_content_length}), 413
+
+
+@sync_bp.errorhandler(InvalidChangesBody)
+def invalid_changes_body(e):
+    return jsonify({"message": str(e), "error": "invalid_body"}), 400
+
+def _columnas(nombre, joins=None):
+    """
+    Columnas a consultar para la sección `nombre`, en el orden que lee su serializador.
+
+    Solo se leen las columnas que se serializan y como tuplas (sin entidades ORM, identity map
+    ni seguimiento de cambios), lo que reduce la transferencia desde MySQL y el costo de
+    hidratar las tablas anchas.
+
+    Args:
+        nombre (str): Nombre de la sección (ver app/sync/schema.py).
+        joins (dict, optional): {columna: expresión} para las columnas que no son del modelo
+            de la sección (se etiquetan con el nombre de la columna).
+
+    Returns:
+        list: Columnas para select()/query().
+    """
+    joins = joins or {}
+    modelo = SECCIONES_POR_NOMBRE[nombre].modelo
+    return [joins[columna].label(columna) if columna in joins else getattr(modelo, columna)
+            for columna in section_columns(nombre)]
+
+
+def _response_serialization():
+    # Serialización de la respuesta: 'msgpack' si el cliente la pide y la librería está instalada
+    if msgpack_available() and request.accept_mimetypes.best_match(
+        ['application/json', COLUMNAR_MIMETYPE, *MSGPACK_MIMETYPES]
+    ) in MSGPACK_MIMETYPES:
+        return 'msgpack'
+    return 'json'
+
+
+def _initial_data_etag(user_comuna_ids, formato, serializacion):
+    """
+    ETag de una página de initial-data calculado a partir de territory_fingerprint() y de los
+    parámetros del request, sin generar ni hashear el cuerpo.
+
+    La huella solo se calcula en el momento si el request trae If-None-Match (hay que validarlo).
+    Para emitir el ETag de una respuesta 200 se reutiliza la del proceso durante
+    SYNC_ETAG_CACHE_TTL segundos: como se calculó antes de leer la página, en el peor caso es
+    más vieja que el cuerpo y el próximo If-None-Match no coincide (un 200 de más, nunca un
+    304 con datos viejos).
+
+    Returns:
+        str or None: None si está desactivado o no hay huella (ver territory_fingerprint).
+    """
+    if not current_app.config.get('SYNC_ETAG_ENABLED', True):
+        return None
+
+    max_age = 0 if request.if_none_match else current_app.config.get('SYNC_ETAG_CACHE_TTL', 60)
+    valores = territory_fingerprint(user_comuna_ids, max_age=max_age)
+    if valores is None:
+        return None
+
+    clave = repr((
+        valores,
+        sorted(user_comuna_ids),
+        sorted(request.args.items(multi=True)),
+        formato,
+        serializacion
+    ))
+    return hashlib.sha256(clave.encode('utf-8')).hexdigest()[:40]
+
+
+def _matching_etag(etag):
+    # Devuelve la etiqueta del If-None-Match que coincide con etag (o None). Flask-Compress
+    # agrega ':<algoritmo>' al ETag de las respuestas comprimidas, así que se compara sin él.
+    if not etag:
+        return None
+    if request.if_none_match.star_tag:
+        return etag
+    for candidato in request.if_none_match.as_set(include_weak=True):
+        if candidato.split(':', 1)[0] == etag:
+            return candidato
+    return None
+
+
+def _response_format():
+    # Formato de transactional_data: 'json' (objetos) o 'columnar' (ver app/sync/columnar.py)
+    if request.args.get('format') == 'columnar':
+        return 'columnar'
+    if request.accept_mimetypes.best_match(['application/json', COLUMNAR_MIMETYPE]) == COLUMNAR_MIMETYPE:
+        return 'columnar'
+    return 'json'
+
+
+def transactional_data_response(envelope, sections, stream=False, formato='json', serializacion='json', etag=None):
+    """
+    Respuesta de initial-data / changes a partir de las claves pequeñas del documento y de
+    las secciones perezosas de transactional_data.
+
+    Args:
+        envelope (dict): pagination_meta, last_sync_timestamp, etc.
+        sections (dict): Secciones de build_initial_data_sections.
+        stream (bool): Escribir la respuesta sección por sección (ver app/sync/streaming.py).
+        formato (str): 'json' o 'columnar'.
+        serializacion (str): 'json' o 'msgpack' (las secciones deben armarse con fechas_nativas).
+        etag (str, optional): ETag de la respuesta (ver _initial_data_etag).
+
+    Returns:
+        Response: Respuesta HTTP 200.
+    """
+    mimetype = 'application/json'
+    if formato == 'columnar':
+        sections = columnar_sections(sections)
+        envelope = {**envelope, "format": "columnar"}
+        mimetype = COLUMNAR_MIMETYPE
+    if serializacion == 'msgpack':
+        mimetype = MSGPACK_MIMETYPE
+
+    if stream:
+        stream_response = stream_msgpack_response if serializacion == 'msgpack' else stream_json_response
+        response = stream_response(envelope, "transactional_data", sections, mimetype=mimetype)
+    else:
+        transactional_data = {}
+        for nombre, section in sections.items():
+            valor = section()
+            transactional_data[nombre] = valor if isinstance(valor, dict) else list(valor)
+
+        documento = {**envelope, "transactional_data": transactional_data}
+        if serializacion == 'msgpack':
+            response = current_app.response_class(packb(documento), mimetype=mimetype)
+        else:
+            response = jsonify(documento)
+            response.mimetype = mimetype
+
+    if etag:
+        # En streaming la compresión no pasa por Flask-Compress: se agrega el sufijo igual que él
+        encoding = response.headers.get('Content-Encoding') if stream else None
+        response.set_etag(f"{etag}:{encoding}" if encoding else etag)
+
+    # La representación depende del Accept del cliente
+    response.vary.add('Accept')
+    return response
+
+
+def _parse_per_page():
+    """
+    Tamaño de página pedido en 'per_page' (por defecto 100), recortado a SYNC_MAX_PER_PAGE.
+
+    Returns:
+        int: Familias por página.
+
+    Raises:
+        ValueError: Si per_page es menor que 1.
+    """
+    per_page = request.args.get('per_page', 100, type=int)
+    if per_page < 1:
+        raise ValueError(f"per_page debe ser un entero positivo: {request.args.get('per_page')!r}")
+    return min(per_page, current_app.config.get('SYNC_MAX_PER_PAGE', 1000))
+
+
+def _parse_pages(pages_param, page):
+    """
+    Rango de páginas de una descarga por lotes: 'a-b', 'a' o, sin parámetro (solo max_bytes),
+    desde `page`. El rango se recorta a SYNC_BATCH_MAX_PAGES páginas.
+
+    Returns:
+        tuple: (primera, última) página.
+
+    Raises:
+        ValueError: Si el rango no es válido.
+    """
+    max_paginas = current_app.config.get('SYNC_BATCH_MAX_PAGES', 20)
+    if pages_param is None:
+        primera, ultima = page, page + max_paginas - 1
+    else:
+        try:
+            desde, _, hasta = pages_param.partition('-')
+            primera = int(desde)
+            ultima = int(hasta) if hasta else primera
+        except ValueError:
+            raise ValueError(f"Rango de páginas inválido: {pages_param!r} (se espera 'a-b')")
+    if primera < 1 or ultima < primera:
+        raise ValueError(f"Rango de páginas inválido: {pages_param!r} (se espera 1 <= a <= b)")
+    return primera, min(ultima, primera + max_paginas - 1)
+
+
+def batch_data_response(envelope, paginas, max_bytes=None, formato='json', serializacion='json', etag=None):
+    """
+    Respuesta de initial-data con varias páginas consecutivas ('pages' / 'max_bytes'),
+    siempre en streaming: {**envelope, "pages": [{pagination_meta, transactional_data}, ...]}.
+
+    Args:
+        envelope (dict): Claves del documento exterior (los callables se evalúan al escribirlos).
+        paginas (iterable): Tuplas (pagination_meta de la página, secciones perezosas).
+        max_bytes (int, optional): Tamaño aproximado tras el cual no se agregan más páginas.
+        formato (str): 'json' o 'columnar'.
+        serializacion (str): 'json' o 'msgpack'.
+        etag (str, optional): ETag de la respuesta (ver _initial_data_etag).
+
+    Returns:
+        Response: Respuesta HTTP 200 en streaming.
+    """
+    mimetype = 'application/json'
+    if formato == 'columnar':
+        envelope = {**envelope, "format": "columnar"}
+        mimetype = COLUMNAR_MIMETYPE
+    if serializacion == 'msgpack':
+        mimetype = MSGPACK_MIMETYPE
+
+    documentos = (
+        ({"pagination_meta": meta}, "transactional_data",
+         columnar_sections(sections) if formato == 'columnar' else sections)
+        for meta, sections in paginas
+    )
+    response = stream_batch_response(envelope, documentos, max_bytes, serializacion, mimetype=mimetype)
+
+    if etag:
+        encoding = response.headers.get('Content-Encoding')
+        response.set_etag(f"{etag}:{encoding}" if encoding else etag)
+    response.vary.add('Accept')
+    return response
+
+
+def build_initial_data_sections(visitas_paginated_list, since=None, fechas_nativas=False, max_visita_id=None):
+    """
+    Arma las secciones de transactional_data para una página de "última visita por familia".
+
+    Con `since` (GET /changes) cada sección conserva solo los registros modificados desde ese
+    instante; las personas de la página se siguen usando completas para filtrar las tablas de
+    detalle, porque un detalle puede cambiar sin que cambie su persona.
+
+    Cada sección es un callable que ejecuta sus consultas y genera sus filas serializadas solo
+    cuando se consume, de modo que la respuesta puede escribirse sección por sección (ver
+    app/sync/streaming.py) sin tener todo el documento en memoria. Los datos compartidos entre
+    secciones (IDs de personas, novedad, totales por familia) se calculan una sola vez.
+
+    Args:
+        visitas_paginated_list (list): Filas con aps_visita_id y aps_ficha_familia_id de la página.
+        since (datetime, optional): Token de sincronización incremental.
+        fechas_nativas (bool): Dejar las fechas como date/datetime en lugar de texto isoformat
+            (para serializaciones con tipo fecha propio, p. ej. msgpack).
+        max_visita_id (int, optional): Snapshot del cursor: las personas se toman en su última
+            versión hasta esa visita, igual que las visitas de la página.
+
+    Returns:
+        dict: {nombre de sección: callable sin argumentos que devuelve un iterable de dicts}.
+    """
+    visitas_ids_paginated = [v.aps_visita_id for v in visitas_paginated_list]
+    current_page_familia_ids = list(set([v.aps_ficha_familia_id for v in visitas_paginated_list]))
+
+    # Crear alias para joins de usuarios
+    UserCreated = db.aliased(User)
+    UserUpdated = db.aliased(User)
+
+    # Filtro de sincronización incremental (sin since no agrega criterios)
+    def modificados(columna):
+        return [changed_since(columna, since)] if since else []
+
+    # Crear alias para las diferentes tablas de ApsCueOpcion
+    DuracionOpcion = db.aliased(ApsCueOpcion)
+    TipoActividadOpcion = db.aliased(ApsCueOpcion)
+
+    # --- Traducciones de ApsCueOpcion, ubicaciones, tipos de documento, oficinas y profesiones ---
+    # Los catálogos se leen de la caché por proceso (app/sync/catalog_cache.py) en lugar de
+    # recargar las tablas completas en cada request.
+    # Catálogos que usan los serializadores compilados (las secciones agregan los de la página)
+    catalogos = {
+        nombre: get_catalog(nombre)
+        for nombre in ('opciones', 'comunas', 'barrios', 'tipos_documento', 'oficinas', 'profesiones')
+    }
+    traducciones = catalogos['opciones']
+
+    # Función helper para obtener descripción de códigos
+    def get_traduccion(codigo_id):
+        return traducciones.get(codigo_id, '') if codigo_id else ''
+
+    # --- Datos compartidos entre secciones (se calculan la primera vez que se piden) ---
+    @lru_cache(maxsize=None)
+    def personas():
+        # Todas las personas de las familias de la página con su último registro
+        # (una fila por familia y numero_documento) en una sola consulta con ROW_NUMBER()
+        return latest_personas_for_families(
+            current_page_familia_ids, _columnas("personas"), max_visita_id
+        )
+
+    @lru_cache(maxsize=None)
+    def current_page_persona_ids():
+        return [p.id for p in personas()]
+
+    @lru_cache(maxsize=None)
+    def novedad_por_persona():
+        # Solo se proyectan (persona, novedad) de estilos de vida: no hace falta hidratar la tabla
+        novedades = {}
+        for aps_persona_id, novedad in db.session.query(
+            ApsPersonaEstilosVidaConducta.aps_persona_id,
+            ApsPersonaEstilosVidaConducta.novedad
+        ).filter(
+            ApsPersonaEstilosVidaConducta.aps_persona_id.in_(current_page_persona_ids())
+        ):
+            if aps_persona_id and novedad:
+                novedades[aps_persona_id] = get_traduccion(novedad)
+        return novedades
+
+    @lru_cache(maxsize=None)
+    def detalles_pagina():
+        # Ubicaciones, hábitat y las tablas de detalle de persona no dependen entre sí: se
+        # consultan en paralelo (ver fetch_concurrently) la primera vez que se pide cualquiera
+        consultas = {
+            "ubicaciones_familia": select(*_columnas("ubicaciones_familia")).where(
+                ApsUbicacionFamilia.aps_visita_id.in_(visitas_ids_paginated),
+                *modificados(ApsUbicacionFamilia.updated_at)
+            ),
+            "condiciones_habitat_familia": select(*_columnas("condiciones_habitat_familia")).where(
+                ApsCondicionesHabitatFamilia.aps_visita_id.in_(visitas_ids_paginated),
+                *modificados(ApsCondicionesHabitatFamilia.updated_at)
+            )
+        }
+        persona_ids = current_page_persona_ids()
+        for nombre, modelo in DETALLES_PERSONA:
+            consultas[nombre] = select(*_columnas(nombre)).where(
+                modelo.aps_persona_id.in_(persona_ids),
+                *modificados(modelo.updated_at)
+            )
+        return fetch_concurrently(consultas)
+
+    # --- Secciones ---
+    def familias():
+        # Consulta con joins para obtener detalles de created_by y updated_by para familias,
+        # incluida la oficina y profesión del responsable
+        familias_with_details = db.session.query(*_columnas("familias", {
+            "created_by_username": UserCreated.username,
+            "created_by_name": UserCreated.name,
+            "created_by_documento": UserCreated.documento,
+            "created_by_oficina_id": UserCreated.auth_oficina,
+            "created_by_profesion_id": UserCreated.com_profesion,
+            "updated_by_username": UserUpdated.username,
+            "updated_by_name": UserUpdated.name,
+            "updated_by_documento": UserUpdated.documento,
+            "updated_by_oficina_id": UserUpdated.auth_oficina,
+            "updated_by_profesion_id": UserUpdated.com_profesion
+        })).outerjoin(
+            UserCreated, ApsFichaFamilia.created_by == UserCreated.id
+        ).outerjoin(
+            UserUpdated, ApsFichaFamilia.updated_by == UserUpdated.id
+        ).filter(
+            ApsFichaFamilia.id.in_(current_page_familia_ids),
+            *modificados(ApsFichaFamilia.updated_at)
+        ).all()
+
+        # Total de campos actualizados por familia (una sola consulta agrupada para la página)
+        catalogos_familias = {
+            **catalogos,
+            "campos_actualizados": calculate_total_updated_fields_for_families(current_page_familia_ids)
+        }
+        serializar = section_serializer("familias", fechas_nativas)
+        for familia_obj in familias_with_details:
+            yield serializar(familia_obj, catalogos_familias)
+
+    def personas_section():
+        catalogos_personas = {**catalogos, "novedades": novedad_por_persona()}
+        desde = since.date() if since else None
+        serializar = section_serializer("personas", fechas_nativas)
+        for p in personas():
+            if desde and not (hasattr(p.updated_at, 'isoformat') and p.updated_at >= desde):
+                continue
+            yield serializar(p, catalogos_personas)
+
+    def visitas():
+        visitas_with_details = db.session.query(*_columnas("visitas", {
+            "tipo_actividad_descripcion": TipoActividadOpcion.descripcion,
+            "auth_oficina_nombre": AuthOficina.nombre,
+            "com_profesion_descripcion": ComProfesion.tipo,
+            "duracion_descripcion": DuracionOpcion.descripcion,
+            "created_by_username": UserCreated.username,
+            "created_by_name": UserCreated.name,
+            "created_by_documento": UserCreated.documento,
+            "updated_by_username": UserUpdated.username,
+            "updated_by_name": UserUpdated.name,
+            "updated_by_documento": UserUpdated.documento
+        })).outerjoin(
+            DuracionOpcion, ApsVisita.duracion == DuracionOpcion.id
+        ).outerjoin(
+            TipoActividadOpcion, ApsVisita.tipo_actividad == TipoActividadOpcion.id
+        ).outerjoin(
+            ComProfesion, ApsVisita.com_profesion == ComProfesion.id
+        ).outerjoin(
+            AuthOficina, ApsVisita.auth_oficina == AuthOficina.id
+        ).outerjoin(
+            UserCreated, ApsVisita.created_by == UserCreated.id
+        ).outerjoin(
+            UserUpdated, ApsVisita.updated_by == UserUpdated.id
+        ).filter(
+            ApsVisita.id.in_(visitas_ids_paginated),
+            *modificados(ApsVisita.updated_at)
+        ).all()
+
+        serializar = section_serializer("visitas", fechas_nativas)
+        for visita_obj in visitas_with_details:
+            yield serializar(visita_obj, catalogos)
+
+    def ubicaciones_familia():
+        # Ubicaciones de familia asociadas a las visitas de la página actual
+        serializar = section_serializer("ubicaciones_familia", fechas_nativas)
+        for uf in detalles_pagina()["ubicaciones_familia"]:
+            yield serializar(uf, catalogos)
+
+    def condiciones_habitat_familia():
+        condiciones_habitat_familia_records = detalles_pagina()["condiciones_habitat_familia"]
+
+        # Todos los campos _txt (IDs separados por comas) de la página se decodifican en una
+        # sola pasada contra el catálogo de opciones en caché
+        descripciones_txt = decode_comma_separated_ids_bulk(
+            getattr(chf, campo_txt)
+            for chf in condiciones_habitat_familia_records
+            for _, campo_txt in HABITAT_TXT_CAMPOS
+        )
+
+        serializar = section_serializer("condiciones_habitat_familia", fechas_nativas)
+        catalogos_habitat = {**catalogos, "habitat_txt": descripciones_txt}
+        for chf in condiciones_habitat_familia_records:
+            yield serializar(chf, catalogos_habitat)
+
+    def detalle_persona(nombre):
+        # Tablas de detalle filtradas por las personas de la última visita de cada familia
+        def section():
+            return map(section_serializer(nombre, fechas_nativas), detalles_pagina()[nombre])
+        return section
+
+    return {
+        "familias": familias,
+        "personas": personas_section,
+        "visitas": visitas,
+        "ubicaciones_familia": ubicaciones_familia,
+        "condiciones_habitat_familia": condiciones_habitat_familia,
+        **{nombre: detalle_persona(nombre) for nombre, _ in DETALLES_PERSONA}
+    }
+
+
 # Endpoint de Sincronización Inicial de Datos (GET)
 @sync_bp.route("/initial-data", methods=["GET"])
 @jwt_required()
@@ -26,7 +488,42 @@ def get_initial_data():
 
     # --- Obtener parámetros de paginación ---
     page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 100, type=int)
+    try:
+        per_page = _parse_per_page()
+    except ValueError as e:
+        return jsonify({"message": str(e), "error": "invalid_per_page"}), 400
+
+    # stream=1: la respuesta se escribe y comprime sección por sección (ver app/sync/streaming.py)
+    stream = request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+    formato = _response_format()
+    serializacion = _response_serialization()
+
+    # Paginación por cursor (keyset): se activa enviando 'cursor' (vacío para la primera página).
+    # Sin 'cursor' se mantiene la paginación clásica por 'page'.
+    cursor_param = request.args.get('cursor')
+    cursor_mode = cursor_param is not None
+    cursor = None
+    if cursor_param:
+        try:
+            cursor = decode_sync_cursor(cursor_param)
+        except ValueError as e:
+            return jsonify({"message": str(e), "error": "invalid_cursor"}), 400
+
+    # Descarga por lotes: pages=a-b y/o max_bytes=N devuelven varias páginas consecutivas en
+    # una sola respuesta, pagando una vez la resolución de usuario, territorio y catálogos
+    pages_param = request.args.get('pages')
+    max_bytes = request.args.get('max_bytes', type=int)
+    batch_mode = pages_param is not None or 'max_bytes' in request.args
+    if batch_mode:
+        if cursor_mode:
+            return jsonify({"message": "pages/max_bytes no se combinan con cursor", "error": "invalid_pages"}), 400
+        if 'max_bytes' in request.args and (max_bytes is None or max_bytes <= 0):
+            return jsonify({"message": "max_bytes debe ser un entero positivo", "error": "invalid_pages"}), 400
+        try:
+            first_page, last_page = _parse_pages(pages_param, page)
+        except ValueError as e:
+            return jsonify({"message": str(e), "error": "invalid_pages"}), 400
+        page = first_page
 
     # --- 1. Obtener los IDs de las comunas/territorios asignados al usuario ---
     # a. Encontrar los IDs de los equipos a los que pertenece el usuario
@@ -77,6 +574,26 @@ def get_initial_data():
             "last_sync_timestamp": datetime.datetime.now().isoformat()
         }), 200
 
+    # --- Snapshot nocturno (snapshot=1): si hay uno vigente para el territorio (ver
+    # `flask sync build-snapshots`) se envía tal cual está en disco, con todas las páginas.
+    # El cliente completa con GET /changes?since=<last_sync_timestamp del snapshot>. Sin
+    # snapshot vigente se responde la página pedida con las consultas en vivo. ---
+    if request.args.get('snapshot', '').lower() in ('1', 'true', 'yes') and not cursor_mode and not batch_mode \
+            and formato == 'json' and serializacion == 'json':
+        ruta_snapshot = fresh_snapshot_path(user_comuna_ids)
+        if ruta_snapshot:
+            return snapshot_response(ruta_snapshot)
+
+    # --- ETag: si el territorio no cambió desde la versión que tiene el cliente se responde
+    # 304 antes de ejecutar las consultas de la página ---
+    etag = _initial_data_etag(user_comuna_ids, formato, serializacion)
+    etag_cliente = _matching_etag(etag)
+    if etag_cliente:
+        response = current_app.response_class(status=304)
+        response.set_etag(etag_cliente)
+        response.vary.add('Accept')
+        return response
+
 
     # --- 2. Optimización: Eliminar catálogos que ahora se traducen server-side ---
     # NOTA: Se eliminaron del catalog_data porque ahora se envían traducidos directamente:
@@ -95,111 +612,55 @@ def get_initial_data():
     }
 
     # --- 3. Obtener datos transaccionales filtrados por los territorios del usuario ---
-    # a. Obtener los IDs de las visitas que pertenecen a las comunas del usuario
-    visita_ids_in_territory = [
-        au.aps_visita_id
-        for au in ApsUbicacionFamilia.query.filter(
-            ApsUbicacionFamilia.base_comuna_corregimiento_id.in_(user_comuna_ids)
-        ).distinct().all()
-    ]
+    # Territorio -> familias válidas -> última visita por familia se resuelve en una sola
+    # sentencia SQL (ROW_NUMBER() OVER PARTITION BY familia) que ya devuelve la página
+    # solicitada y el total de familias. Ver app/sync/queries.py.
+    if cursor_mode:
+        # Snapshot de la descarga: el primer request fija as_of y el mayor ID de visita;
+        # las páginas siguientes lo heredan del cursor para no mover filas entre páginas.
+        if cursor is None:
+            as_of = datetime.datetime.now()
+            max_visita_id = db.session.query(func.max(ApsVisita.id)).scalar() or 0
+            total_visitas = count_latest_visits(user_comuna_ids, max_visita_id)
+            after_familia_id = None
+        else:
+            as_of = cursor["as_of"]
+            max_visita_id = cursor["max_visita_id"]
+            total_visitas = cursor["total"]
+            after_familia_id = cursor["familia_id"]
+
+        visitas_paginated_list = latest_visits_after(
+            user_comuna_ids, after_familia_id, per_page + 1, max_visita_id
+        )
+        cursor_has_next = len(visitas_paginated_list) > per_page
+        visitas_paginated_list = visitas_paginated_list[:per_page]
+    elif batch_mode:
+        # Todas las filas del lote salen de una sola consulta de "última visita por familia"
+        visitas_paginated_list, total_visitas = latest_visits_page(
+            user_comuna_ids, page, per_page, pages=last_page - first_page + 1
+        )
+    else:
+        visitas_paginated_list, total_visitas = latest_visits_page(user_comuna_ids, page, per_page)
+
+    if total_visitas == 0:
+        # Distinguir "territorio sin visitas" de "sin familias válidas" solo cuando no hay datos
+        hay_visitas_en_territorio = db.session.query(
+            territory_visit_ids_select(user_comuna_ids).exists()
+        ).scalar()
 
-    # Si no hay visitas en el territorio, devolver respuesta vacía
-    if not visita_ids_in_territory:
         return jsonify({
-            "message": "No hay visitas en los territorios asignados al usuario.",
+            "message": "No hay visitas válidas con familias activas en los territorios asignados al usuario."
+                       if hay_visitas_en_territorio else
+                       "No hay visitas en los territorios asignados al usuario.",
             "catalog_data": catalog_data,
-            "transactional_data": {
-                "familias": [],
-                "personas": [],
-                "visitas": [],
-                "ubicaciones_familia": [],
-                "condiciones_habitat_familia": [],
-                "persona_antecedente_medico": [],
-                "persona_componente_mental": [],
-                "persona_condiciones_salud": [],
-                "persona_dato_basico": [],
-                "persona_estilos_vida_conducta": [],
-                "persona_maternidad": [],
-                "persona_practicas_salud_salud_sexual": []
-            },
+            "transactional_data": empty_sections(),
             "pagination_meta": {
-                "page": page,
                 "per_page": per_page,
                 "total": 0,
-                "pages": 0,
                 "has_next": False,
-                "has_prev": False
-            },
-            "last_sync_timestamp": datetime.datetime.now().isoformat()
-        }), 200
-
-    # b. NUEVA ESTRATEGIA: Primero obtener familias válidas del territorio, luego filtrar visitas
-    
-    # Paso 1: Obtener todas las familias válidas del territorio (sin paginación aún)
-    # Obtener todas las visitas del territorio para encontrar familias
-    all_visitas_in_territory = ApsVisita.query.filter(
-        ApsVisita.id.in_(visita_ids_in_territory),
-        ApsVisita.estado_ficha == 800  # Solo fichas con estado 'Activa'
-    ).all()
-    
-    # Obtener todas las personas de estas visitas con apellidos válidos
-    all_visitas_ids = [v.id for v in all_visitas_in_territory]
-    personas_territorio = ApsPersona.query.filter(
-        ApsPersona.aps_visita_id.in_(all_visitas_ids),
-        # ApsPersona.apellidos.isnot(None),    # No NULL
-        # ApsPersona.apellidos != '',          # No vacío  
-        ApsPersona.apellidos != 'NULL'       # No string 'NULL'
-    ).all()
-    
-    # Obtener familias válidas del territorio
-    familia_ids_territorio = list(set([p.aps_ficha_familia_id for p in personas_territorio if p.aps_ficha_familia_id]))
-    familias_territorio = []
-    if familia_ids_territorio:
-        familias_territorio = ApsFichaFamilia.query.filter(
-            ApsFichaFamilia.id.in_(familia_ids_territorio),
-            ApsFichaFamilia.apellido_familiar.isnot(None),  # No NULL
-            ApsFichaFamilia.apellido_familiar != '',        # No vacío
-            ApsFichaFamilia.apellido_familiar != 'NULL'     # No string 'NULL'
-        ).all()
-    
-    # Paso 2: Filtrar visitas que pertenecen a familias válidas Y obtener solo la última visita de cada familia
-    familias_validas_ids = [f.id for f in familias_territorio]
-    
-    # Crear un diccionario para almacenar solo la última visita de cada familia
-    ultima_visita_por_familia = {}
-    
-    for visita in all_visitas_in_territory:
-        if visita.aps_ficha_familia_id in familias_validas_ids:
-            familia_id = visita.aps_ficha_familia_id
-            
-            # Si no hay visita para esta familia o la actual es más reciente, la guardamos
-            if (familia_id not in ultima_visita_por_familia or 
-                visita.fecha_visita > ultima_visita_por_familia[familia_id].fecha_visita):
-                ultima_visita_por_familia[familia_id] = visita
-    
-    # Convertir el diccionario a lista para mantener compatibilidad con el resto del código
-    visitas_filtradas = list(ultima_visita_por_familia.values())
-    
-    # Si no hay visitas válidas después del filtrado
-    if not visitas_filtradas:
-        return jsonify({
-            "message": "No hay visitas válidas con familias activas en los territorios asignados al usuario.",
-            "catalog_data": catalog_data,
-            "transactional_data": {
-                "familias": [],
-                "personas": [],
-                "visitas": [],
-                "ubicaciones_familia": [],
-                "condiciones_habitat_familia": [],
-                "persona_antecedente_medico": [],
-                "persona_componente_mental": [],
-                "persona_condiciones_salud": [],
-                "persona_dato_basico": [],
-                "persona_estilos_vida_conducta": [],
-                "persona_maternidad": [],
-                "persona_practicas_salud_salud_sexual": []
-            },
-            "pagination_meta": {
+                "next_cursor": None,
+                "as_of": as_of.isoformat()
+            } if cursor_mode else {
                 "page": page,
                 "per_page": per_page,
                 "total": 0,
@@ -209,1875 +670,379 @@ def get_initial_data():
             },
             "last_sync_timestamp": datetime.datetime.now().isoformat()
         }), 200
-    
-    # Paso 3: Aplicar paginación a las visitas filtradas
-    total_visitas = len(visitas_filtradas)
+
     total_pages = (total_visitas + per_page - 1) // per_page
-    start_idx = (page - 1) * per_page
-    end_idx = start_idx + per_page
-    visitas_paginated_list = visitas_filtradas[start_idx:end_idx]
-    
-    # Crear alias para joins de usuarios
-    UserCreated = db.aliased(User)
-    UserUpdated = db.aliased(User)
-    
-    # Paso 4: Obtener información completa de las visitas paginadas con joins
-    visitas_ids_paginated = [v.id for v in visitas_paginated_list]
-    
-    # Crear alias para las diferentes tablas de ApsCueOpcion
-    DuracionOpcion = db.aliased(ApsCueOpcion)
-    TipoActividadOpcion = db.aliased(ApsCueOpcion)
-    
-    visitas_with_details = db.session.query(
-        ApsVisita,
-        DuracionOpcion.descripcion.label('duracion_descripcion'),
-        TipoActividadOpcion.descripcion.label('tipo_actividad_descripcion'),
-        ComProfesion.tipo.label('profesion_descripcion'),
-        AuthOficina.nombre.label('oficina_nombre'),
-        UserCreated.username.label('created_by_username'),
-        UserCreated.name.label('created_by_name'),
-        UserCreated.documento.label('created_by_documento'),
-        UserUpdated.username.label('updated_by_username'),
-        UserUpdated.name.label('updated_by_name'),
-        UserUpdated.documento.label('updated_by_documento')
-    ).outerjoin(
-        DuracionOpcion, ApsVisita.duracion == DuracionOpcion.id
-    ).outerjoin(
-        TipoActividadOpcion, ApsVisita.tipo_actividad == TipoActividadOpcion.id
-    ).outerjoin(
-        ComProfesion, ApsVisita.com_profesion == ComProfesion.id
-    ).outerjoin(
-        AuthOficina, ApsVisita.auth_oficina == AuthOficina.id
-    ).outerjoin(
-        UserCreated, ApsVisita.created_by == UserCreated.id
-    ).outerjoin(
-        UserUpdated, ApsVisita.updated_by == UserUpdated.id
-    ).filter(
-        ApsVisita.id.in_(visitas_ids_paginated)
-    ).all()
-
-    # Serializar las visitas de la página actual
-    visitas_serialized = []
-    for visita_obj, duracion_desc, tipo_actividad_desc, profesion_desc, oficina_nombre, created_by_username, created_by_name, created_by_documento, updated_by_username, updated_by_name, updated_by_documento in visitas_with_details:
-        visita_data = {
-            "id": visita_obj.id,
-            "aps_ficha_familia_id": visita_obj.aps_ficha_familia_id,
-            "fecha_visita": visita_obj.fecha_visita.isoformat() if visita_obj.fecha_visita else None,
-            "tipo_actividad_id": visita_obj.tipo_actividad,
-            "tipo_actividad_descripcion": tipo_actividad_desc,
-            "codigo_cups": visita_obj.codigo_cups,
-            "auth_oficina_id": visita_obj.auth_oficina,
-            "auth_oficina_nombre": oficina_nombre,
-            "com_profesion_id": visita_obj.com_profesion,
-            "com_profesion_descripcion": profesion_desc,
-            "created_at": visita_obj.created_at.isoformat() if visita_obj.created_at else None,
-            "updated_at": visita_obj.updated_at.isoformat() if visita_obj.updated_at else None,
-            "created_by": visita_obj.created_by,
-            "created_by_username": created_by_username,
-            "created_by_name": created_by_name,
-            "created_by_documento": created_by_documento,
-            "updated_by": visita_obj.updated_by,
-            "updated_by_username": updated_by_username,
-            "updated_by_name": updated_by_name,
-            "updated_by_documento": updated_by_documento,
-            "duracion_id": visita_obj.duracion,
-            "duracion_descripcion": duracion_desc
-        }
-        visitas_serialized.append(visita_data)
 
-    # c. Obtener los IDs de las visitas de la página actual
-    current_page_visita_ids = [visita_obj.id for visita_obj, _, _, _, _, _, _, _, _, _, _ in visitas_with_details]
-    
-    # d. Obtener familias y personas de las visitas paginadas
-    # Como ya filtramos las familias válidas, obtenemos las de la página actual
-    current_page_familia_ids = list(set([v.aps_ficha_familia_id for v in visitas_paginated_list]))
-    
-    # Crear consulta con joins para obtener detalles de created_by y updated_by para familias
-    # Incluimos también la información de oficina y profesión del responsable
-    familias_with_details = db.session.query(
-        ApsFichaFamilia,
-        UserCreated.username.label('created_by_username'),
-        UserCreated.name.label('created_by_name'), 
-        UserCreated.documento.label('created_by_documento'),
-        UserCreated.auth_oficina.label('created_by_oficina_id'),
-        UserCreated.com_profesion.label('created_by_profesion_id'),
-        UserUpdated.username.label('updated_by_username'),
-        UserUpdated.name.label('updated_by_name'),
-        UserUpdated.documento.label('updated_by_documento'),
-        UserUpdated.auth_oficina.label('updated_by_oficina_id'),
-        UserUpdated.com_profesion.label('updated_by_profesion_id')
-    ).outerjoin(
-        UserCreated, ApsFichaFamilia.created_by == UserCreated.id
-    ).outerjoin(
-        UserUpdated, ApsFichaFamilia.updated_by == UserUpdated.id
-    ).filter(
-        ApsFichaFamilia.id.in_(current_page_familia_ids)
-    ).all()
-    
-    # Obtener TODAS las personas de las familias de la página actual con su último registro
-    # Implementamos la lógica: MAX(fecha_visita) GROUP BY numero_documento por cada familia
-    personas_finales = []
-    
-    for familia_id in current_page_familia_ids:
-        # Para cada familia, obtenemos todas sus personas agrupadas por numero_documento
-        # y seleccionamos el registro más reciente (última visita) de cada persona
-        
-        # Subconsulta para obtener la fecha máxima de visita por documento en esta familia
-        subquery = db.session.query(
-            ApsPersona.numero_documento,
-            func.max(ApsVisita.fecha_visita).label('max_fecha_visita')
-        ).join(
-            ApsVisita, ApsPersona.aps_visita_id == ApsVisita.id
-        ).filter(
-            ApsPersona.aps_ficha_familia_id == familia_id,
-            ApsPersona.apellidos != 'NULL'  # Filtro de apellidos válidos
-        ).group_by(
-            ApsPersona.numero_documento
-        ).subquery()
-        
-        # Consulta principal para obtener el registro completo de cada persona
-        # con su visita más reciente
-        personas_familia = db.session.query(ApsPersona).join(
-            ApsVisita, ApsPersona.aps_visita_id == ApsVisita.id
-        ).join(
-            subquery, 
-            and_(
-                ApsPersona.numero_documento == subquery.c.numero_documento,
-                ApsVisita.fecha_visita == subquery.c.max_fecha_visita
-            )
-        ).filter(
-            ApsPersona.aps_ficha_familia_id == familia_id
-        ).all()
-        
-        personas_finales.extend(personas_familia)
-    
-    # Usar las personas finales en lugar del filtro anterior
-    personas = personas_finales
-
-    # g. Obtener las ubicaciones de familia asociadas a las visitas de la página actual
-    ubicaciones_familia = ApsUbicacionFamilia.query.filter(ApsUbicacionFamilia.aps_visita_id.in_(current_page_visita_ids)).all()
-
-    # --- Obtener todas las tablas de detalle de persona filtradas por personas específicas ---
-    # ESTRATEGIA OPTIMIZADA: Filtramos por las personas específicas que están en la última visita
-    # de cada familia. Esto asegura datos precisos y eficientes.
-    
-    # Obtener los IDs de las personas de la página actual
-    current_page_persona_ids = [p.id for p in personas]
-    
-    # Antecedentes médicos
-    persona_antecedente_medico = ApsPersonaAntecedenteMedico.query.filter(
-        ApsPersonaAntecedenteMedico.aps_persona_id.in_(current_page_persona_ids)
-    ).all()
-
-    # Componente mental
-    persona_componente_mental = ApsPersonaComponenteMental.query.filter(
-        ApsPersonaComponenteMental.aps_persona_id.in_(current_page_persona_ids)
-    ).all()
-
-    # Condiciones de salud
-    persona_condiciones_salud = ApsPersonaCondicionesSalud.query.filter(
-        ApsPersonaCondicionesSalud.aps_persona_id.in_(current_page_persona_ids)
-    ).all()
-
-    # Datos básicos
-    persona_dato_basico = ApsPersonaDatoBasico.query.filter(
-        ApsPersonaDatoBasico.aps_persona_id.in_(current_page_persona_ids)
-    ).all()
-
-    # Estilos de vida y conducta
-    persona_estilos_vida_conducta = ApsPersonaEstilosVidaConducta.query.filter(
-        ApsPersonaEstilosVidaConducta.aps_persona_id.in_(current_page_persona_ids)
-    ).all()
-
-    # Maternidad
-    persona_maternidad = ApsPersonaMaternidad.query.filter(
-        ApsPersonaMaternidad.aps_persona_id.in_(current_page_persona_ids)
-    ).all()
-
-    # Prácticas de salud y salud sexual
-    persona_practicas_salud_salud_sexual = ApsPersonaPracticasSaludSaludSexual.query.filter(
-        ApsPersonaPracticasSaludSaludSexual.aps_persona_id.in_(current_page_persona_ids)
-    ).all()
-
-    # --- Obtener y serializar ApsCondicionesHabitatFamilia ---
-    condiciones_habitat_familia_records = ApsCondicionesHabitatFamilia.query.filter(
-        ApsCondicionesHabitatFamilia.aps_visita_id.in_(current_page_visita_ids)
-    ).all()
-
-    condiciones_habitat_familia_data = []
-    for chf in condiciones_habitat_familia_records:
-        chf_data = {
-            "id": chf.id,
-            "aps_visita_id": chf.aps_visita_id,
-            "aps_ficha_familia": chf.aps_ficha_familia,
-            # Procesar los campos _txt para obtener sus descripciones
-            "aspectos_generales": get_descriptions_from_comma_separated_ids(chf.aps_aspectos_generales_txt),
-            "condiciones_locativas": get_descriptions_from_comma_separated_ids(chf.aps_condiciones_locativas_txt),
-            "condiciones_agua": get_descriptions_from_comma_separated_ids(chf.aps_condiciones_agua_txt),
-            "dotacion_sanitaria": get_descriptions_from_comma_separated_ids(chf.aps_dotacion_sanitaria_txt),
-            "alimentos": get_descriptions_from_comma_separated_ids(chf.aps_alimentos_txt),
-            "tenencia_animales": get_descriptions_from_comma_separated_ids(chf.aps_tenencia_animales_txt),
-            "entorno_vivienda": get_descriptions_from_comma_separated_ids(chf.aps_entorno_vivienda_txt),
-            "numero_perros": chf.numero_perros,
-            "numero_gatos": chf.numero_gatos,
-            "created_at": chf.created_at.isoformat() if chf.created_at else None,
-            "updated_at": chf.updated_at.isoformat() if chf.updated_at else None,
-            "created_by": chf.created_by,
-            "updated_by": chf.updated_by
-        }
-        condiciones_habitat_familia_data.append(chf_data)
-
-    # --- Obtener traducciones de ApsCueOpcion para códigos ---
-    # Crear diccionarios de traducciones para mejorar el rendimiento
-    # Obtener todas las traducciones necesarias en una sola consulta
-    all_opciones = ApsCueOpcion.query.all()
-    traducciones = {opcion.id: opcion.descripcion for opcion in all_opciones}
-    
-    # --- Obtener traducciones de ubicaciones ---
-    # Obtener todas las comunas y barrios para traducciones
-    all_comunas = BaseComunaCorregimiento.query.all()
-    traducciones_comunas = {comuna.id: comuna.nombre for comuna in all_comunas}
-    
-    all_barrios = BaseBarrioVereda.query.all()
-    traducciones_barrios = {barrio.id: barrio.nombre for barrio in all_barrios}
-    
-    # --- Obtener traducciones de tipos de documento ---
-    # Obtener todos los tipos de documento para traducciones
-    all_tipos_documento = BaseTipoDocumento.query.all()
-    traducciones_tipos_documento = {td.id: td.tipo for td in all_tipos_documento}
-    
-    # --- Obtener traducciones de oficinas y profesiones ---
-    # Obtener todas las oficinas para traducciones
-    all_oficinas = AuthOficina.query.all()
-    traducciones_oficinas = {oficina.id: oficina.nombre for oficina in all_oficinas}
-    
-    # Obtener todas las profesiones para traducciones
-    all_profesiones = ComProfesion.query.all()
-    traducciones_profesiones = {profesion.id: profesion.tipo for profesion in all_profesiones}
-    
-    # Función helper para obtener descripción de códigos
-    def get_traduccion(codigo_id):
-        return traducciones.get(codigo_id, '') if codigo_id else ''
-    
-    # Función helper para obtener nombre de comuna
-    def get_nombre_comuna(comuna_id):
-        return traducciones_comunas.get(comuna_id, '') if comuna_id else ''
-    
-    # Función helper para obtener nombre de barrio
-    def get_nombre_barrio(barrio_id):
-        return traducciones_barrios.get(barrio_id, '') if barrio_id else ''
-    
-    # Función helper para obtener tipo de documento
-    def get_tipo_documento(tipo_documento_id):
-        return traducciones_tipos_documento.get(tipo_documento_id, '') if tipo_documento_id else ''
-    
-    # Función helper para obtener nombre de oficina
-    def get_nombre_oficina(oficina_id):
-        return traducciones_oficinas.get(oficina_id, '') if oficina_id else ''
-    
-    # Función helper para obtener tipo de profesión
-    def get_tipo_profesion(profesion_id):
-        return traducciones_profesiones.get(profesion_id, '') if profesion_id else ''
-
-    # --- Obtener información de novedad para cada persona ---
-    # Crear diccionario con novedad traducida por persona
-    novedad_por_persona = {}
-    for pevc in persona_estilos_vida_conducta:
-        if pevc.aps_persona_id and pevc.novedad:
-            novedad_por_persona[pevc.aps_persona_id] = get_traduccion(pevc.novedad)
-
-    transactional_data = {
-        "familias": [{
-            "id": familia_obj.id,
-            "apellido_familiar": familia_obj.apellido_familiar,
-            "celular_cabeza_familia": familia_obj.celular_cabeza_familia,
-            "numero_integrantes_familia": familia_obj.numero_integrantes_familia,
-            "estado_ficha_id": familia_obj.estado_ficha,
-            "estado_ficha_descripcion": get_traduccion(familia_obj.estado_ficha),
-            "documento_cabeza_familia": familia_obj.documento_cabeza_familia,
-            "created_at": familia_obj.created_at.isoformat() if familia_obj.created_at and hasattr(familia_obj.created_at, 'isoformat') else None,
-            "updated_at": familia_obj.updated_at.isoformat() if familia_obj.updated_at and hasattr(familia_obj.updated_at, 'isoformat') else None,
-            "created_by": familia_obj.created_by,
-            "created_by_username": created_by_username,
-            "created_by_name": created_by_name,
-            "created_by_documento": created_by_documento,
-            "created_by_oficina": get_nombre_oficina(created_by_oficina_id),
-            "created_by_profesion": get_tipo_profesion(created_by_profesion_id),
-            "updated_by": familia_obj.updated_by,
-            "updated_by_username": updated_by_username,
-            "updated_by_name": updated_by_name,
-            "updated_by_documento": updated_by_documento,
-            "updated_by_oficina": get_nombre_oficina(updated_by_oficina_id),
-            "updated_by_profesion": get_tipo_profesion(updated_by_profesion_id),
-            "fecha_ultima_correccion": familia_obj.fecha_ultima_correccion.isoformat() if familia_obj.fecha_ultima_correccion else None,
-            "total_campos_actualizados_ultima_visita": calculate_total_updated_fields_for_family_ficha(familia_obj.id)
-        } for familia_obj, created_by_username, created_by_name, created_by_documento, created_by_oficina_id, created_by_profesion_id, updated_by_username, updated_by_name, updated_by_documento, updated_by_oficina_id, updated_by_profesion_id in familias_with_details],
-        "personas": [{
-            "id": p.id,
-            "aps_ficha_familia_id": p.aps_ficha_familia_id,
-            "fecha_registro": p.fecha_registro.isoformat() if p.fecha_registro and hasattr(p.fecha_registro, 'isoformat') else None,
-            "nombres": p.nombres,
-            "apellidos": p.apellidos,
-            "numero_documento": p.numero_documento,
-            "tb_tipo_documento_id": p.tb_tipo_documento_id,
-            "tb_tipo_documento_tipo": get_tipo_documento(p.tb_tipo_documento_id),
-            "sexo_id": p.sexo,
-            "sexo_descripcion": get_traduccion(p.sexo),
-            "etnia_id": p.etnia,
-            "etnia_descripcion": get_traduccion(p.etnia),
-            "edad": p.edad,
-            "fecha_nacimiento": p.fecha_nacimiento.isoformat() if p.fecha_nacimiento and hasattr(p.fecha_nacimiento, 'isoformat') else None,
-            "created_at": p.created_at.isoformat() if p.created_at and hasattr(p.created_at, 'isoformat') else None,
-            "updated_at": p.updated_at.isoformat() if p.updated_at and hasattr(p.updated_at, 'isoformat') else None,
-            "created_by": p.created_by,
-            "updated_by": p.updated_by,
-            "aps_visita_id": p.aps_visita_id,
-            "novedad": novedad_por_persona.get(p.id, '')
-        } for p in personas],
-        "visitas": visitas_serialized,
-        "ubicaciones_familia": [{
-            "id": uf.id,
-            "aps_visita_id": uf.aps_visita_id,
-            "zona": uf.zona,
-            "base_comuna_corregimiento_id": uf.base_comuna_corregimiento_id,
-            "base_comuna_corregimiento_nombre": get_nombre_comuna(uf.base_comuna_corregimiento_id),
-            "base_barrio_vereda_id": uf.base_barrio_vereda_id,
-            "base_barrio_vereda_nombre": get_nombre_barrio(uf.base_barrio_vereda_id),
-            "direccion": uf.direccion,
-            "ficha_catastral": uf.ficha_catastral,
-            "numero_cuadrante": uf.numero_cuadrante,
-            "created_at": uf.created_at.isoformat() if uf.created_at and hasattr(uf.created_at, 'isoformat') else None,
-            "updated_at": uf.updated_at.isoformat() if uf.updated_at and hasattr(uf.updated_at, 'isoformat') else None,
-            "created_by": uf.created_by,
-            "updated_by": uf.updated_by
-        } for uf in ubicaciones_familia],
-        "condiciones_habitat_familia": condiciones_habitat_familia_data,
-        "persona_antecedente_medico": [{
-            "id": pam.id,
-            "aps_persona_id": pam.aps_persona_id,
-            "aps_visita_id": pam.aps_visita_id,
-            "created_at": pam.created_at.isoformat() if pam.created_at and hasattr(pam.created_at, 'isoformat') else None,
-            "updated_at": pam.updated_at.isoformat() if pam.updated_at and hasattr(pam.updated_at, 'isoformat') else None,
-            "created_by": pam.created_by,
-            "updated_by": pam.updated_by
-        } for pam in persona_antecedente_medico],
-        "persona_componente_mental": [{
-            "id": pcm.id,
-            "aps_persona_id": pcm.aps_persona_id,
-            "aps_visita_id": pcm.aps_visita_id,
-            "created_at": pcm.created_at.isoformat() if pcm.created_at and hasattr(pcm.created_at, 'isoformat') else None,
-            "updated_at": pcm.updated_at.isoformat() if pcm.updated_at and hasattr(pcm.updated_at, 'isoformat') else None,
-            "created_by": pcm.created_by,
-            "updated_by": pcm.updated_by
-        } for pcm in persona_componente_mental],
-        "persona_condiciones_salud": [{
-            "id": pcs.id,
-            "aps_persona_id": pcs.aps_persona_id,
-            "aps_visita_id": pcs.aps_visita_id,
-            "created_at": pcs.created_at.isoformat() if pcs.created_at and hasattr(pcs.created_at, 'isoformat') else None,
-            "updated_at": pcs.updated_at.isoformat() if pcs.updated_at and hasattr(pcs.updated_at, 'isoformat') else None,
-            "created_by": pcs.created_by,
-            "updated_by": pcs.updated_by
-        } for pcs in persona_condiciones_salud],
-        "persona_dato_basico": [{
-            "id": pdb.id,
-            "aps_persona_id": pdb.aps_persona_id,
-            "aps_visita_id": pdb.aps_visita_id,
-            "created_at": pdb.created_at.isoformat() if pdb.created_at and hasattr(pdb.created_at, 'isoformat') else None,
-            "updated_at": pdb.updated_at.isoformat() if pdb.updated_at and hasattr(pdb.updated_at, 'isoformat') else None,
-            "created_by": pdb.created_by,
-            "updated_by": pdb.updated_by
-        } for pdb in persona_dato_basico],
-        "persona_estilos_vida_conducta": [{
-            "id": pevc.id,
-            "aps_persona_id": pevc.aps_persona_id,
-            "aps_visita_id": pevc.aps_visita_id,
-            "created_at": pevc.created_at.isoformat() if pevc.created_at and hasattr(pevc.created_at, 'isoformat') else None,
-            "updated_at": pevc.updated_at.isoformat() if pevc.updated_at and hasattr(pevc.updated_at, 'isoformat') else None,
-            "created_by": pevc.created_by,
-            "updated_by": pevc.updated_by
-        } for pevc in persona_estilos_vida_conducta],
-        "persona_maternidad": [{
-            "id": pm.id,
-            "aps_persona_id": pm.aps_persona_id,
-            "aps_visita_id": pm.aps_visita_id,
-            "created_at": pm.created_at.isoformat() if pm.created_at and hasattr(pm.created_at, 'isoformat') else None,
-            "updated_at": pm.updated_at.isoformat() if pm.updated_at and hasattr(pm.updated_at, 'isoformat') else None,
-            "created_by": pm.created_by,
-            "updated_by": pm.updated_by
-        } for pm in persona_maternidad],
-        "persona_practicas_salud_salud_sexual": [{
-            "id": ppsss.id,
-            "aps_persona_id": ppsss.aps_persona_id,
-            "aps_visita_id": ppsss.aps_visita_id,
-            "created_at": ppsss.created_at.isoformat() if ppsss.created_at and hasattr(ppsss.created_at, 'isoformat') else None,
-            "updated_at": ppsss.updated_at.isoformat() if ppsss.updated_at and hasattr(ppsss.updated_at, 'isoformat') else None,
-            "created_by": ppsss.created_by,
-            "updated_by": ppsss.updated_by
-        } for ppsss in persona_practicas_salud_salud_sexual]
-    }
+    if batch_mode:
+        envelope, paginas = initial_data_batch_document(
+            visitas_paginated_list, first_page, per_page, total_visitas, catalog_data,
+            fechas_nativas=(serializacion == 'msgpack')
+        )
+        return batch_data_response(envelope, paginas, max_bytes, formato, serializacion, etag), 200
+
+    # Las secciones se evalúan de forma perezosa: con stream=1 se escriben una por una
+    sections = build_initial_data_sections(
+        visitas_paginated_list, fechas_nativas=(serializacion == 'msgpack'),
+        max_visita_id=max_visita_id if cursor_mode else None
+    )
 
     last_server_update_timestamp = datetime.datetime.now().isoformat()
 
     # Metadatos de paginación
-    pagination_meta = {
-        "page": page,
-        "per_page": per_page,
-        "total": total_visitas,
-        "pages": total_pages,
-        "has_next": page < total_pages,
-        "has_prev": page > 1
-    }
+    if cursor_mode:
+        last_row = visitas_paginated_list[-1] if visitas_paginated_list else None
+        pagination_meta = {
+            "per_page": per_page,
+            "total": total_visitas,
+            "has_next": cursor_has_next,
+            "next_cursor": encode_sync_cursor(
+                last_row.aps_ficha_familia_id, as_of, max_visita_id, total_visitas
+            ) if cursor_has_next else None,
+            "as_of": as_of.isoformat()
+        }
+        # Toda la descarga corresponde al snapshot as_of: es el punto de partida correcto
+        # para la siguiente sincronización incremental del cliente.
+        last_server_update_timestamp = as_of.isoformat()
+    else:
+        pagination_meta = {
+            "page": page,
+            "per_page": per_page,
+            "total": total_visitas,
+            "pages": total_pages,
+            "has_next": page < total_pages,
+            "has_prev": page > 1
+        }
 
-    return jsonify({
+    envelope = {
         "catalog_data": catalog_data,
-        "transactional_data": transactional_data,
         "pagination_meta": pagination_meta,
         "last_sync_timestamp": last_server_update_timestamp
-    }), 200
+    }
+    return transactional_data_response(envelope, sections, stream, formato, serializacion, etag), 200
+
+
+def initial_data_batch_document(visitas_batch, first_page, per_page, total_visitas, catalog_data,
+                                fechas_nativas=False, last_sync_timestamp=None):
+    """
+    Partes de un documento de initial-data con varias páginas consecutivas (ver
+    batch_data_response): el envelope exterior y el generador de páginas.
+
+    Las páginas se arman una por una a medida que se escriben; pagination_meta (que se
+    escribe después de "pages") describe las que efectivamente se enviaron.
+
+    Args:
+        visitas_batch (list): Filas de "última visita por familia" de todo el rango.
+        first_page (int): Número de la primera página del rango.
+        per_page (int): Tamaño de página.
+        total_visitas (int): Total de familias del territorio.
+        catalog_data (dict): Catálogos de la respuesta.
+        fechas_nativas (bool): Ver build_initial_data_sections.
+        last_sync_timestamp (str, optional): Por defecto, el momento actual.
+
+    Returns:
+        tuple: (envelope, iterable de (pagination_meta de la página, secciones)).
+    """
+    total_pages = (total_visitas + per_page - 1) // per_page
+    enviadas = []
 
+    def paginas():
+        for inicio in range(0, len(visitas_batch), per_page):
+            page = first_page + inicio // per_page
+            enviadas.append(page)
+            yield {
+                "page": page,
+                "per_page": per_page,
+                "total": total_visitas,
+                "pages": total_pages,
+                "has_next": page < total_pages,
+                "has_prev": page > 1
+            }, build_initial_data_sections(visitas_batch[inicio:inicio + per_page], fechas_nativas=fechas_nativas)
+
+    def pagination_meta():
+        # Rango fuera de la última página: no se envía ninguna
+        last_page = enviadas[-1] if enviadas else None
+        has_next = last_page is not None and last_page < total_pages
+        return {
+            "first_page": first_page,
+            "last_page": last_page,
+            "per_page": per_page,
+            "total": total_visitas,
+            "pages": total_pages,
+            "has_next": has_next,
+            "next_page": last_page + 1 if has_next else None
+        }
 
-# --- Endpoint para Sincronización de Cambios (POST) ---
-@sync_bp.route("/changes", methods=["POST"])
+    envelope = {
+        "catalog_data": catalog_data,
+        "pagination_meta": pagination_meta,
+        "last_sync_timestamp": last_sync_timestamp or datetime.datetime.now().isoformat()
+    }
+    return envelope, paginas()
+
+
+# --- Endpoint de Sincronización Incremental (GET) ---
+@sync_bp.route("/changes", methods=["GET"])
 @jwt_required()
-def post_changes():
+def get_changes():
+    """
+    Devuelve solo lo modificado desde `since` (el last_sync_timestamp de la sincronización
+    anterior) dentro del territorio del usuario, con la misma forma de transactional_data que
+    initial-data y paginado por cursor de la misma manera.
+
+    Los registros eliminados lógicamente se informan en 'tombstones' (solo en la primera
+    página); el cliente debe aplicarlos después de los upserts. El last_sync_timestamp de la
+    respuesta es el 'since' de la próxima sincronización.
+    """
     current_user_identity_username = get_jwt_identity()
     user = User.query.filter_by(username=current_user_identity_username).first()
 
     if not user:
-        return jsonify({"message": "Usuario no encontrado para sincronización"}), 401
-
-    changes = request.json # Recibe el JSON con los cambios del móvil
-    sync_results = {
-    "familias": {"created": [], "updated": [], "deleted": []},
-    "personas": {"created": [], "updated": [], "deleted": []},
-    "visitas": {"created": [], "updated": [], "deleted": []},
-    "ubicaciones_familia": {"created": [], "updated": [], "deleted": []},
-    # --- Tablas de Detalle de Persona/Familia ---
-    "condiciones_habitat_familia": {"created": [], "updated": [], "deleted": []},
-    "persona_antecedente_medico": {"created": [], "updated": [], "deleted": []},
-    "persona_componente_mental": {"created": [], "updated": [], "deleted": []},
-    "persona_condiciones_salud": {"created": [], "updated": [], "deleted": []},
-    "persona_dato_basico": {"created": [], "updated": [], "deleted": []},
-    "persona_estilos_vida_conducta": {"created": [], "updated": [], "deleted": []},
-    "persona_maternidad": {"created": [], "updated": [], "deleted": []},
-    "persona_practicas_salud_salud_sexual": {"created": [], "updated": [], "deleted": []},
-}
-
-    # --- Procesar Cambios en Familias (aps_ficha_familia) ---
-    if 'familias' in changes:
-        # Inserciones (CREATED)
-        for item in changes['familias'].get('created', []):
-            local_id = item.pop('id') # El ID local de la app móvil
-            # Pop los campos de sincronización que no van a la DB MySQL directamente
-            item.pop('remote_id', None)
-            mobile_last_modified_at = item.pop('last_modified_at', None) # Lo usaremos para el servidor si es nuevo
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            try:
-                # Crea un nuevo objeto familia con los datos recibidos
-                # Asegúrate de mapear los nombres de los campos correctamente
-                new_familia = ApsFichaFamilia(**item) # Esto asume que los keys de item coinciden con los nombres de las columnas
-                new_familia.created_at = datetime.datetime.fromisoformat(item.get('created_at'))
-                new_familia.updated_at = datetime.datetime.now() # Actualiza a la hora del servidor
-                
-                db.session.add(new_familia)
-                db.session.flush() # Para obtener el ID de MySQL antes del commit
-
-                sync_results['familias']['created'].append({
-                    "local_id": local_id,
-                    "remote_id": new_familia.id, # El nuevo ID generado por MySQL
-                    "new_last_modified_at": new_familia.updated_at.isoformat(), # Timestamp del servidor
-                    "status": "success"
-                })
-            except Exception as e:
-                db.session.rollback() # Deshace si hay un error
-                sync_results['familias']['created'].append({
-                    "local_id": local_id,
-                    "status": "failed",
-                    "error": str(e)
-                })
-
-        # Actualizaciones (UPDATED)
-        for item in changes['familias'].get('updated', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-            mobile_last_modified_at_str = item.pop('last_modified_at', None) # Timestamp del móvil
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            if not remote_id: # No debería ocurrir si es una actualización
-                sync_results['familias']['updated'].append({
-                    "local_id": local_id,
-                    "status": "failed",
-                    "error": "No remote_id provided for update"
-                })
-                continue
+        return jsonify({"message": "Usuario no encontrado para sincronización"}), 404
 
-            try:
-                familia_to_update = ApsFichaFamilia.query.get(remote_id)
-                if not familia_to_update:
-                    sync_results['familias']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "status": "failed",
-                        "error": "Record not found on server"
-                    })
-                    continue
-
-                # --- Resolución de Conflictos (Last Write Wins) ---
-                mobile_ts = datetime.datetime.fromisoformat(mobile_last_modified_at_str) if mobile_last_modified_at_str else datetime.datetime.min
-                server_ts = familia_to_update.updated_at # O el campo que uses como last_modified en MySQL
-
-                # Si server_ts es None o '0000-00-00', conviértelo a datetime.date.min para evitar errores
-                if not server_ts or str(server_ts) in ("0000-00-00", "None"):
-                    server_ts = datetime.date.min
-                elif not isinstance(server_ts, datetime.date):
-                    try:
-                        server_ts = server_ts.date()
-                    except Exception:
-                        server_ts = datetime.date.min
-
-                if datetime.datetime.combine(mobile_ts, datetime.time()) > datetime.datetime.combine(server_ts, datetime.time()): # Si la versión del móvil es más reciente
-                    for key, value in item.items():
-                        # Actualiza solo los campos que están en 'item'
-                        # Asegúrate de manejar los tipos de datos correctos
-                        if hasattr(familia_to_update, key):
-                            # Convierte fechas/datetime de string a objeto datetime si es necesario
-                            if 'created_at' in key or 'updated_at' in key: # Ejemplo de manejo de fechas
-                                setattr(familia_to_update, key, datetime.datetime.fromisoformat(value))
-                            else:
-                                setattr(familia_to_update, key, value)
-                    familia_to_update.updated_at = datetime.datetime.now() # Actualiza la fecha de modificación del servidor
-
-                    sync_results['familias']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": familia_to_update.updated_at.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "LWW"
-                    })
-                else: # La versión del servidor es igual o más reciente
-                    sync_results['familias']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": server_ts.isoformat(), # Devolver el timestamp del servidor
-                        "status": "success",
-                        "conflict_resolved": "skipped_older_mobile_version"
-                    })
-                    # Opcional: Podrías añadir la data actual del servidor para que el móvil la descargue
-                    # y resuelva el conflicto si es necesario.
-
-            except Exception as e:
-                db.session.rollback()
-                sync_results['familias']['updated'].append({
-                    "local_id": local_id,
-                    "remote_id": remote_id,
-                    "status": "failed",
-                    "error": str(e)
-                })
-
-        # Eliminaciones (DELETED - Soft Delete)
-        for item in changes['familias'].get('deleted', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-
-            if not remote_id:
-                sync_results['familias']['deleted'].append({
-                    "local_id": local_id,
-                    "status": "failed",
-                    "error": "No remote_id provided for deletion"
-                })
-                continue
+    try:
+        per_page = _parse_per_page()
+    except ValueError as e:
+        return jsonify({"message": str(e), "error": "invalid_per_page"}), 400
+    stream = request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+    formato = _response_format()
+    serializacion = _response_serialization()
+
+    # Las páginas siguientes heredan since y el snapshot del cursor
+    cursor = None
+    cursor_param = request.args.get('cursor')
+    if cursor_param:
+        try:
+            cursor = decode_sync_cursor(cursor_param)
+        except ValueError as e:
+            return jsonify({"message": str(e), "error": "invalid_cursor"}), 400
+        if cursor["since"] is None:
+            return jsonify({"message": "Cursor inválido: no corresponde a una sincronización incremental",
+                            "error": "invalid_cursor"}), 400
+        since = cursor["since"]
+    else:
+        since_param = request.args.get('since')
+        if not since_param:
+            return jsonify({"message": "Falta el parámetro 'since' (last_sync_timestamp de la sincronización anterior)",
+                            "error": "missing_since"}), 400
+        try:
+            since = datetime.datetime.fromisoformat(since_param)
+        except ValueError:
+            return jsonify({"message": f"Parámetro 'since' inválido: {since_param}", "error": "invalid_since"}), 400
+        if since.tzinfo is not None:
+            # Las fechas del servidor se guardan en hora local sin zona
+            since = since.astimezone().replace(tzinfo=None)
+
+    # Territorio del usuario: comunas de todos sus equipos
+    equipo_ids = [eu.equipo_id for eu in EquipoUser.query.filter_by(user_id=user.id).all()]
+    user_comuna_ids = [
+        ecc.base_comuna_corregimiento_id
+        for ecc in EquipoComunaCorregimiento.query.filter(
+            EquipoComunaCorregimiento.equipo_id.in_(equipo_ids)
+        ).distinct().all()
+    ] if equipo_ids else []
+
+    familias_con_cambios = families_changed_since(since)
+    tombstones = {"visitas": [], "personas": []}
+
+    if cursor is None:
+        as_of = datetime.datetime.now()
+        max_visita_id = db.session.query(func.max(ApsVisita.id)).scalar() or 0
+        after_familia_id = None
+        if user_comuna_ids:
+            total_visitas = count_latest_visits(user_comuna_ids, max_visita_id, familias_con_cambios)
+            tombstones = tombstones_since(user_comuna_ids, since)
+        else:
+            total_visitas = 0
+    else:
+        as_of = cursor["as_of"]
+        max_visita_id = cursor["max_visita_id"]
+        total_visitas = cursor["total"]
+        after_familia_id = cursor["familia_id"]
+
+    visitas_paginated_list = latest_visits_after(
+        user_comuna_ids, after_familia_id, per_page + 1, max_visita_id, familias_con_cambios
+    ) if user_comuna_ids else []
+    has_next = len(visitas_paginated_list) > per_page
+    visitas_paginated_list = visitas_paginated_list[:per_page]
+
+    sections = build_initial_data_sections(
+        visitas_paginated_list, since=since, fechas_nativas=(serializacion == 'msgpack'), max_visita_id=max_visita_id
+    )
+
+    last_row = visitas_paginated_list[-1] if visitas_paginated_list else None
+    envelope = {
+        "tombstones": tombstones,
+        "pagination_meta": {
+            "per_page": per_page,
+            "total": total_visitas,
+            "has_next": has_next,
+            "next_cursor": encode_sync_cursor(
+                last_row.aps_ficha_familia_id, as_of, max_visita_id, total_visitas, since=since
+            ) if has_next else None,
+            "as_of": as_of.isoformat(),
+            "since": since.isoformat()
+        },
+        "last_sync_timestamp": as_of.isoformat()
+    }
+    return transactional_data_response(envelope, sections, stream, formato, serializacion), 200
 
-            try:
-                familia_to_delete = ApsFichaFamilia.query.get(remote_id)
-                if not familia_to_delete:
-                    sync_results['familias']['deleted'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "status": "failed",
-                        "error": "Record not found on server for deletion"
-                    })
-                    continue
-
-                # Asumo que tienes una columna como 'vigencia_registro' o 'deleted_at'
-                # para realizar un soft delete. Si no, necesitarás añadirla a tu modelo.
-                # Ejemplo con 'vigencia_registro' (0 = inactivo/eliminado)
-                familia_to_delete.vigencia_registro = 0
-                familia_to_delete.updated_at = datetime.datetime.now() # Actualizar timestamp de modificación
-
-                sync_results['familias']['deleted'].append({
-                    "local_id": local_id,
-                    "remote_id": remote_id,
-                    "status": "success",
-                    "action": "soft_deleted",
-                    "new_last_modified_at": familia_to_delete.updated_at.isoformat()
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['familias']['deleted'].append({
-                    "local_id": local_id,
-                    "remote_id": remote_id,
-                    "status": "failed",
-                    "error": str(e)
-                })
-
-    # --- Procesar Cambios en Visitas (ApsVisita) ---
-    if 'visitas' in changes:
-        # Inserciones (CREATED)
-        for item in changes['visitas'].get('created', []):
-            local_id = item.pop('id')
-            item.pop('remote_id', None)
-            mobile_last_modified_at = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            try:
-                # Conversión de fechas de string a objeto Date
-                item['fecha_visita'] = datetime.datetime.fromisoformat(item['fecha_visita']).date()
-                item['created_at'] = datetime.datetime.fromisoformat(item['created_at']).date()
-                item['updated_at'] = datetime.datetime.now().date() # Fecha de creación/actualización del servidor
-
-                # Confirmar de que item['aps_ficha_familia_id'] sea el remote_id de la familia en MySQL
-                new_visita = ApsVisita(**item)
-                db.session.add(new_visita)
-                db.session.flush() # Obtener el ID de MySQL
-
-                sync_results['visitas']['created'].append({
-                    "local_id": local_id,
-                    "remote_id": new_visita.id,
-                    "new_last_modified_at": new_visita.updated_at.isoformat(),
-                    "status": "success"
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['visitas']['created'].append({
-                    "local_id": local_id,
-                    "status": "failed",
-                    "error": str(e)
-                })
-
-        # Actualizaciones (UPDATED)
-        for item in changes['visitas'].get('updated', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-            mobile_last_modified_at_str = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            if not remote_id:
-                sync_results['visitas']['updated'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
 
-            try:
-                visita_to_update = ApsVisita.query.get(remote_id)
-                if not visita_to_update:
-                    sync_results['visitas']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server"})
-                    continue
-
-                # Resolución de Conflictos (Last Write Wins)
-                mobile_ts = datetime.datetime.fromisoformat(mobile_last_modified_at_str).date() if mobile_last_modified_at_str else datetime.date.min
-                server_ts = visita_to_update.updated_at # Asegúrate de que este campo exista en tu modelo ApsVisita
-
-                # Si server_ts es None o '0000-00-00', conviértelo a datetime.date.min para evitar errores
-                if not server_ts or str(server_ts) in ("0000-00-00", "None"):
-                    server_ts = datetime.date.min
-                elif not isinstance(server_ts, datetime.date):
-                    try:
-                        server_ts = server_ts.date()
-                    except Exception:
-                        server_ts = datetime.date.min
-
-                if datetime.datetime.combine(mobile_ts, datetime.time()) > datetime.datetime.combine(server_ts, datetime.time()):
-                    for key, value in item.items():
-                        if hasattr(visita_to_update, key):
-                            if 'created_at' in key or 'updated_at' in key:
-                                setattr(visita_to_update, key, datetime.datetime.fromisoformat(value).date())
-                            else:
-                                setattr(visita_to_update, key, value)
-                    visita_to_update.updated_at = datetime.datetime.now().date()
-
-                    sync_results['visitas']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": visita_to_update.updated_at.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "LWW"
-                    })
-                else:
-                    sync_results['visitas']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": server_ts.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "skipped_older_mobile_version"
-                    })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['visitas']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-        # Eliminaciones (DELETED - Soft Delete)
-        for item in changes['visitas'].get('deleted', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-
-            if not remote_id:
-                sync_results['visitas']['deleted'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
-            
-            try:
-                visita_to_delete = ApsVisita.query.get(remote_id)
-                if not visita_to_delete:
-                    sync_results['visitas']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server for deletion"})
-                    continue
-
-                # Para ApsVisita, según el dump, podrías usar 'vigencia_registro' o 'valido' para soft delete.
-                # Usaremos 'valido' para marcarla como inválida (eliminada lógicamente).
-                visita_to_delete.valido = False # O 0, si es TINYINT(1)
-                visita_to_delete.updated_at = datetime.datetime.now().date() # Actualizar fecha de modificación
-                visita_to_delete.invalidated_at = datetime.datetime.now().date() # Campo específico de la tabla para invalidación
-                visita_to_delete.invalidated_by = user.id # Asignar el usuario que la invalida
-
-                sync_results['visitas']['deleted'].append({
-                    "local_id": local_id,
-                    "remote_id": remote_id,
-                    "status": "success",
-                    "action": "soft_deleted",
-                    "new_last_modified_at": visita_to_delete.updated_at.isoformat()
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['visitas']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-    # --- Procesar Cambios en Personas (ApsPersona) ---
-    if 'personas' in changes:
-        # Inserciones (CREATED)
-        for item in changes['personas'].get('created', []):
-            local_id = item.pop('id')
-            # Pop los campos de sincronización que no van a la DB MySQL directamente
-            item.pop('remote_id', None)
-            mobile_last_modified_at = item.pop('last_modified_at', None) # Lo usaremos para el servidor si es nuevo
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            try:
-                # Conversión de fechas de string a objeto Date o DateTime
-                item['fecha_registro'] = datetime.datetime.fromisoformat(item['fecha_registro']).date()
-                item['created_at'] = datetime.datetime.fromisoformat(item['created_at']).date()
-                # updated_at será la fecha actual del servidor al insertar
-                item['updated_at'] = datetime.datetime.now().date()
-                
-                # Asegúrate de que los campos aps_ficha_familia_id, created_by, updated_by existan y sean válidos
-                # Para aps_ficha_familia_id, la app móvil debería enviar el remote_id de la familia a la que pertenece
-                # Si la familia es nueva y se creó en la misma sincronización, la app debe mapear el ID local temporal de la familia al ID local de la persona
-                # y luego el backend debe resolver esto con el remote_id de la familia.
-                # Por simplicidad aquí, asumimos que item['aps_ficha_familia_id'] ya es el remote_id de MySQL.
-                
-                new_persona = ApsPersona(**item)
-                db.session.add(new_persona)
-                db.session.flush() # Obtener el ID de MySQL antes del commit
-
-                sync_results['personas']['created'].append({
-                    "local_id": local_id,
-                    "remote_id": new_persona.id,
-                    "new_last_modified_at": new_persona.updated_at.isoformat(),
-                    "status": "success"
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['personas']['created'].append({
-                    "local_id": local_id,
-                    "status": "failed",
-                    "error": str(e)
-                })
-
-        # Actualizaciones (UPDATED)
-        for item in changes['personas'].get('updated', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-            mobile_last_modified_at_str = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            if not remote_id:
-                sync_results['personas']['updated'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
+# --- Endpoint para Sincronización de Cambios (POST) ---
+@sync_bp.route("/changes", methods=["POST"])
+@jwt_required()
+def post_changes():
+    current_user_identity_username = get_jwt_identity()
+    user = User.query.filter_by(username=current_user_identity_username).first()
 
-            try:
-                persona_to_update = ApsPersona.query.get(remote_id)
-                if not persona_to_update:
-                    sync_results['personas']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server"})
-                    continue
-
-                # Resolución de Conflictos (Last Write Wins)
-                mobile_ts = datetime.datetime.fromisoformat(mobile_last_modified_at_str).date() if mobile_last_modified_at_str else datetime.date.min
-                server_ts = persona_to_update.updated_at # Asegúrate de que este campo exista en tu modelo ApsPersona
-
-                # Si server_ts es None o '0000-00-00', conviértelo a datetime.date.min para evitar errores
-                if not server_ts or str(server_ts) in ("0000-00-00", "None"):
-                    server_ts = datetime.date.min
-                elif not isinstance(server_ts, datetime.date):
-                    try:
-                        server_ts = server_ts.date()
-                    except Exception:
-                        server_ts = datetime.date.min
-
-                if datetime.datetime.combine(mobile_ts, datetime.time()) > datetime.datetime.combine(server_ts, datetime.time()):
-                    for key, value in item.items():
-                        if hasattr(persona_to_update, key):
-                            # Manejar conversión de tipos si es necesario, especialmente para fechas
-                            if 'created_at' in key or 'updated_at' in key:
-                                setattr(persona_to_update, key, datetime.datetime.fromisoformat(value).date())
-                            else:
-                                setattr(persona_to_update, key, value)
-                    persona_to_update.updated_at = datetime.datetime.now().date() # Fecha de actualización del servidor
-
-                    sync_results['personas']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": persona_to_update.updated_at.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "LWW"
-                    })
-                else:
-                    sync_results['personas']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": server_ts.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "skipped_older_mobile_version"
-                    })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['personas']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-        # Eliminaciones (DELETED - Soft Delete)
-        for item in changes['personas'].get('deleted', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-
-            if not remote_id:
-                sync_results['personas']['deleted'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
-            
-            try:
-                persona_to_delete = ApsPersona.query.get(remote_id)
-                if not persona_to_delete:
-                    sync_results['personas']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server for deletion"})
-                    continue
-
-                # Asumo que aps_persona tiene una columna 'vigencia_registro' o similar para soft delete.
-                # Si no, necesitarás añadirla a tu modelo y base de datos.
-                persona_to_delete.vigencia_registro = False # O 0, si usas TINYINT en MySQL
-                persona_to_delete.updated_at = datetime.datetime.now().date() # Actualizar fecha de modificación
-
-                sync_results['personas']['deleted'].append({
-                    "local_id": local_id,
-                    "remote_id": remote_id,
-                    "status": "success",
-                    "action": "soft_deleted",
-                    "new_last_modified_at": persona_to_delete.updated_at.isoformat()
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['personas']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-    # --- Procesar Cambios en Ubicaciones_Familia (ApsUbicacionFamilia) ---
-    if 'ubicaciones_familia' in changes:
-        # Inserciones (CREATED)
-        for item in changes['ubicaciones_familia'].get('created', []):
-            local_id = item.pop('id')
-            item.pop('remote_id', None)
-            mobile_last_modified_at = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None) # Asegúrate de que no se envíe deleted_at si es una creación
-
-            try:
-                # Conversión de fechas de string a objeto Date
-                item['created_at'] = datetime.datetime.fromisoformat(item['created_at']).date()
-                item['updated_at'] = datetime.datetime.now().date() # Fecha de creación/actualización del servidor
-                
-                # Asegúrate de que item['aps_visita_id'] sea el remote_id de la visita en MySQL
-                # Y que base_comuna_corregimiento_id y base_barrio_vereda_id sean IDs válidos de MySQL
-                new_ubicacion = ApsUbicacionFamilia(**item)
-                db.session.add(new_ubicacion)
-                db.session.flush() # Obtener el ID de MySQL
-
-                sync_results['ubicaciones_familia']['created'].append({
-                    "local_id": local_id,
-                    "remote_id": new_ubicacion.id,
-                    "new_last_modified_at": new_ubicacion.updated_at.isoformat(),
-                    "status": "success"
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['ubicaciones_familia']['created'].append({
-                    "local_id": local_id,
-                    "status": "failed",
-                    "error": str(e)
-                })
-
-        # Actualizaciones (UPDATED)
-        for item in changes['ubicaciones_familia'].get('updated', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-            mobile_last_modified_at_str = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            if not remote_id:
-                sync_results['ubicaciones_familia']['updated'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
+    if not user:
+        return jsonify({"message": "Usuario no encontrado para sincronización"}), 401
 
-            try:
-                ubicacion_to_update = ApsUbicacionFamilia.query.get(remote_id)
-                if not ubicacion_to_update:
-                    sync_results['ubicaciones_familia']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server"})
-                    continue
-
-                # Resolución de Conflictos (Last Write Wins)
-                mobile_ts = datetime.datetime.fromisoformat(mobile_last_modified_at_str).date() if mobile_last_modified_at_str else datetime.date.min
-                server_ts = ubicacion_to_update.updated_at # Asegúrate de que este campo exista en tu modelo
-
-                # Si server_ts es None o '0000-00-00', conviértelo a datetime.date.min para evitar errores
-                if not server_ts or str(server_ts) in ("0000-00-00", "None"):
-                    server_ts = datetime.date.min
-                elif not isinstance(server_ts, datetime.date):
-                    try:
-                        server_ts = server_ts.date()
-                    except Exception:
-                        server_ts = datetime.date.min
-
-                if datetime.datetime.combine(mobile_ts, datetime.time()) > datetime.datetime.combine(server_ts, datetime.time()):
-                    for key, value in item.items():
-                        if hasattr(ubicacion_to_update, key):
-                            if 'created_at' in key or 'updated_at' in key:
-                                setattr(ubicacion_to_update, key, datetime.datetime.fromisoformat(value).date())
-                            else:
-                                setattr(ubicacion_to_update, key, value)
-                    ubicacion_to_update.updated_at = datetime.datetime.now().date()
-
-                    sync_results['ubicaciones_familia']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": ubicacion_to_update.updated_at.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "LWW"
-                    })
-                else:
-                    sync_results['ubicaciones_familia']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": server_ts.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "skipped_older_mobile_version"
-                    })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['ubicaciones_familia']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-        # Eliminaciones (DELETED - Soft Delete)
-        for item in changes['ubicaciones_familia'].get('deleted', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-
-            if not remote_id:
-                sync_results['ubicaciones_familia']['deleted'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
-            
-            try:
-                ubicacion_to_delete = ApsUbicacionFamilia.query.get(remote_id)
-                if not ubicacion_to_delete:
-                    sync_results['ubicaciones_familia']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server for deletion"})
-                    continue
-
-                # Soft delete: Actualiza la columna 'deleted_at'
-                ubicacion_to_delete.deleted_at = datetime.datetime.now().date()
-                ubicacion_to_delete.updated_at = datetime.datetime.now().date() # También actualiza el updated_at
-
-                sync_results['ubicaciones_familia']['deleted'].append({
-                    "local_id": local_id,
-                    "remote_id": remote_id,
-                    "status": "success",
-                    "action": "soft_deleted",
-                    "new_last_modified_at": ubicacion_to_delete.updated_at.isoformat()
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['ubicaciones_familia']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-    # --- Procesar Cambios en aps_persona_antecedente_medico ---
-    if 'persona_antecedente_medico' in changes:
-        # Inserciones (CREATED)
-        for item in changes['persona_antecedente_medico'].get('created', []):
-            local_id = item.pop('id')
-            item.pop('remote_id', None)
-            mobile_last_modified_at = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            try:
-                item['created_at'] = datetime.datetime.fromisoformat(item['created_at']).date()
-                item['updated_at'] = datetime.datetime.now().date()
-                
-                # Asegúrate de que aps_persona_id y aps_visita_id sean los remote_id de MySQL
-                new_antecedente = ApsPersonaAntecedenteMedico(**item)
-                db.session.add(new_antecedente)
-                db.session.flush()
-
-                sync_results['persona_antecedente_medico']['created'].append({
-                    "local_id": local_id,
-                    "remote_id": new_antecedente.id,
-                    "new_last_modified_at": new_antecedente.updated_at.isoformat(),
-                    "status": "success"
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_antecedente_medico']['created'].append({
-                    "local_id": local_id,
-                    "status": "failed",
-                    "error": str(e)
-                })
-
-        # Actualizaciones (UPDATED)
-        for item in changes['persona_antecedente_medico'].get('updated', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-            mobile_last_modified_at_str = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            if not remote_id:
-                sync_results['persona_antecedente_medico']['updated'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
+    # Tamaño máximo del cuerpo: se corta con 413 también si llega sin Content-Length (chunked)
+    request.max_content_length = current_app.config.get('SYNC_MAX_BODY_BYTES')
+
+    # Los cuerpos JSON grandes (o de tamaño desconocido) se leen de forma incremental y sus
+    # items se aplican a medida que llegan, sin materializar el documento (ver stream_parser)
+    incremental = request.is_json and (
+        request.content_length is None
+        or request.content_length >= current_app.config.get('SYNC_STREAM_MIN_BODY_BYTES', 1024 * 1024)
+    )
+    max_item_bytes = current_app.config.get('SYNC_STREAM_MAX_ITEM_BYTES', MAX_ITEM_BYTES)
+    clave = request.headers.get('Idempotency-Key')
+    idempotente = bool(clave) and idempotency_available()
+    asincrono = 'respond-async' in request.headers.get('Prefer', '') or request.args.get('async') in ('1', 'true')
+
+    changes = cuerpo = huella = None
+    if incremental:
+        cuerpo = request.stream
+        if idempotente or asincrono:
+            # La huella y el trabajo asíncrono necesitan el cuerpo completo: se copia a un
+            # archivo temporal en lugar de cargarlo en memoria
+            cuerpo, huella = spool_body(request.stream)
+    # Recibe los cambios del móvil en JSON o, con Content-Type: application/msgpack, en MessagePack
+    elif request.mimetype in MSGPACK_MIMETYPES:
+        if not msgpack_available():
+            return jsonify({"message": "El servidor no tiene soporte para msgpack", "error": "unsupported_media_type"}), 415
+        try:
+            changes = unpackb(request.get_data())
+        except ValueError as e:
+            return jsonify({"message": str(e), "error": "invalid_body"}), 400
+    else:
+        changes = request.json
+
+    # Cargas grandes en modo asíncrono (Prefer: respond-async o ?async=1): se guardan, se
+    # responde 202 y el resultado se consulta en GET /jobs/<id>
+    if asincrono:
+        items = count_change_items(changes) if changes is not None else count_stream_items(cuerpo, max_item_bytes)
+        asincrono = items >= current_app.config.get('SYNC_ASYNC_MIN_ITEMS', 500)
+
+    # Lote idempotente (header Idempotency-Key): un reintento del mismo lote devuelve el
+    # resultado guardado en lugar de volver a aplicar los cambios
+    lote_id = None
+    if idempotente:
+        huella = huella or request_fingerprint(request.get_data())
+        lote_id, previo = claim_batch(user, clave, huella)
+        if lote_id is None:
+            return batch_replay_response(previo, huella)
+
+    if asincrono:
+        trabajo = submit_changes_job(cuerpo if cuerpo is not None else request.get_data(), request.mimetype, user, items, lote_id)
+        return job_accepted_response(trabajo['job_id'], trabajo['status'])
 
-            try:
-                antecedente_to_update = ApsPersonaAntecedenteMedico.query.get(remote_id)
-                if not antecedente_to_update:
-                    sync_results['persona_antecedente_medico']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server"})
-                    continue
-
-                mobile_ts = datetime.datetime.fromisoformat(mobile_last_modified_at_str).date() if mobile_last_modified_at_str else datetime.date.min
-                server_ts = antecedente_to_update.updated_at
-
-                # Si server_ts es None o '0000-00-00', conviértelo a datetime.date.min para evitar errores
-                if not server_ts or str(server_ts) in ("0000-00-00", "None"):
-                    server_ts = datetime.date.min
-                elif not isinstance(server_ts, datetime.date):
-                    try:
-                        server_ts = server_ts.date()
-                    except Exception:
-                        server_ts = datetime.date.min
-
-                if datetime.datetime.combine(mobile_ts, datetime.time()) > datetime.datetime.combine(server_ts, datetime.time()):
-                    for key, value in item.items():
-                        if hasattr(antecedente_to_update, key):
-                            if 'created_at' in key or 'updated_at' in key:
-                                setattr(antecedente_to_update, key, datetime.datetime.fromisoformat(value).date())
-                            else:
-                                setattr(antecedente_to_update, key, value)
-                    antecedente_to_update.updated_at = datetime.datetime.now().date()
-
-                    sync_results['persona_antecedente_medico']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": antecedente_to_update.updated_at.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "LWW"
-                    })
-                else:
-                    sync_results['persona_antecedente_medico']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": server_ts.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "skipped_older_mobile_version"
-                    })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_antecedente_medico']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-        # Eliminaciones (DELETED - Soft Delete)
-        for item in changes['persona_antecedente_medico'].get('deleted', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-
-            if not remote_id:
-                sync_results['persona_antecedente_medico']['deleted'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
-            
-            try:
-                antecedente_to_delete = ApsPersonaAntecedenteMedico.query.get(remote_id)
-                if not antecedente_to_delete:
-                    sync_results['persona_antecedente_medico']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server for deletion"})
-                    continue
-
-                antecedente_to_delete.deleted_at = datetime.datetime.now().date()
-                antecedente_to_delete.updated_at = datetime.datetime.now().date()
-
-                sync_results['persona_antecedente_medico']['deleted'].append({
-                    "local_id": local_id,
-                    "remote_id": remote_id,
-                    "status": "success",
-                    "action": "soft_deleted",
-                    "new_last_modified_at": antecedente_to_delete.updated_at.isoformat()
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_antecedente_medico']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-    # --- Procesar Cambios en aps_persona_componente_mental ---
-    if 'persona_componente_mental' in changes:
-        # Inserciones (CREATED)
-        for item in changes['persona_componente_mental'].get('created', []):
-            local_id = item.pop('id')
-            item.pop('remote_id', None)
-            mobile_last_modified_at = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            try:
-                item['created_at'] = datetime.datetime.fromisoformat(item['created_at']).date()
-                item['updated_at'] = datetime.datetime.now().date()
-                
-                # Asegúrate de que aps_persona_id y aps_visita_id sean los remote_id de MySQL
-                new_componente = ApsPersonaComponenteMental(**item)
-                db.session.add(new_componente)
-                db.session.flush()
-
-                sync_results['persona_componente_mental']['created'].append({
-                    "local_id": local_id,
-                    "remote_id": new_componente.id,
-                    "new_last_modified_at": new_componente.updated_at.isoformat(),
-                    "status": "success"
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_componente_mental']['created'].append({
-                    "local_id": local_id,
-                    "status": "failed",
-                    "error": str(e)
-                })
-
-        # Actualizaciones (UPDATED)
-        for item in changes['persona_componente_mental'].get('updated', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-            mobile_last_modified_at_str = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            if not remote_id:
-                sync_results['persona_componente_mental']['updated'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
+    try:
+        if changes is None:
+            sync_results = process_change_stream(iter_change_items(cuerpo, max_item_bytes=max_item_bytes), user)
+        else:
+            sync_results = process_changes(changes, user)
+        # En la misma transacción que los cambios: o se guardan ambos o ninguno. Si otro request
+        # retomó el lote (claim_batch) y lo confirmó antes, estos cambios se descartan
+        if lote_id and not finish_batch(lote_id, sync_results):
+            db.session.rollback()
+            return batch_replay_response(db.session.get(SyncBatch, lote_id), huella)
+        commit_changes(sync_results)
+    except Exception as e:
+        db.session.rollback()
+        if lote_id:
+            release_batch(lote_id)
+        if isinstance(e, (InvalidChangesBody, RequestEntityTooLarge)):
+            raise  # Cuerpo inválido o demasiado grande: ver los errorhandler del blueprint
+        return jsonify({"message": "Error al guardar cambios en la base de datos", "error": str(e)}), 500
 
-            try:
-                componente_to_update = ApsPersonaComponenteMental.query.get(remote_id)
-                if not componente_to_update:
-                    sync_results['persona_componente_mental']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server"})
-                    continue
-
-                mobile_ts = datetime.datetime.fromisoformat(mobile_last_modified_at_str).date() if mobile_last_modified_at_str else datetime.date.min
-                server_ts = componente_to_update.updated_at
-
-                # Si server_ts es None o '0000-00-00', conviértelo a datetime.date.min para evitar errores
-                if not server_ts or str(server_ts) in ("0000-00-00", "None"):
-                    server_ts = datetime.date.min
-                elif not isinstance(server_ts, datetime.date):
-                    try:
-                        server_ts = server_ts.date()
-                    except Exception:
-                        server_ts = datetime.date.min
-
-                if datetime.datetime.combine(mobile_ts, datetime.time()) > datetime.datetime.combine(server_ts, datetime.time()):
-                    for key, value in item.items():
-                        if hasattr(componente_to_update, key):
-                            if 'created_at' in key or 'updated_at' in key:
-                                setattr(componente_to_update, key, datetime.datetime.fromisoformat(value).date())
-                            else:
-                                setattr(componente_to_update, key, value)
-                    componente_to_update.updated_at = datetime.datetime.now().date()
-
-                    sync_results['persona_componente_mental']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": componente_to_update.updated_at.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "LWW"
-                    })
-                else:
-                    sync_results['persona_componente_mental']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": server_ts.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "skipped_older_mobile_version"
-                    })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_componente_mental']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-        # Eliminaciones (DELETED - Soft Delete)
-        for item in changes['persona_componente_mental'].get('deleted', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-
-            if not remote_id:
-                sync_results['persona_componente_mental']['deleted'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
-            
-            try:
-                componente_to_delete = ApsPersonaComponenteMental.query.get(remote_id)
-                if not componente_to_delete:
-                    sync_results['persona_componente_mental']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server for deletion"})
-                    continue
-
-                componente_to_delete.deleted_at = datetime.datetime.now().date()
-                componente_to_delete.updated_at = datetime.datetime.now().date()
-
-                sync_results['persona_componente_mental']['deleted'].append({
-                    "local_id": local_id,
-                    "remote_id": remote_id,
-                    "status": "success",
-                    "action": "soft_deleted",
-                    "new_last_modified_at": componente_to_delete.updated_at.isoformat()
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_componente_mental']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-    # --- Procesar Cambios en aps_persona_condiciones_salud ---
-    if 'persona_condiciones_salud' in changes:
-        # Inserciones (CREATED)
-        for item in changes['persona_condiciones_salud'].get('created', []):
-            local_id = item.pop('id')
-            item.pop('remote_id', None)
-            mobile_last_modified_at = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            try:
-                # Conversión de fechas
-                item['created_at'] = datetime.datetime.fromisoformat(item['created_at']).date()
-                item['updated_at'] = datetime.datetime.now().date()
-                if 'fecha_programada_citologia_cervico_uterina' in item and item['fecha_programada_citologia_cervico_uterina']:
-                    item['fecha_programada_citologia_cervico_uterina'] = datetime.datetime.fromisoformat(item['fecha_programada_citologia_cervico_uterina']).date()
-                
-                # Asegúrate de que aps_persona_id y aps_visita_id sean los remote_id de MySQL
-                new_condicion_salud = ApsPersonaCondicionesSalud(**item)
-                db.session.add(new_condicion_salud)
-                db.session.flush()
-
-                sync_results['persona_condiciones_salud']['created'].append({
-                    "local_id": local_id,
-                    "remote_id": new_condicion_salud.id,
-                    "new_last_modified_at": new_condicion_salud.updated_at.isoformat(),
-                    "status": "success"
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_condiciones_salud']['created'].append({
-                    "local_id": local_id,
-                    "status": "failed",
-                    "error": str(e)
-                })
-
-        # Actualizaciones (UPDATED)
-        for item in changes['persona_condiciones_salud'].get('updated', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-            mobile_last_modified_at_str = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            if not remote_id:
-                sync_results['persona_condiciones_salud']['updated'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
+    return jsonify({"message": "Sincronización de cambios procesada", "sync_results": sync_results}), 200
 
-            try:
-                condicion_salud_to_update = ApsPersonaCondicionesSalud.query.get(remote_id)
-                if not condicion_salud_to_update:
-                    sync_results['persona_condiciones_salud']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server"})
-                    continue
-
-                mobile_ts = datetime.datetime.fromisoformat(mobile_last_modified_at_str).date() if mobile_last_modified_at_str else datetime.date.min
-                server_ts = condicion_salud_to_update.updated_at
-
-                # Si server_ts es None o '0000-00-00', conviértelo a datetime.date.min para evitar errores
-                if not server_ts or str(server_ts) in ("0000-00-00", "None"):
-                    server_ts = datetime.date.min
-                elif not isinstance(server_ts, datetime.date):
-                    try:
-                        server_ts = server_ts.date()
-                    except Exception:
-                        server_ts = datetime.date.min
-
-                # Si server_ts es None o '0000-00-00', conviértelo a datetime.date.min para evitar errores
-                if not server_ts or str(server_ts) in ("0000-00-00", "None"):
-                    server_ts = datetime.date.min
-                elif not isinstance(server_ts, datetime.date):
-                    try:
-                        server_ts = server_ts.date()
-                    except Exception:
-                        server_ts = datetime.date.min
-
-                if datetime.datetime.combine(mobile_ts, datetime.time()) > datetime.datetime.combine(server_ts, datetime.time()):
-                    for key, value in item.items():
-                        if hasattr(condicion_salud_to_update, key):
-                            if 'created_at' in key or 'updated_at' in key:
-                                setattr(condicion_salud_to_update, key, datetime.datetime.fromisoformat(value).date() if value else None)
-                            else:
-                                setattr(condicion_salud_to_update, key, value)
-                    condicion_salud_to_update.updated_at = datetime.datetime.now().date()
-
-                    sync_results['persona_condiciones_salud']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": condicion_salud_to_update.updated_at.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "LWW"
-                    })
-                else:
-                    sync_results['persona_condiciones_salud']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": server_ts.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "skipped_older_mobile_version"
-                    })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_condiciones_salud']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-        # Eliminaciones (DELETED - Soft Delete)
-        for item in changes['persona_condiciones_salud'].get('deleted', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-
-            if not remote_id:
-                sync_results['persona_condiciones_salud']['deleted'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
-            
-            try:
-                condicion_salud_to_delete = ApsPersonaCondicionesSalud.query.get(remote_id)
-                if not condicion_salud_to_delete:
-                    sync_results['persona_condiciones_salud']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server for deletion"})
-                    continue
-
-                condicion_salud_to_delete.deleted_at = datetime.datetime.now().date()
-                condicion_salud_to_delete.updated_at = datetime.datetime.now().date()
-
-                sync_results['persona_condiciones_salud']['deleted'].append({
-                    "local_id": local_id,
-                    "remote_id": remote_id,
-                    "status": "success",
-                    "action": "soft_deleted",
-                    "new_last_modified_at": condicion_salud_to_update.updated_at.isoformat()
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_condiciones_salud']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-    # --- Procesar Cambios en aps_persona_dato_basico ---
-    if 'persona_dato_basico' in changes:
-        # Inserciones (CREATED)
-        for item in changes['persona_dato_basico'].get('created', []):
-            local_id = item.pop('id')
-            item.pop('remote_id', None)
-            mobile_last_modified_at = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            try:
-                item['created_at'] = datetime.datetime.fromisoformat(item['created_at']).date()
-                item['updated_at'] = datetime.datetime.now().date()
-                
-                # Asegúrate de que aps_persona_id, aps_visita_id y eps_id sean los remote_id de MySQL
-                new_dato_basico = ApsPersonaDatoBasico(**item)
-                db.session.add(new_dato_basico)
-                db.session.flush()
-
-                sync_results['persona_dato_basico']['created'].append({
-                    "local_id": local_id,
-                    "remote_id": new_dato_basico.id,
-                    "new_last_modified_at": new_dato_basico.updated_at.isoformat(),
-                    "status": "success"
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_dato_basico']['created'].append({
-                    "local_id": local_id,
-                    "status": "failed",
-                    "error": str(e)
-                })
-
-        # Actualizaciones (UPDATED)
-        for item in changes['persona_dato_basico'].get('updated', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-            mobile_last_modified_at_str = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            if not remote_id:
-                sync_results['persona_dato_basico']['updated'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
 
-            try:
-                dato_basico_to_update = ApsPersonaDatoBasico.query.get(remote_id)
-                if not dato_basico_to_update:
-                    sync_results['persona_dato_basico']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server"})
-                    continue
-
-                mobile_ts = datetime.datetime.fromisoformat(mobile_last_modified_at_str).date() if mobile_last_modified_at_str else datetime.date.min
-                server_ts = dato_basico_to_update.updated_at
-
-                # Si server_ts es None o '0000-00-00', conviértelo a datetime.date.min para evitar errores
-                if not server_ts or str(server_ts) in ("0000-00-00", "None"):
-                    server_ts = datetime.date.min
-                elif not isinstance(server_ts, datetime.date):
-                    try:
-                        server_ts = server_ts.date()
-                    except Exception:
-                        server_ts = datetime.date.min
-
-                if datetime.datetime.combine(mobile_ts, datetime.time()) > datetime.datetime.combine(server_ts, datetime.time()):
-                    for key, value in item.items():
-                        if hasattr(dato_basico_to_update, key):
-                            if 'created_at' in key or 'updated_at' in key:
-                                setattr(dato_basico_to_update, key, datetime.datetime.fromisoformat(value).date() if value else None)
-                            else:
-                                setattr(dato_basico_to_update, key, value)
-                    dato_basico_to_update.updated_at = datetime.datetime.now().date()
-
-                    sync_results['persona_dato_basico']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": dato_basico_to_update.updated_at.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "LWW"
-                    })
-                else:
-                    sync_results['persona_dato_basico']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": server_ts.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "skipped_older_mobile_version"
-                    })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_dato_basico']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-        # Eliminaciones (DELETED - Soft Delete)
-        for item in changes['persona_dato_basico'].get('deleted', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-
-            if not remote_id:
-                sync_results['persona_dato_basico']['deleted'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
-            
-            try:
-                dato_basico_to_delete = ApsPersonaDatoBasico.query.get(remote_id)
-                if not dato_basico_to_delete:
-                    sync_results['persona_dato_basico']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server for deletion"})
-                    continue
-
-                dato_basico_to_delete.deleted_at = datetime.datetime.now().date()
-                dato_basico_to_delete.updated_at = datetime.datetime.now().date()
-
-                sync_results['persona_dato_basico']['deleted'].append({
-                    "local_id": local_id,
-                    "remote_id": remote_id,
-                    "status": "success",
-                    "action": "soft_deleted",
-                    "new_last_modified_at": dato_basico_to_delete.updated_at.isoformat()
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_dato_basico']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-    # --- Procesar Cambios en aps_persona_estilos_vida_conducta ---
-    if 'persona_estilos_vida_conducta' in changes:
-        # Inserciones (CREATED)
-        for item in changes['persona_estilos_vida_conducta'].get('created', []):
-            local_id = item.pop('id')
-            item.pop('remote_id', None)
-            mobile_last_modified_at = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            try:
-                # Conversión de fechas y floats
-                item['created_at'] = datetime.datetime.fromisoformat(item['created_at']).date()
-                item['updated_at'] = datetime.datetime.now().date()
-                # Asegúrate de convertir los floats si vienen como string (aunque jsonify los mantiene como número)
-                if 'peso' in item and item['peso'] is not None: item['peso'] = float(item['peso'])
-                if 'talla' in item and item['talla'] is not None: item['talla'] = float(item['talla'])
-                if 'valor_imc' in item and item['valor_imc'] is not None: item['valor_imc'] = float(item['valor_imc'])
-                
-                # Asegúrate de que aps_persona_id y aps_visita_id sean los remote_id de MySQL
-                new_estilo_vida = ApsPersonaEstilosVidaConducta(**item)
-                db.session.add(new_estilo_vida)
-                db.session.flush()
-
-                sync_results['persona_estilos_vida_conducta']['created'].append({
-                    "local_id": local_id,
-                    "remote_id": new_estilo_vida.id,
-                    "new_last_modified_at": new_estilo_vida.updated_at.isoformat(),
-                    "status": "success"
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_estilos_vida_conducta']['created'].append({
-                    "local_id": local_id,
-                    "status": "failed",
-                    "error": str(e)
-                })
-
-        # Actualizaciones (UPDATED)
-        for item in changes['persona_estilos_vida_conducta'].get('updated', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-            mobile_last_modified_at_str = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            if not remote_id:
-                sync_results['persona_estilos_vida_conducta']['updated'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
+def job_accepted_response(job_id, status):
+    """Respuesta 202 de un POST /changes encolado como trabajo asíncrono."""
+    status_url = url_for('sync_bp.get_job', job_id=job_id)
+    return jsonify({
+        "message": "Cambios recibidos; se procesarán en segundo plano",
+        "job_id": job_id,
+        "status": status,
+        "status_url": status_url
+    }), 202, {"Location": status_url}
+
+
+def batch_replay_response(lote, huella):
+    """
+    Respuesta a un POST /changes con una Idempotency-Key ya usada.
+
+    Args:
+        lote (SyncBatch | None): Lote registrado con esa clave (None si se liberó recién).
+        huella (str): request_fingerprint del cuerpo recibido.
+    """
+    if lote is not None and lote.request_hash != huella:
+        return jsonify({"message": "La Idempotency-Key ya se usó con otro contenido",
+                        "error": "idempotency_key_reused"}), 422
+    if lote is not None and lote.status == LOTE_TERMINADO:
+        return jsonify({"message": "Sincronización de cambios procesada",
+                        "sync_results": json.loads(lote.sync_results)}), 200, {"Idempotent-Replayed": "true"}
+    if lote is not None and lote.job_id:
+        trabajo = read_job(lote.job_id)
+        return job_accepted_response(lote.job_id, trabajo['status'] if trabajo else ESTADO_EN_COLA)
+    return jsonify({"message": "El lote se está procesando; reintente más tarde",
+                    "error": "batch_in_progress"}), 409, {"Retry-After": "5"}
+
+
+# --- Estado de un trabajo asíncrono de POST /changes ---
+@sync_bp.route("/jobs/<job_id>", methods=["GET"])
+@jwt_required()
+def get_job(job_id):
+    current_user_identity_username = get_jwt_identity()
+    user = User.query.filter_by(username=current_user_identity_username).first()
 
-            try:
-                estilo_vida_to_update = ApsPersonaEstilosVidaConducta.query.get(remote_id)
-                if not estilo_vida_to_update:
-                    sync_results['persona_estilos_vida_conducta']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server"})
-                    continue
-
-                mobile_ts = datetime.datetime.fromisoformat(mobile_last_modified_at_str).date() if mobile_last_modified_at_str else datetime.date.min
-                server_ts = estilo_vida_to_update.updated_at
-
-                # Si server_ts es None o '0000-00-00', conviértelo a datetime.date.min para evitar errores
-                if not server_ts or str(server_ts) in ("0000-00-00", "None"):
-                    server_ts = datetime.date.min
-                elif not isinstance(server_ts, datetime.date):
-                    try:
-                        server_ts = server_ts.date()
-                    except Exception:
-                        server_ts = datetime.date.min
-
-                if datetime.datetime.combine(mobile_ts, datetime.time()) > datetime.datetime.combine(server_ts, datetime.time()):
-                    for key, value in item.items():
-                        if hasattr(estilo_vida_to_update, key):
-                            if 'created_at' in key or 'updated_at' in key:
-                                setattr(estilo_vida_to_update, key, datetime.datetime.fromisoformat(value).date() if value else None)
-                            elif key in ['peso', 'talla', 'valor_imc'] and value is not None: # Convertir floats
-                                setattr(estilo_vida_to_update, key, float(value))
-                            else:
-                                setattr(estilo_vida_to_update, key, value)
-                    estilo_vida_to_update.updated_at = datetime.datetime.now().date()
-
-                    sync_results['persona_estilos_vida_conducta']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": estilo_vida_to_update.updated_at.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "LWW"
-                    })
-                else:
-                    sync_results['persona_estilos_vida_conducta']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": server_ts.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "skipped_older_mobile_version"
-                    })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_estilos_vida_conducta']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-        # Eliminaciones (DELETED - Soft Delete)
-        for item in changes['persona_estilos_vida_conducta'].get('deleted', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-
-            if not remote_id:
-                sync_results['persona_estilos_vida_conducta']['deleted'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
-            
-            try:
-                estilo_vida_to_delete = ApsPersonaEstilosVidaConducta.query.get(remote_id)
-                if not estilo_vida_to_delete:
-                    sync_results['persona_estilos_vida_conducta']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server for deletion"})
-                    continue
-
-                estilo_vida_to_delete.deleted_at = datetime.datetime.now().date()
-                estilo_vida_to_delete.updated_at = datetime.datetime.now().date()
-
-                sync_results['persona_estilos_vida_conducta']['deleted'].append({
-                    "local_id": local_id,
-                    "remote_id": remote_id,
-                    "status": "success",
-                    "action": "soft_deleted",
-                    "new_last_modified_at": estilo_vida_to_delete.updated_at.isoformat()
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_estilos_vida_conducta']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-# --- Procesar Cambios en aps_persona_maternidad ---
-    if 'persona_maternidad' in changes:
-        # Inserciones (CREATED)
-        for item in changes['persona_maternidad'].get('created', []):
-            local_id = item.pop('id')
-            item.pop('remote_id', None)
-            mobile_last_modified_at = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            try:
-                # Conversión de fechas
-                item['created_at'] = datetime.datetime.fromisoformat(item['created_at']).date()
-                item['updated_at'] = datetime.datetime.now().date()
-                if 'fecha_probable_parto' in item and item['fecha_probable_parto']:
-                    item['fecha_probable_parto'] = datetime.datetime.fromisoformat(item['fecha_probable_parto']).date()
-                
-                # Asegúrate de que aps_persona_id y aps_visita_id sean los remote_id de MySQL
-                new_maternidad = ApsPersonaMaternidad(**item)
-                db.session.add(new_maternidad)
-                db.session.flush()
-
-                sync_results['persona_maternidad']['created'].append({
-                    "local_id": local_id,
-                    "remote_id": new_maternidad.id,
-                    "new_last_modified_at": new_maternidad.updated_at.isoformat(),
-                    "status": "success"
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_maternidad']['created'].append({
-                    "local_id": local_id,
-                    "status": "failed",
-                    "error": str(e)
-                })
-
-        # Actualizaciones (UPDATED)
-        for item in changes['persona_maternidad'].get('updated', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-            mobile_last_modified_at_str = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            if not remote_id:
-                sync_results['persona_maternidad']['updated'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
+    if not user:
+        return jsonify({"message": "Usuario no encontrado para sincronización"}), 401
 
-            try:
-                maternidad_to_update = ApsPersonaMaternidad.query.get(remote_id)
-                if not maternidad_to_update:
-                    sync_results['persona_maternidad']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server"})
-                    continue
-
-                mobile_ts = datetime.datetime.fromisoformat(mobile_last_modified_at_str).date() if mobile_last_modified_at_str else datetime.date.min
-                server_ts = maternidad_to_update.updated_at
-
-                # Si server_ts es None o '0000-00-00', conviértelo a datetime.date.min para evitar errores
-                if not server_ts or str(server_ts) in ("0000-00-00", "None"):
-                    server_ts = datetime.date.min
-                elif not isinstance(server_ts, datetime.date):
-                    try:
-                        server_ts = server_ts.date()
-                    except Exception:
-                        server_ts = datetime.date.min
-
-                if datetime.datetime.combine(mobile_ts, datetime.time()) > datetime.datetime.combine(server_ts, datetime.time()):
-                    for key, value in item.items():
-                        if hasattr(maternidad_to_update, key):
-                            if 'created_at' in key or 'updated_at' in key:
-                                setattr(maternidad_to_update, key, datetime.datetime.fromisoformat(value).date() if value else None)
-                            else:
-                                setattr(maternidad_to_update, key, value)
-                    maternidad_to_update.updated_at = datetime.datetime.now().date()
-
-                    sync_results['persona_maternidad']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": maternidad_to_update.updated_at.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "LWW"
-                    })
-                else:
-                    sync_results['persona_maternidad']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": server_ts.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "skipped_older_mobile_version"
-                    })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_maternidad']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-        # Eliminaciones (DELETED - Soft Delete)
-        for item in changes['persona_maternidad'].get('deleted', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-
-            if not remote_id:
-                sync_results['persona_maternidad']['deleted'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
-            
-            try:
-                maternidad_to_delete = ApsPersonaMaternidad.query.get(remote_id)
-                if not maternidad_to_delete:
-                    sync_results['persona_maternidad']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server for deletion"})
-                    continue
-
-                maternidad_to_delete.deleted_at = datetime.datetime.now().date()
-                maternidad_to_delete.updated_at = datetime.datetime.now().date()
-
-                sync_results['persona_maternidad']['deleted'].append({
-                    "local_id": local_id,
-                    "remote_id": remote_id,
-                    "status": "success",
-                    "action": "soft_deleted",
-                    "new_last_modified_at": maternidad_to_delete.updated_at.isoformat()
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_maternidad']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-    # --- Procesar Cambios en aps_persona_practicas_salud_salud_sexual ---
-    if 'persona_practicas_salud_salud_sexual' in changes:
-        # Inserciones (CREATED)
-        for item in changes['persona_practicas_salud_salud_sexual'].get('created', []):
-            local_id = item.pop('id')
-            item.pop('remote_id', None)
-            mobile_last_modified_at = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            try:
-                # Conversión de fechas
-                item['created_at'] = datetime.datetime.fromisoformat(item['created_at']).date()
-                item['updated_at'] = datetime.datetime.now().date()
-                if 'fecha_proxima_vacunacion' in item and item['fecha_proxima_vacunacion']:
-                    item['fecha_proxima_vacunacion'] = datetime.datetime.fromisoformat(item['fecha_proxima_vacunacion']).date()
-                
-                # Asegúrate de que aps_persona_id y aps_visita_id sean los remote_id de MySQL
-                new_practica = ApsPersonaPracticasSaludSaludSexual(**item)
-                db.session.add(new_practica)
-                db.session.flush()
-
-                sync_results['persona_practicas_salud_salud_sexual']['created'].append({
-                    "local_id": local_id,
-                    "remote_id": new_practica.id,
-                    "new_last_modified_at": new_practica.updated_at.isoformat(),
-                    "status": "success"
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_practicas_salud_salud_sexual']['created'].append({
-                    "local_id": local_id,
-                    "status": "failed",
-                    "error": str(e)
-                })
-
-        # Actualizaciones (UPDATED)
-        for item in changes['persona_practicas_salud_salud_sexual'].get('updated', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-            mobile_last_modified_at_str = item.pop('last_modified_at', None)
-            item.pop('is_synced', None)
-            item.pop('deleted_at', None)
-
-            if not remote_id:
-                sync_results['persona_practicas_salud_salud_sexual']['updated'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
+    trabajo = read_job(job_id)
+    # Un usuario solo ve sus propios trabajos
+    if not trabajo or trabajo['user_id'] != user.id:
+        return jsonify({"message": "Trabajo de sincronización no encontrado", "error": "job_not_found"}), 404
+
+    respuesta = {
+        "job_id": trabajo['job_id'],
+        "status": trabajo['status'],
+        "items": trabajo['items'],
+        "created_at": trabajo['created_at'],
+        "started_at": trabajo.get('started_at'),
+        "finished_at": trabajo.get('finished_at')
+    }
+    if trabajo['status'] == ESTADO_TERMINADO:
+        respuesta.update(message="Sincronización de cambios procesada", sync_results=trabajo['sync_results'])
+    elif trabajo['status'] == ESTADO_FALLIDO:
+        respuesta.update(message="Error al guardar cambios en la base de datos", error=trabajo['error'])
+    else:
+        respuesta["message"] = "Trabajo de sincronización en proceso"
+        return jsonify(respuesta), 200, {"Retry-After": "5"}
+    return jsonify(respuesta), 200
+
+
+# --- Contadores de POST /changes por tabla (ver app/sync/ingest.py) ---
+@sync_bp.route("/stats", methods=["GET"])
+@jwt_required()
+def get_sync_stats():
+    current_user_identity_username = get_jwt_identity()
+    user = User.query.filter_by(username=current_user_identity_username).first()
 
-            try:
-                practica_to_update = ApsPersonaPracticasSaludSaludSexual.query.get(remote_id)
-                if not practica_to_update:
-                    sync_results['persona_practicas_salud_salud_sexual']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server"})
-                    continue
-
-                mobile_ts = datetime.datetime.fromisoformat(mobile_last_modified_at_str).date() if mobile_last_modified_at_str else datetime.date.min
-                server_ts = practica_to_update.updated_at
-
-                # Si server_ts es None o '0000-00-00', conviértelo a datetime.date.min para evitar errores
-                if not server_ts or str(server_ts) in ("0000-00-00", "None"):
-                    server_ts = datetime.date.min
-                elif not isinstance(server_ts, datetime.date):
-                    try:
-                        server_ts = server_ts.date()
-                    except Exception:
-                        server_ts = datetime.date.min
-
-                if datetime.datetime.combine(mobile_ts, datetime.time()) > datetime.datetime.combine(server_ts, datetime.time()):
-                    for key, value in item.items():
-                        if hasattr(practica_to_update, key):
-                            if 'created_at' in key or 'updated_at' in key:
-                                setattr(practica_to_update, key, datetime.datetime.fromisoformat(value).date() if value else None)
-                            else:
-                                setattr(practica_to_update, key, value)
-                    practica_to_update.updated_at = datetime.datetime.now().date()
-
-                    sync_results['persona_practicas_salud_salud_sexual']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": practica_to_update.updated_at.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "LWW"
-                    })
-                else:
-                    sync_results['persona_practicas_salud_salud_sexual']['updated'].append({
-                        "local_id": local_id,
-                        "remote_id": remote_id,
-                        "new_last_modified_at": server_ts.isoformat(),
-                        "status": "success",
-                        "conflict_resolved": "skipped_older_mobile_version"
-                    })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_practicas_salud_salud_sexual']['updated'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-        # Eliminaciones (DELETED - Soft Delete)
-        for item in changes['persona_practicas_salud_salud_sexual'].get('deleted', []):
-            local_id = item.pop('id')
-            remote_id = item.pop('remote_id', None)
-
-            if not remote_id:
-                sync_results['persona_practicas_salud_salud_sexual']['deleted'].append({"local_id": local_id, "status": "failed", "error": "No remote_id provided"})
-                continue
-            
-            try:
-                practica_to_delete = ApsPersonaPracticasSaludSaludSexual.query.get(remote_id)
-                if not practica_to_delete:
-                    sync_results['persona_practicas_salud_salud_sexual']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": "Record not found on server for deletion"})
-                    continue
-
-                practica_to_delete.deleted_at = datetime.datetime.now().date()
-                practica_to_delete.updated_at = datetime.datetime.now().date()
-
-                sync_results['persona_practicas_salud_salud_sexual']['deleted'].append({
-                    "local_id": local_id,
-                    "remote_id": remote_id,
-                    "status": "success",
-                    "action": "soft_deleted",
-                    "new_last_modified_at": practica_to_delete.updated_at.isoformat()
-                })
-            except Exception as e:
-                db.session.rollback()
-                sync_results['persona_practicas_salud_salud_sexual']['deleted'].append({"local_id": local_id, "remote_id": remote_id, "status": "failed", "error": str(e)})
-
-    # --- Commit final de todos los cambios de la sesión ---
-    try:
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"message": "Error al guardar cambios en la base de datos", "error": str(e)}), 500
+    if not user:
+        return jsonify({"message": "Usuario no encontrado para sincronización"}), 401
 
-    return jsonify({"message": "Sincronización de cambios procesada", "sync_results": sync_results}), 200
\ No newline at end of file
+    return jsonify({"changes": throughput_stats()}), 200
\ No newline at end of file
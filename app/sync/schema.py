@@ -0,0 +1,174 @@
+# app/sync/schema.py
+# Definición única de las secciones de transactional_data.
+#
+# Cada sección se declara una vez con su modelo y los campos de sus filas. De esa declaración
+# salen las columnas que consulta build_initial_data_sections (app/sync/routes.py), los
+# serializadores compilados que arman las filas (app/sync/serializers.py) y el esquema del
+# formato columnar (SECTION_COLUMNS / DICTIONARY_COLUMNS, ver app/sync/columnar.py).
+from app.models import ApsFichaFamilia, ApsPersona, ApsVisita, ApsUbicacionFamilia, ApsCondicionesHabitatFamilia, \
+                       ApsPersonaAntecedenteMedico, ApsPersonaComponenteMental, ApsPersonaCondicionesSalud, \
+                       ApsPersonaDatoBasico, ApsPersonaEstilosVidaConducta, ApsPersonaMaternidad, \
+                       ApsPersonaPracticasSaludSaludSexual
+
+
+class Campo:
+    """
+    Campo de las filas de una sección.
+
+    Args:
+        clave (str): Clave en la fila.
+        columna (str, optional): Columna de la consulta de la que sale el valor (por defecto la
+            clave): una columna del modelo de la sección o el label de una columna de un join
+            que agrega build_initial_data_sections.
+        catalogo (str, optional): El valor es la descripción de la columna en este catálogo
+            {id: valor}: uno de app/sync/catalog_cache.py o uno que arma la sección para la
+            página (novedades, campos_actualizados, habitat_txt).
+        defecto: Valor si la columna está vacía o no está en el catálogo.
+        crudo (bool): Copiar el valor sin formato aunque el modelo declare la columna como fecha.
+        diccionario (bool): Texto traducido (catálogos, usuarios, oficinas...) con pocos valores
+            distintos que se repiten fila a fila; el formato columnar lo codifica con diccionario.
+    """
+
+    def __init__(self, clave, columna=None, catalogo=None, defecto='', crudo=False, diccionario=False):
+        self.clave = clave
+        self.columna = columna or clave
+        self.catalogo = catalogo
+        self.defecto = defecto
+        self.crudo = crudo
+        self.diccionario = diccionario
+
+    def __repr__(self):
+        return f"<Campo {self.clave}>"
+
+
+def _campos(*entradas):
+    # "columna" abrevia Campo("columna")
+    return tuple(Campo(entrada) if isinstance(entrada, str) else entrada for entrada in entradas)
+
+
+class SyncSection:
+    """
+    Declaración de una sección de transactional_data.
+
+    Args:
+        nombre (str): Clave de la sección en la respuesta.
+        modelo (Model): Modelo de la tabla principal de la sección.
+        campos (tuple[Campo]): Campos de cada fila, en el orden en que salen.
+    """
+
+    def __init__(self, nombre, modelo, campos):
+        self.nombre = nombre
+        self.modelo = modelo
+        self.campos = campos
+        self.columnas = tuple(campo.clave for campo in campos)
+        self.columnas_diccionario = tuple(campo.clave for campo in campos if campo.diccionario)
+
+    def __repr__(self):
+        return f"<SyncSection {self.nombre}>"
+
+
+def _traducido(clave, columna=None, catalogo=None):
+    return Campo(clave, columna, catalogo, diccionario=True)
+
+
+# Datos del usuario de created_by/updated_by: columnas de los joins con user
+def _usuario(prefijo, oficina_y_profesion=False):
+    campos = [_traducido(f"{prefijo}_{dato}") for dato in ("username", "name", "documento")]
+    if oficina_y_profesion:
+        campos += [
+            _traducido(f"{prefijo}_oficina", f"{prefijo}_oficina_id", "oficinas"),
+            _traducido(f"{prefijo}_profesion", f"{prefijo}_profesion_id", "profesiones"),
+        ]
+    return campos
+
+
+# Campos de condiciones_habitat_familia con IDs de aps_cue_opcion separados por comas:
+# (clave en la fila, columna en el modelo). Se decodifican como listas de descripciones.
+HABITAT_TXT_CAMPOS = (
+    ("aspectos_generales", "aps_aspectos_generales_txt"),
+    ("condiciones_locativas", "aps_condiciones_locativas_txt"),
+    ("condiciones_agua", "aps_condiciones_agua_txt"),
+    ("dotacion_sanitaria", "aps_dotacion_sanitaria_txt"),
+    ("alimentos", "aps_alimentos_txt"),
+    ("tenencia_animales", "aps_tenencia_animales_txt"),
+    ("entorno_vivienda", "aps_entorno_vivienda_txt"),
+)
+
+# Tablas de detalle de persona: (nombre de la sección, modelo). Todas se filtran por las
+# personas de la página y tienen los mismos campos.
+DETALLES_PERSONA = (
+    ("persona_antecedente_medico", ApsPersonaAntecedenteMedico),
+    ("persona_componente_mental", ApsPersonaComponenteMental),
+    ("persona_condiciones_salud", ApsPersonaCondicionesSalud),
+    ("persona_dato_basico", ApsPersonaDatoBasico),
+    ("persona_estilos_vida_conducta", ApsPersonaEstilosVidaConducta),
+    ("persona_maternidad", ApsPersonaMaternidad),
+    ("persona_practicas_salud_salud_sexual", ApsPersonaPracticasSaludSaludSexual),
+)
+
+_CAMPOS_DETALLE_PERSONA = _campos(
+    "id", "aps_persona_id", "aps_visita_id", "created_at", "updated_at", "created_by", "updated_by"
+)
+
+SECCIONES = (
+    SyncSection("familias", ApsFichaFamilia, _campos(
+        "id", "apellido_familiar", "celular_cabeza_familia", "numero_integrantes_familia",
+        Campo("estado_ficha_id", "estado_ficha"), _traducido("estado_ficha_descripcion", "estado_ficha", "opciones"),
+        "documento_cabeza_familia", "created_at", "updated_at",
+        "created_by", *_usuario("created_by", oficina_y_profesion=True),
+        "updated_by", *_usuario("updated_by", oficina_y_profesion=True),
+        "fecha_ultima_correccion",
+        Campo("total_campos_actualizados_ultima_visita", "id", "campos_actualizados", defecto='N/A'),
+    )),
+    SyncSection("personas", ApsPersona, _campos(
+        "id", "aps_ficha_familia_id", "fecha_registro", "nombres", "apellidos", "numero_documento",
+        "tb_tipo_documento_id", _traducido("tb_tipo_documento_tipo", "tb_tipo_documento_id", "tipos_documento"),
+        Campo("sexo_id", "sexo"), _traducido("sexo_descripcion", "sexo", "opciones"),
+        Campo("etnia_id", "etnia"), _traducido("etnia_descripcion", "etnia", "opciones"),
+        "edad", "fecha_nacimiento", "created_at", "updated_at", "created_by", "updated_by", "aps_visita_id",
+        _traducido("novedad", "id", "novedades"),
+    )),
+    SyncSection("visitas", ApsVisita, _campos(
+        "id", "aps_ficha_familia_id", "fecha_visita",
+        Campo("tipo_actividad_id", "tipo_actividad"), _traducido("tipo_actividad_descripcion"),
+        "codigo_cups",
+        Campo("auth_oficina_id", "auth_oficina"), _traducido("auth_oficina_nombre"),
+        Campo("com_profesion_id", "com_profesion"), _traducido("com_profesion_descripcion"),
+        "created_at", "updated_at",
+        "created_by", *_usuario("created_by"),
+        "updated_by", *_usuario("updated_by"),
+        Campo("duracion_id", "duracion"), _traducido("duracion_descripcion"),
+    )),
+    SyncSection("ubicaciones_familia", ApsUbicacionFamilia, _campos(
+        "id", "aps_visita_id", "zona",
+        "base_comuna_corregimiento_id",
+        _traducido("base_comuna_corregimiento_nombre", "base_comuna_corregimiento_id", "comunas"),
+        "base_barrio_vereda_id", _traducido("base_barrio_vereda_nombre", "base_barrio_vereda_id", "barrios"),
+        "direccion", "ficha_catastral", "numero_cuadrante", "created_at", "updated_at",
+        # Declarados como Date en el modelo pero se envían tal cual, como en el resto de tablas
+        Campo("created_by", crudo=True), Campo("updated_by", crudo=True),
+    )),
+    SyncSection("condiciones_habitat_familia", ApsCondicionesHabitatFamilia, _campos(
+        "id", "aps_visita_id", "aps_ficha_familia",
+        *(Campo(clave, columna, "habitat_txt", defecto=[]) for clave, columna in HABITAT_TXT_CAMPOS),
+        "numero_perros", "numero_gatos", "created_at", "updated_at", "created_by", "updated_by",
+    )),
+    *(SyncSection(nombre, modelo, _CAMPOS_DETALLE_PERSONA) for nombre, modelo in DETALLES_PERSONA),
+)
+
+SECCIONES_POR_NOMBRE = {seccion.nombre: seccion for seccion in SECCIONES}
+
+
+# Claves de las filas de cada sección, en orden: el formato JSON las envía como objetos y el
+# columnar como arreglos en este orden.
+SECTION_COLUMNS = {seccion.nombre: seccion.columnas for seccion in SECCIONES}
+
+# Columnas que el formato columnar codifica con diccionario
+DICTIONARY_COLUMNS = {
+    seccion.nombre: seccion.columnas_diccionario for seccion in SECCIONES if seccion.columnas_diccionario
+}
+
+
+def empty_sections():
+    """Secciones de transactional_data sin filas (respuestas sin datos)."""
+    return {nombre: [] for nombre in SECTION_COLUMNS}
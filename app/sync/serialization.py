@@ -0,0 +1,70 @@
+# app/sync/serialization.py
+import datetime
+
+try:
+    import msgpack # Opcional: sin él los endpoints responden solo JSON
+except ImportError:
+    msgpack = None
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, 'application/x-msgpack')
+
+
+def msgpack_available():
+    return msgpack is not None
+
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def _default(valor):
+    # Las fechas del servidor no tienen zona: se codifican como UTC con la misma hora de pared
+    # (el cliente las lee en UTC y obtiene exactamente los valores de la base de datos). Los
+    # segundos se calculan a mano porque from_datetime() exige zona y es bastante más lento.
+    if isinstance(valor, datetime.datetime):
+        if valor.tzinfo is not None:
+            valor = valor.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        segundos = (valor.toordinal() - _EPOCH_ORDINAL) * 86400 + valor.hour * 3600 + valor.minute * 60 + valor.second
+        return msgpack.Timestamp(segundos, valor.microsecond * 1000)
+    if isinstance(valor, datetime.date):
+        return msgpack.Timestamp((valor.toordinal() - _EPOCH_ORDINAL) * 86400, 0)
+    raise TypeError(f"Tipo no serializable en msgpack: {type(valor).__name__}")
+
+
+def new_packer():
+    """
+    Packer de MessagePack para las respuestas de sincronización: cadenas UTF-8 y fechas
+    como extensión Timestamp nativa (tipo -1) en lugar de texto isoformat.
+    """
+    return msgpack.Packer(default=_default, use_bin_type=True)
+
+
+def packb(documento):
+    """Serializa un documento completo a MessagePack (ver new_packer)."""
+    return new_packer().pack(documento)
+
+
+def _fechas_a_texto(valor):
+    # Los Timestamp recibidos se devuelven al formato isoformat sin zona que espera
+    # post_changes (misma convención de hora de pared UTC que al codificar)
+    if isinstance(valor, datetime.datetime):
+        return valor.astimezone(datetime.timezone.utc).replace(tzinfo=None).isoformat()
+    if isinstance(valor, dict):
+        return {clave: _fechas_a_texto(v) for clave, v in valor.items()}
+    if isinstance(valor, list):
+        return [_fechas_a_texto(v) for v in valor]
+    return valor
+
+
+def unpackb(datos):
+    """
+    Decodifica un cuerpo MessagePack de POST /changes a la misma estructura que el JSON
+    (dicts, listas y fechas como texto isoformat).
+
+    Raises:
+        ValueError: Si el cuerpo no es MessagePack válido.
+    """
+    try:
+        return _fechas_a_texto(msgpack.unpackb(datos, raw=False, timestamp=3, strict_map_key=False))
+    except (msgpack.ExtraData, msgpack.FormatError, msgpack.StackError, ValueError) as e:
+        raise ValueError(f"Cuerpo msgpack inválido: {str(e) or type(e).__name__}")
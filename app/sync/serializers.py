@@ -0,0 +1,120 @@
+# app/sync/serializers.py
+# Serializadores compilados de filas de sincronización.
+#
+# Cada sección de transactional_data se declara en app/sync/schema.py con su modelo y sus
+# campos. A partir de esa declaración y de los tipos de columna del modelo se genera una
+# función por sección que convierte la tupla de la consulta en el dict de salida: acceso por
+# posición, formato de fecha solo en las columnas DATE/DATETIME y traducción por catálogo sin
+# pasar por helpers genéricos fila a fila. Las funciones se compilan una sola vez al arrancar la
+# aplicación (al registrar el blueprint de sync, ver compile_section_serializers).
+from sqlalchemy import Date, DateTime
+from app.sync.schema import SECCIONES, SECCIONES_POR_NOMBRE
+
+# {(nombre de sección, fechas_nativas): serializar}
+_serializadores = {}
+
+
+def serializer_columns(campos):
+    """
+    Columnas que debe seleccionar la consulta para un serializador, en el orden en que el
+    serializador las lee de la fila.
+
+    Args:
+        campos (tuple[Campo]): Campos de la sección (ver app/sync/schema.py).
+
+    Returns:
+        tuple[str]: Nombres de columna sin repetir.
+    """
+    columnas = []
+    for campo in campos:
+        if campo.columna not in columnas:
+            columnas.append(campo.columna)
+    return tuple(columnas)
+
+
+def section_columns(nombre):
+    """Columnas que debe seleccionar la consulta de la sección `nombre` (ver serializer_columns)."""
+    return serializer_columns(SECCIONES_POR_NOMBRE[nombre].campos)
+
+
+def compile_serializer(seccion, fechas_nativas=False):
+    """
+    Genera la función que serializa las filas de una sección.
+
+    Las columnas DATE/DATETIME del modelo se formatean como isoformat (o se dejan nativas con
+    fechas_nativas) salvo los campos crudos; las columnas de joins y el resto se copian tal
+    cual. Los campos con catálogo toman la descripción del catálogo (o su defecto). Las claves
+    salen en el orden de los campos.
+
+    Args:
+        seccion (SyncSection): Sección de app/sync/schema.py.
+        fechas_nativas (bool): Dejar las fechas como date/datetime (msgpack).
+
+    Returns:
+        callable: serializar(fila, catalogos=None) -> dict, donde fila es la tupla de la
+            consulta con las columnas de serializer_columns(seccion.campos) y catalogos es
+            {nombre: dict} con los catálogos usados por la sección.
+    """
+    columnas_modelo = seccion.modelo.__table__.columns
+    columnas = serializer_columns(seccion.campos)
+    variables = {columna: f"c{i}" for i, columna in enumerate(columnas)}
+
+    # La fila se desempaqueta una vez en variables locales y cada campo se arma con una
+    # expresión en línea (sin llamadas a helpers por celda)
+    cuerpo = []
+    if len(columnas) == 1:
+        cuerpo.append(f"    {variables[columnas[0]]}, = fila")
+    else:
+        cuerpo.append(f"    {', '.join(variables[c] for c in columnas)} = fila")
+    for catalogo in sorted({campo.catalogo for campo in seccion.campos} - {None}):
+        cuerpo.append(f"    cat_{catalogo} = catalogos[{catalogo!r}]")
+
+    cuerpo.append("    return {")
+    for campo in seccion.campos:
+        v = variables[campo.columna]
+        columna_modelo = columnas_modelo.get(campo.columna)
+        if campo.catalogo:
+            defecto = repr(campo.defecto)
+            expresion = f"cat_{campo.catalogo}.get({v}, {defecto}) if {v} else {defecto}"
+        elif not campo.crudo and columna_modelo is not None and isinstance(columna_modelo.type, (Date, DateTime)):
+            # Las fechas cero de MySQL llegan como texto, por eso se valida isoformat
+            formato = v if fechas_nativas else f"{v}.isoformat()"
+            expresion = f"{formato} if {v} and hasattr({v}, 'isoformat') else None"
+        else:
+            expresion = v
+        cuerpo.append(f"        {campo.clave!r}: {expresion},")
+    cuerpo.append("    }")
+
+    fuente = "def serializar(fila, catalogos=None):\n" + "\n".join(cuerpo) + "\n"
+    espacio = {}
+    exec(compile(fuente, f"<serializer {seccion.nombre}>", "exec"), espacio)
+
+    serializar = espacio["serializar"]
+    serializar.fuente = fuente
+    return serializar
+
+
+def compile_section_serializers():
+    """Compila los serializadores de todas las secciones (texto y fechas nativas). Idempotente."""
+    for seccion in SECCIONES:
+        for fechas_nativas in (False, True):
+            if (seccion.nombre, fechas_nativas) not in _serializadores:
+                _serializadores[seccion.nombre, fechas_nativas] = compile_serializer(seccion, fechas_nativas)
+
+
+def section_serializer(nombre, fechas_nativas=False):
+    """
+    Serializador compilado de una sección.
+
+    Args:
+        nombre (str): Nombre de la sección.
+        fechas_nativas (bool): Dejar las fechas como date/datetime (msgpack).
+
+    Returns:
+        callable: Ver compile_serializer.
+
+    Raises:
+        KeyError: Si la sección no existe o los serializadores no se compilaron (la aplicación
+            no registró el blueprint de sync).
+    """
+    return _serializadores[nombre, fechas_nativas]
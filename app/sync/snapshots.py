@@ -0,0 +1,141 @@
+# app/sync/snapshots.py
+import datetime
+import glob
+import gzip
+import hashlib
+import os
+import time
+from flask import Response, current_app, request, send_file
+from app.models import db, EquipoUser, EquipoComunaCorregimiento
+from app.sync.queries import count_latest_visits, latest_visits_page
+from app.sync.streaming import FLUSH, STREAM_CHUNK_BYTES, iter_json_batch
+
+# Nivel gzip de los snapshots: se comprimen una vez por noche, así que conviene el máximo
+SNAPSHOT_GZIP_LEVEL = 9
+
+
+def snapshot_dir():
+    """Directorio de los snapshots (SYNC_SNAPSHOT_DIR o <instance>/snapshots)."""
+    return current_app.config.get('SYNC_SNAPSHOT_DIR') or os.path.join(current_app.instance_path, 'snapshots')
+
+
+def snapshot_path(user_comuna_ids):
+    """Ruta del snapshot de un territorio (identificado por su conjunto de comunas)."""
+    clave = ",".join(str(comuna_id) for comuna_id in sorted(set(user_comuna_ids)))
+    nombre = hashlib.sha1(clave.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(snapshot_dir(), f"territorio-{nombre}.json.gz")
+
+
+def fresh_snapshot_path(user_comuna_ids):
+    """
+    Devuelve la ruta del snapshot del territorio si existe y no supera SYNC_SNAPSHOT_MAX_AGE
+    segundos; None en otro caso (initial-data sigue con las consultas en vivo).
+    """
+    ruta = snapshot_path(user_comuna_ids)
+    try:
+        edad = time.time() - os.path.getmtime(ruta)
+    except OSError:
+        return None
+    return ruta if edad <= current_app.config.get('SYNC_SNAPSHOT_MAX_AGE', 86400) else None
+
+
+def snapshot_response(ruta):
+    """
+    Envía un snapshot tal como está en disco (gzip) si el cliente acepta gzip; si no, lo
+    descomprime en streaming.
+
+    El envío en gzip responde a If-None-Match/If-Modified-Since pero no a Range: los rangos
+    se calcularían sobre los bytes del archivo comprimido y no sobre el JSON.
+    """
+    if request.accept_encodings['gzip'] > 0:
+        response = send_file(ruta, mimetype='application/json', conditional=False, max_age=0)
+        response.make_conditional(request, accept_ranges=False)
+        # Con Content-Encoding presente Flask-Compress no vuelve a comprimir
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        def leer():
+            with gzip.open(ruta, 'rb') as archivo:
+                while True:
+                    datos = archivo.read(STREAM_CHUNK_BYTES)
+                    if not datos:
+                        break
+                    yield datos
+        response = Response(leer(), mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def user_territories():
+    """
+    Territorios distintos de los usuarios con equipo: el conjunto de comunas de todos los
+    equipos de cada usuario (el mismo que resuelve initial-data).
+
+    Returns:
+        list[tuple[int]]: Conjuntos de IDs de comuna, ordenados.
+    """
+    comunas_por_usuario = {}
+    for user_id, comuna_id in db.session.query(
+        EquipoUser.user_id, EquipoComunaCorregimiento.base_comuna_corregimiento_id
+    ).join(
+        EquipoComunaCorregimiento, EquipoComunaCorregimiento.equipo_id == EquipoUser.equipo_id
+    ):
+        comunas_por_usuario.setdefault(user_id, set()).add(comuna_id)
+    return sorted({tuple(sorted(comunas)) for comunas in comunas_por_usuario.values()})
+
+
+def build_snapshot(user_comuna_ids, per_page):
+    """
+    Escribe el snapshot de un territorio: el documento de initial-data con todas sus páginas
+    (mismo formato que ?pages=a-b) comprimido con gzip. Se escribe a un archivo temporal y se
+    reemplaza al final, así los lectores nunca ven un snapshot a medias.
+
+    El last_sync_timestamp del documento es el inicio de la construcción: el cliente lo usa
+    como 'since' de GET /changes para recuperar lo escrito después.
+
+    Args:
+        user_comuna_ids (tuple[int]): Comunas del territorio.
+        per_page (int): Familias por página dentro del snapshot.
+
+    Returns:
+        tuple: (ruta, total de familias).
+    """
+    # Import diferido: routes importa este módulo para servir los snapshots
+    from app.sync.routes import initial_data_batch_document
+
+    as_of = datetime.datetime.now()
+    total_visitas = count_latest_visits(list(user_comuna_ids))
+    total_pages = (total_visitas + per_page - 1) // per_page
+    visitas, _ = latest_visits_page(list(user_comuna_ids), 1, per_page, pages=max(total_pages, 1))
+
+    envelope, paginas = initial_data_batch_document(
+        visitas, 1, per_page, total_visitas, {}, last_sync_timestamp=as_of.isoformat()
+    )
+    envelope["snapshot"] = {"built_at": as_of.isoformat(), "comunas": list(user_comuna_ids)}
+    documentos = (({"pagination_meta": meta}, "transactional_data", sections) for meta, sections in paginas)
+
+    ruta = snapshot_path(user_comuna_ids)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    try:
+        with gzip.open(temporal, 'wb', compresslevel=SNAPSHOT_GZIP_LEVEL) as archivo:
+            for parte in iter_json_batch(envelope, documentos):
+                if parte is not FLUSH:
+                    archivo.write(parte.encode('utf-8'))
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+    # Cada territorio libera la sesión para no acumular objetos entre territorios
+    db.session.remove()
+    return ruta, total_visitas
+
+
+def remove_stale_snapshots(vigentes):
+    """Borra los snapshots de territorios que ya no existen. Devuelve cuántos borró."""
+    borrados = 0
+    for ruta in glob.glob(os.path.join(snapshot_dir(), "territorio-*.json.gz")):
+        if ruta not in vigentes:
+            os.remove(ruta)
+            borrados += 1
+    return borrados
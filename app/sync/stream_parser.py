@@ -0,0 +1,260 @@
+# app/sync/stream_parser.py
+# Lectura incremental del cuerpo JSON de POST /changes.
+#
+# request.json materializa el documento completo: un respaldo de 50 MB de un dispositivo que
+# estuvo sin conexión son varios cientos de MB de objetos Python. iter_change_items recorre el
+# documento {seccion: {accion: [item, ...]}} leyendo el stream por bloques y entrega los items
+# uno a uno, así en memoria solo quedan el bloque leído y el item en curso.
+import codecs
+import hashlib
+import json
+import re
+import tempfile
+
+# Bytes por lectura del stream
+READ_CHUNK_BYTES = 64 * 1024
+
+# Tamaño máximo de un valor (un item, o una sección/acción que no tiene la forma esperada):
+# un valor sin terminar no puede crecer el buffer hasta el tamaño del cuerpo
+MAX_ITEM_BYTES = 1024 * 1024
+
+# Tamaño a partir del cual spool_body pasa el cuerpo de memoria a un archivo temporal
+SPOOL_MAX_MEMORY_BYTES = 1024 * 1024
+
+_ESPACIOS = ' \t\n\r'
+# Caracteres que pueden seguir a un número completo
+_FIN_NUMERO = _ESPACIOS + ',]}'
+# Literales que el decodificador acepta; un prefijo al final del buffer es un valor cortado
+_LITERALES = ('true', 'false', 'null', 'NaN', 'Infinity', '-Infinity')
+# Resto de un número cortado después de la parte ya válida ('.', 'e', 'e-', ...)
+_RESTO_NUMERO = re.compile(r'[0-9.eE+-]+')
+# Escape \uXXXX cortado (con el segundo escape de un par sustituto)
+_RESTO_ESCAPE = re.compile(r'u[0-9a-fA-F]{0,4}(\\(u[0-9a-fA-F]{0,4})?)?')
+_decoder = json.JSONDecoder()
+
+
+class InvalidChangesBody(ValueError):
+    """El cuerpo no es un JSON válido con la forma {seccion: {accion: [items]}}."""
+
+
+def _truncado(buffer, error):
+    """
+    Indica si el error de decodificación se debe a que el valor sigue en el próximo bloque
+    (el error está al final del buffer) y no a un JSON mal formado.
+
+    Args:
+        buffer (str): Texto decodificado.
+        error (json.JSONDecodeError): Error de raw_decode sobre `buffer`.
+
+    Returns:
+        bool
+    """
+    resto = buffer[error.pos:]
+    if not resto.strip(_ESPACIOS) or error.msg.startswith('Unterminated string'):
+        # Falta el resto del documento, o la cadena que empieza en pos llega al final del buffer
+        return True
+    if error.msg == 'Expecting value':
+        return any(literal.startswith(resto) for literal in _LITERALES)
+    if error.msg.startswith('Invalid \\uXXXX escape'):
+        return _RESTO_ESCAPE.fullmatch(resto) is not None
+    if error.msg.startswith('Expecting'):
+        # '-2.' o '1e' al final: raw_decode toma '-2' y falla en el delimitador
+        return _RESTO_NUMERO.fullmatch(resto) is not None
+    return False
+
+
+class _Lector:
+    """Buffer de texto sobre un stream binario UTF-8 que descarta lo ya consumido."""
+
+    def __init__(self, stream, chunk_bytes, max_item_bytes=MAX_ITEM_BYTES):
+        self.stream = stream
+        self.chunk_bytes = chunk_bytes
+        self.max_item_bytes = max_item_bytes
+        self.decodificador = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.fin = False
+
+    def _leer(self):
+        # Agrega un bloque al buffer; False si el stream ya terminó
+        if self.fin:
+            return False
+        datos = self.stream.read(self.chunk_bytes)
+        try:
+            if datos:
+                texto = self.decodificador.decode(datos)
+            else:
+                self.fin = True
+                texto = self.decodificador.decode(b'', final=True)
+        except UnicodeDecodeError as e:
+            raise InvalidChangesBody(f"El cuerpo no es UTF-8 válido: {e.reason}") from None
+        self.buffer = self.buffer[self.pos:] + texto
+        self.pos = 0
+        return True
+
+    def siguiente(self):
+        """Siguiente carácter significativo, sin consumirlo ('' al final del stream)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _ESPACIOS:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._leer():
+                return ''
+
+    def abrir(self, caracter):
+        """Consume `caracter` si es el siguiente; indica si lo consumió."""
+        if self.siguiente() == caracter:
+            self.pos += 1
+            return True
+        return False
+
+    def esperar(self, caracteres):
+        """Consume y devuelve el siguiente carácter, que debe ser uno de `caracteres`."""
+        caracter = self.siguiente()
+        if not caracter or caracter not in caracteres:
+            encontrado = repr(caracter) if caracter else 'el fin del cuerpo'
+            raise InvalidChangesBody(f"JSON inválido: se esperaba {' o '.join(map(repr, caracteres))} y se encontró {encontrado}")
+        self.pos += 1
+        return caracter
+
+    def _leer_valor(self):
+        # Lee otro bloque para completar el valor en curso; False si el stream ya terminó
+        if len(self.buffer) - self.pos > self.max_item_bytes:
+            raise InvalidChangesBody(f"Un valor del cuerpo supera el máximo de {self.max_item_bytes} bytes")
+        return self._leer()
+
+    def valor(self):
+        """
+        Decodifica el siguiente valor JSON completo. Solo se leen más bloques mientras el valor
+        está cortado al final del buffer; un error en medio del buffer falla de inmediato.
+        """
+        self.siguiente()
+        while True:
+            try:
+                valor, fin = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                if _truncado(self.buffer, e) and self._leer_valor():
+                    continue
+                raise InvalidChangesBody(f"JSON inválido: {e.msg} (posición {e.pos - self.pos} del valor)") from None
+            # Un número cortado por el bloque ('-25' de '-25.5') continúa en el siguiente
+            if isinstance(valor, (int, float)) and not isinstance(valor, bool) \
+                    and (fin == len(self.buffer) or self.buffer[fin] not in _FIN_NUMERO) and self._leer_valor():
+                continue
+            self.pos = fin
+            return valor
+
+    def clave(self):
+        """Lee `"clave":` de un miembro de objeto."""
+        if self.siguiente() != '"':
+            raise InvalidChangesBody("JSON inválido: se esperaba el nombre de un campo")
+        clave = self.valor()
+        self.esperar(':')
+        return clave
+
+
+def _claves(lector):
+    # Claves de un objeto ya abierto; el llamador consume el valor de cada una
+    if lector.abrir('}'):
+        return
+    while True:
+        yield lector.clave()
+        if lector.esperar(',}') == '}':
+            return
+
+
+def _elementos(lector):
+    # Elementos de un arreglo ya abierto
+    if lector.abrir(']'):
+        return
+    while True:
+        yield lector.valor()
+        if lector.esperar(',]') == ']':
+            return
+
+
+def iter_change_items(stream, chunk_bytes=READ_CHUNK_BYTES, max_item_bytes=MAX_ITEM_BYTES):
+    """
+    Recorre un cuerpo de POST /changes sin cargarlo completo.
+
+    Los valores que no tienen la forma esperada (una sección que no es objeto, una acción que
+    no es arreglo) se leen y se descartan, igual que los ignora process_changes.
+
+    Args:
+        stream: Objeto con read(n) que devuelve bytes (request.stream, archivo binario).
+        chunk_bytes (int): Bytes por lectura.
+        max_item_bytes (int): Tamaño máximo de un valor (SYNC_STREAM_MAX_ITEM_BYTES).
+
+    Yields:
+        tuple: (seccion, accion, item) en el orden del documento.
+
+    Raises:
+        InvalidChangesBody: Si el cuerpo no es JSON válido, no es un objeto o uno de sus
+            valores supera max_item_bytes.
+    """
+    lector = _Lector(stream, chunk_bytes, max_item_bytes)
+    lector.esperar('{')
+    for seccion in _claves(lector):
+        if not lector.abrir('{'):
+            lector.valor()
+            continue
+        for accion in _claves(lector):
+            if not lector.abrir('['):
+                lector.valor()
+                continue
+            for item in _elementos(lector):
+                yield seccion, accion, item
+    if lector.siguiente():
+        raise InvalidChangesBody("JSON inválido: contenido adicional después del documento")
+
+
+def count_stream_items(archivo, max_item_bytes=MAX_ITEM_BYTES):
+    """
+    Cantidad de registros de un cuerpo de POST /changes (como jobs.count_change_items) sin
+    cargarlo. Deja el archivo posicionado al inicio.
+    """
+    items = sum(1 for _ in iter_change_items(archivo, max_item_bytes=max_item_bytes))
+    archivo.seek(0)
+    return items
+
+
+class ItemSpool:
+    """
+    Items en espera, uno por línea JSON en un archivo temporal (en memoria hasta
+    SPOOL_MAX_MEMORY_BYTES). Se recorren en el orden en que se agregaron.
+    """
+
+    def __init__(self):
+        self.archivo = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY_BYTES)
+
+    def append(self, item):
+        self.archivo.write(json.dumps(item, ensure_ascii=False).encode('utf-8') + b'\n')
+
+    def __iter__(self):
+        self.archivo.seek(0)
+        for linea in self.archivo:
+            yield json.loads(linea)
+
+    def close(self):
+        self.archivo.close()
+
+
+def spool_body(stream, chunk_bytes=READ_CHUNK_BYTES):
+    """
+    Copia el cuerpo a un archivo temporal (en memoria hasta SPOOL_MAX_MEMORY_BYTES) y calcula
+    su huella, para los casos que necesitan el cuerpo completo (Idempotency-Key, trabajos
+    asíncronos) sin tenerlo en memoria.
+
+    Returns:
+        tuple: (archivo posicionado al inicio, SHA-256 del cuerpo como request_fingerprint).
+    """
+    archivo = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY_BYTES)
+    huella = hashlib.sha256()
+    while True:
+        datos = stream.read(chunk_bytes)
+        if not datos:
+            break
+        huella.update(datos)
+        archivo.write(datos)
+    archivo.seek(0)
+    return archivo, huella.hexdigest()
@@ -0,0 +1,285 @@
+# app/sync/streaming.py
+import zlib
+from flask import Response, current_app, request, stream_with_context
+from app.sync.serialization import new_packer, MSGPACK_MIMETYPE
+
+try:
+    import brotli # Dependencia de Flask-Compress; si no está, se omite 'br'
+except ImportError:
+    brotli = None
+
+# Marcador que el generador del documento emite al terminar cada sección: fuerza a
+# enviar (y, si aplica, a hacer flush del compresor) lo acumulado hasta ese punto.
+FLUSH = object()
+
+# Tamaño aproximado de los bloques que se entregan al servidor WSGI
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def iter_json_document(envelope, lazy_key, sections):
+    """
+    Genera, fragmento a fragmento, el mismo JSON que produciría jsonify() sobre
+    {**envelope, lazy_key: {nombre: list(filas)}} sin construir el documento completo.
+
+    Las claves se emiten ordenadas (igual que jsonify con sort_keys) y cada sección se
+    materializa solo cuando le toca ser escrita, fila por fila.
+
+    Args:
+        envelope (dict): Claves pequeñas del documento (metadatos, catálogos, etc.).
+        lazy_key (str): Clave que contiene las secciones perezosas (p. ej. 'transactional_data').
+        sections (dict): {nombre: callable sin argumentos que devuelve un iterable de filas
+            (se escribe como arreglo) o un dict ya armado (se escribe completo)}.
+
+    Yields:
+        str or FLUSH: Fragmentos de texto JSON y marcadores de fin de sección.
+    """
+    yield from _iter_json_object(envelope, lazy_key, sections)
+    yield '\n'
+
+
+def _iter_json_object(envelope, lazy_key, sections):
+    dumps = current_app.json.dumps
+
+    def encode(value):
+        return dumps(value, separators=(',', ':'))
+
+    yield '{'
+    for i, key in enumerate(sorted([*envelope, lazy_key])):
+        if i:
+            yield ','
+        yield encode(key) + ':'
+        if key != lazy_key:
+            yield encode(envelope[key])
+            continue
+
+        yield '{'
+        for j, nombre in enumerate(sorted(sections)):
+            yield (',' if j else '') + encode(nombre) + ':'
+            valor = sections[nombre]()
+            if isinstance(valor, dict):
+                # Sección ya armada como objeto (p. ej. formato columnar)
+                yield encode(valor)
+            else:
+                yield '['
+                for k, fila in enumerate(valor):
+                    yield (',' if k else '') + encode(fila)
+                yield ']'
+            yield FLUSH
+        yield '}'
+    yield '}'
+
+
+def iter_json_batch(envelope, paginas, max_bytes=None):
+    """
+    Genera {**envelope, "pages": [página, ...]} donde cada página es un documento como el de
+    iter_json_document (sin el salto de línea final), escrito sección por sección.
+
+    Los valores callables del envelope se evalúan al momento de escribirlos; como las claves
+    van ordenadas, los que quedan después de "pages" (p. ej. pagination_meta) pueden
+    describir las páginas que realmente se enviaron.
+
+    Args:
+        envelope (dict): Claves del documento exterior.
+        paginas (iterable): Tuplas (envelope_pagina, lazy_key, sections); se consumen de a una.
+        max_bytes (int, optional): Al superar este tamaño (sin comprimir) no se piden más
+            páginas. Siempre se envía al menos una.
+
+    Yields:
+        str or FLUSH: Fragmentos de texto JSON y marcadores de fin de sección.
+    """
+    dumps = current_app.json.dumps
+
+    def encode(value):
+        return dumps(value, separators=(',', ':'))
+
+    escritos = 0
+    yield '{'
+    for i, key in enumerate(sorted([*envelope, 'pages'])):
+        if i:
+            yield ','
+        yield encode(key) + ':'
+        if key != 'pages':
+            valor = envelope[key]
+            yield encode(valor() if callable(valor) else valor)
+            continue
+
+        yield '['
+        for j, (pagina, lazy_key, sections) in enumerate(paginas):
+            if j:
+                yield ','
+            for parte in _iter_json_object(pagina, lazy_key, sections):
+                if parte is not FLUSH:
+                    # Con ensure_ascii cada carácter es un byte
+                    escritos += len(parte)
+                yield parte
+            if max_bytes and escritos >= max_bytes:
+                break
+        yield ']'
+    yield '}\n'
+
+
+def iter_msgpack_document(envelope, lazy_key, sections):
+    """
+    Equivalente de iter_json_document en MessagePack. Cada sección se materializa como lista
+    (el encabezado de un arreglo msgpack lleva su longitud) y se empaqueta fila por fila.
+
+    Yields:
+        bytes or FLUSH: Fragmentos msgpack y marcadores de fin de sección.
+    """
+    packer = new_packer()
+
+    yield packer.pack_map_header(len(envelope) + 1)
+    for key in sorted([*envelope, lazy_key]):
+        yield packer.pack(key)
+        if key != lazy_key:
+            yield packer.pack(envelope[key])
+            continue
+
+        yield packer.pack_map_header(len(sections))
+        for nombre in sorted(sections):
+            yield packer.pack(nombre)
+            valor = sections[nombre]()
+            if isinstance(valor, dict):
+                yield packer.pack(valor)
+            else:
+                filas = list(valor)
+                yield packer.pack_array_header(len(filas))
+                for fila in filas:
+                    yield packer.pack(fila)
+            yield FLUSH
+
+
+def iter_msgpack_batch(envelope, paginas, max_bytes=None):
+    """
+    Equivalente de iter_json_batch en MessagePack. El encabezado del arreglo "pages" lleva la
+    cantidad de páginas, así que cada página se empaqueta en memoria antes de escribir el
+    documento (con max_bytes la memoria queda acotada por ese límite más una página).
+
+    Yields:
+        bytes or FLUSH: Fragmentos msgpack y marcadores de fin de página.
+    """
+    empaquetadas = []
+    escritos = 0
+    for pagina, lazy_key, sections in paginas:
+        datos = b''.join(parte for parte in iter_msgpack_document(pagina, lazy_key, sections) if parte is not FLUSH)
+        empaquetadas.append(datos)
+        escritos += len(datos)
+        if max_bytes and escritos >= max_bytes:
+            break
+
+    packer = new_packer()
+    yield packer.pack_map_header(len(envelope) + 1)
+    for key in sorted([*envelope, 'pages']):
+        yield packer.pack(key)
+        if key != 'pages':
+            valor = envelope[key]
+            yield packer.pack(valor() if callable(valor) else valor)
+            continue
+
+        yield packer.pack_array_header(len(empaquetadas))
+        for datos in empaquetadas:
+            yield datos
+            yield FLUSH
+
+
+def _choose_encoding():
+    # Respeta el orden de preferencia configurado para Flask-Compress
+    for algoritmo in current_app.config.get('COMPRESS_ALGORITHM', ['gzip']):
+        if algoritmo == 'br' and brotli is None:
+            continue
+        if algoritmo in ('br', 'gzip', 'deflate') and request.accept_encodings[algoritmo] > 0:
+            return algoritmo
+    return None
+
+
+def _make_compressor(encoding):
+    """Devuelve (comprimir, flush, terminar) para el algoritmo indicado."""
+    if encoding == 'br':
+        compresor = brotli.Compressor(quality=current_app.config.get('COMPRESS_BR_LEVEL', 4))
+        return compresor.process, compresor.flush, compresor.finish
+
+    nivel = current_app.config.get('COMPRESS_LEVEL', 6)
+    if encoding == 'gzip':
+        compresor = zlib.compressobj(nivel, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    else:  # deflate
+        compresor = zlib.compressobj(nivel)
+    return compresor.compress, lambda: compresor.flush(zlib.Z_SYNC_FLUSH), compresor.flush
+
+
+def _encode_chunks(partes, encoding):
+    comprimir = flush = terminar = None
+    if encoding:
+        comprimir, flush, terminar = _make_compressor(encoding)
+
+    buffer = []
+    tamano = 0
+    for parte in partes:
+        if parte is not FLUSH:
+            if isinstance(parte, str):
+                parte = parte.encode('utf-8')
+            buffer.append(parte)
+            tamano += len(parte)
+            if tamano < STREAM_CHUNK_BYTES:
+                continue
+
+        datos = b''.join(buffer)
+        buffer, tamano = [], 0
+        if comprimir:
+            datos = comprimir(datos)
+            if parte is FLUSH:
+                datos += flush()
+        if datos:
+            yield datos
+
+    datos = b''.join(buffer)
+    if comprimir:
+        datos = comprimir(datos) + terminar()
+    if datos:
+        yield datos
+
+
+def stream_json_response(envelope, lazy_key, sections, status=200, mimetype='application/json'):
+    """
+    Respuesta HTTP en streaming para documentos JSON grandes (ver iter_json_document).
+
+    Comprime de forma incremental (br/gzip/deflate según Accept-Encoding y
+    COMPRESS_ALGORITHM) y marca Content-Encoding para que Flask-Compress no vuelva a
+    bufferizar la respuesta. La memoria del worker queda acotada por la sección más grande
+    en lugar del documento completo más su versión serializada y comprimida.
+
+    Args:
+        envelope (dict): Claves pequeñas del documento.
+        lazy_key (str): Clave con las secciones perezosas.
+        sections (dict): {nombre: callable que devuelve un iterable de filas o un dict}.
+        status (int): Código HTTP.
+        mimetype (str): Tipo de contenido de la respuesta.
+
+    Returns:
+        Response: Respuesta en streaming.
+    """
+    return _stream_response(iter_json_document(envelope, lazy_key, sections), status, mimetype)
+
+
+def stream_msgpack_response(envelope, lazy_key, sections, status=200, mimetype=MSGPACK_MIMETYPE):
+    """Como stream_json_response, pero el documento se escribe en MessagePack."""
+    return _stream_response(iter_msgpack_document(envelope, lazy_key, sections), status, mimetype)
+
+
+def stream_batch_response(envelope, paginas, max_bytes=None, serializacion='json', status=200, mimetype='application/json'):
+    """
+    Respuesta en streaming con varias páginas de sincronización (ver iter_json_batch e
+    iter_msgpack_batch).
+    """
+    iterar = iter_msgpack_batch if serializacion == 'msgpack' else iter_json_batch
+    return _stream_response(iterar(envelope, paginas, max_bytes), status, mimetype)
+
+
+def _stream_response(partes, status, mimetype):
+    encoding = _choose_encoding()
+    chunks = _encode_chunks(partes, encoding)
+
+    response = Response(stream_with_context(chunks), status=status, mimetype=mimetype)
+    response.headers['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,45 @@
+# app/sync/table_cache.py
+# Cache por proceso de "las tablas existen", para las tablas opcionales que se crean con un
+# comando después del despliegue (aps_familia_visita_vigente, sync_batch/sync_item,
+# sync_territory_version).
+#
+# Un resultado positivo se conserva (las tablas no se borran); uno negativo vence a los
+# SYNC_TABLE_CHECK_TTL segundos, así los workers que arrancaron antes de crear la tabla la
+# detectan sin reiniciar. Las escrituras piden max_age=0 y nunca confían en un negativo viejo.
+import time
+from flask import current_app
+from sqlalchemy import inspect
+from app.models import db
+
+# {(url de la base, nombres de tabla): (existen, momento de la verificación)}
+_verificadas = {}
+
+
+def tables_exist(*modelos, max_age=None):
+    """
+    Indica si existen las tablas de todos los modelos.
+
+    Args:
+        modelos (Model): Modelos a verificar.
+        max_age (int, optional): Antigüedad máxima en segundos de un resultado negativo
+            cacheado (por defecto SYNC_TABLE_CHECK_TTL; 0 = volver a consultar siempre).
+
+    Returns:
+        bool
+    """
+    if max_age is None:
+        max_age = current_app.config.get('SYNC_TABLE_CHECK_TTL', 30)
+    clave = (str(db.engine.url), tuple(modelo.__tablename__ for modelo in modelos))
+    existen, verificado = _verificadas.get(clave, (False, None))
+    if existen or (verificado is not None and time.monotonic() - verificado < max_age):
+        return existen
+
+    inspector = inspect(db.engine)
+    existen = all(inspector.has_table(nombre) for nombre in clave[1])
+    _verificadas[clave] = (existen, time.monotonic())
+    return existen
+
+
+def forget_tables():
+    """Descarta las verificaciones cacheadas (p. ej. tras crear o borrar tablas en pruebas)."""
+    _verificadas.clear()
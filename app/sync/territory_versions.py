@@ -0,0 +1,107 @@
+# app/sync/territory_versions.py
+# Versión por territorio (comuna) de los datos de sincronización.
+#
+# Casi todos los updated_at son DATE, así que dos POST /changes del mismo día no cambian los
+# agregados de territory_fingerprint. commit_changes incrementa, en la misma transacción de los
+# cambios, la versión de cada comuna donde tienen visitas las familias tocadas por el lote; la
+# huella del ETag suma las versiones de las comunas del usuario en lugar de leer filas.
+import datetime
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from app.models import db, ApsFichaFamilia, ApsVisita, ApsUbicacionFamilia, SyncTerritoryVersion
+from app.sync.entities import ENTIDADES
+from app.sync.table_cache import tables_exist
+
+
+def territory_versions_available(max_age=None):
+    """Indica si existe sync_territory_version (se crea con `flask sync create-territory-versions`)."""
+    return tables_exist(SyncTerritoryVersion, max_age=max_age)
+
+
+def create_territory_versions_table():
+    """Crea sync_territory_version si no existe."""
+    SyncTerritoryVersion.__table__.create(db.engine, checkfirst=True)
+
+
+def familias_modificadas(sync_results):
+    """
+    Familias de todos los registros creados, actualizados o eliminados por un POST /changes
+    (incluidas las tablas de detalle, que se resuelven por su visita).
+
+    Args:
+        sync_results (dict): Resultados de post_changes (se usan los remote_id).
+
+    Returns:
+        set[int]: IDs de aps_ficha_familia.
+    """
+    familias = set()
+    for entidad in ENTIDADES:
+        ids = set()
+        for accion in ('created', 'updated', 'deleted'):
+            for resultado in sync_results.get(entidad.seccion, {}).get(accion, []):
+                # El remote_id puede venir del móvil como texto
+                if str(resultado.get("remote_id") or '').isdigit():
+                    ids.add(int(resultado["remote_id"]))
+        if not ids:
+            continue
+
+        modelo = entidad.modelo
+        if modelo is ApsFichaFamilia:
+            familias |= ids
+            continue
+        if 'aps_ficha_familia_id' in entidad.columnas:
+            consulta = select(modelo.aps_ficha_familia_id)
+        else:
+            consulta = select(ApsVisita.aps_ficha_familia_id).join(modelo, modelo.aps_visita_id == ApsVisita.id)
+        familias |= {fid for fid, in db.session.execute(consulta.where(modelo.id.in_(ids))) if fid}
+    return familias
+
+
+def bump_territory_versions(sync_results):
+    """
+    Incrementa (en la transacción actual, sin commit) la versión de las comunas donde tienen
+    visitas las familias modificadas por el lote. Las comunas se bloquean en orden de ID para
+    que dos lotes concurrentes no se crucen. Sin la tabla no hace nada.
+
+    Args:
+        sync_results (dict): Resultados de post_changes.
+    """
+    familia_ids = familias_modificadas(sync_results)
+    if not familia_ids or not territory_versions_available(max_age=0):
+        return
+
+    # Las sentencias Core no hacen autoflush: los cambios ORM pendientes deben estar en la base
+    db.session.flush()
+    comuna_ids = sorted({comuna_id for comuna_id, in db.session.execute(
+        select(ApsUbicacionFamilia.base_comuna_corregimiento_id).distinct().join(
+            ApsVisita, ApsUbicacionFamilia.aps_visita_id == ApsVisita.id
+        ).where(
+            ApsVisita.aps_ficha_familia_id.in_(sorted(familia_ids))
+        )
+    ) if comuna_id})
+
+    ahora = datetime.datetime.now()
+    tabla = SyncTerritoryVersion.__table__
+    for comuna_id in comuna_ids:
+        actualizadas = db.session.execute(
+            update(tabla).where(tabla.c.base_comuna_corregimiento_id == comuna_id)
+            .values(version=tabla.c.version + 1, updated_at=ahora)
+        ).rowcount
+        if actualizadas:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(tabla.insert().values(base_comuna_corregimiento_id=comuna_id, version=1, updated_at=ahora))
+        except IntegrityError:
+            # Otro lote creó la fila entre el UPDATE y el INSERT
+            db.session.execute(
+                update(tabla).where(tabla.c.base_comuna_corregimiento_id == comuna_id)
+                .values(version=tabla.c.version + 1, updated_at=ahora)
+            )
+
+
+def territory_version_select(user_comuna_ids):
+    """SELECT escalar (sin ejecutar) de la suma de las versiones de las comunas del usuario."""
+    return select(func.coalesce(func.sum(SyncTerritoryVersion.version), 0)).where(
+        SyncTerritoryVersion.base_comuna_corregimiento_id.in_(user_comuna_ids)
+    ).scalar_subquery()
@@ -1,6 +1,10 @@
 # app/sync/utils.py
 from app.models import db, ApsCueOpcion,ApsPersona, ApsPersonaEstilosVidaConducta # Importa los modelos necesarios
-from sqlalchemy import func # Necesario para algunas queries de SQLAlchemy
+from sqlalchemy import func, case, or_, select # Necesario para algunas queries de SQLAlchemy
+import base64
+import datetime
+import json
+from app.sync.catalog_cache import get_catalog
 
 def calculate_total_updated_fields_for_family_ficha(aps_ficha_familia_id):
     """
@@ -8,6 +12,8 @@ def calculate_total_updated_fields_for_family_ficha(aps_ficha_familia_id):
     sumando 'cantidad_campos_cambiados' para las personas de la familia
     que tienen más de una versión en el historial de 'aps_persona' (indicando una actualización).
 
+    Para varias familias a la vez usar calculate_total_updated_fields_for_families.
+
     Args:
         aps_ficha_familia_id (int): El ID de la ficha familiar para la cual se calcularán los campos actualizados.
 
@@ -15,49 +21,93 @@ def calculate_total_updated_fields_for_family_ficha(aps_ficha_familia_id):
         int or str: La suma total de 'cantidad_campos_cambiados' si se encuentran
                     personas actualizadas, de lo contrario, 'N/A'.
     """
-    total_campos_cambiados = 0
-    hay_actualizaciones = False
-
-    # 1. Obtener todas las personas (solo las versiones VIGENTES) asociadas a esta ficha familiar.
-    # Usamos outerjoin para asegurar que incluso si una persona no tiene un registro
-    # de EstilosVidaConducta, la incluimos en el resultado.
-    persons_and_estilos = db.session.query(
-        ApsPersona, ApsPersonaEstilosVidaConducta
+    return calculate_total_updated_fields_for_families([aps_ficha_familia_id])[aps_ficha_familia_id]
+
+
+def calculate_total_updated_fields_for_families(familia_ids):
+    """
+    Versión por lotes de calculate_total_updated_fields_for_family_ficha: resuelve todas
+    las familias de una página en una sola consulta agrupada.
+
+    Para cada persona vigente de cada familia se cuenta cuántas versiones existen de su
+    numero_documento en aps_persona (subconsulta agrupada); si hay más de una, la persona
+    se considera actualizada y se suma el 'cantidad_campos_cambiados' de su registro de
+    estilos de vida y conducta.
+
+    Args:
+        familia_ids (list[int]): IDs de las fichas familiares de la página.
+
+    Returns:
+        dict: {familia_id: suma de campos cambiados (int) o 'N/A' si no hubo actualizaciones}.
+    """
+    resultado = {familia_id: 'N/A' for familia_id in familia_ids}
+    if not familia_ids:
+        return resultado
+
+    # 1. Documentos de las personas vigentes de las familias solicitadas
+    documentos_familias = select(ApsPersona.numero_documento).where(
+        ApsPersona.aps_ficha_familia_id.in_(familia_ids),
+        ApsPersona.vigencia_registro == True
+    )
+
+    # 2. Cantidad de versiones por documento (solo para esos documentos). Como en la versión
+    # por familia (numero_documento == None se traduce a IS NULL), las personas sin documento
+    # forman un grupo propio: NULL IN (...) no coincide, por eso se agregan aparte.
+    versiones = select(
+        ApsPersona.numero_documento,
+        func.count(ApsPersona.id).label('cantidad_versiones')
+    ).where(
+        or_(ApsPersona.numero_documento.in_(documentos_familias), ApsPersona.numero_documento.is_(None))
+    ).group_by(
+        ApsPersona.numero_documento
+    ).subquery()
+
+    persona_actualizada = versiones.c.cantidad_versiones > 1
+
+    # 3. Suma por familia de 'cantidad_campos_cambiados' de las personas actualizadas.
+    # El outerjoin conserva a las personas sin registro de estilos de vida.
+    filas = db.session.query(
+        ApsPersona.aps_ficha_familia_id,
+        func.sum(case(
+            (persona_actualizada, func.coalesce(ApsPersonaEstilosVidaConducta.cantidad_campos_cambiados, 0)),
+            else_=0
+        )).label('total_campos_cambiados'),
+        func.max(case((persona_actualizada, 1), else_=0)).label('hay_actualizaciones')
+    ).join(
+        versiones, ApsPersona.numero_documento.is_not_distinct_from(versiones.c.numero_documento)
     ).outerjoin(
         ApsPersonaEstilosVidaConducta,
         ApsPersona.id == ApsPersonaEstilosVidaConducta.aps_persona_id
     ).filter(
-        ApsPersona.aps_ficha_familia_id == aps_ficha_familia_id,
+        ApsPersona.aps_ficha_familia_id.in_(familia_ids),
         ApsPersona.vigencia_registro == True # Filtra solo por la versión vigente de la persona
+    ).group_by(
+        ApsPersona.aps_ficha_familia_id
     ).all()
 
-    if not persons_and_estilos:
-        # Si no hay personas vigentes asociadas a esta ficha familiar, no hay nada que contar.
-        return 'N/A'
-
-    for persona, estilo_vida_conducta in persons_and_estilos:
-        # 2. Verificar si esta persona (por su numero_documento) tiene un historial de actualizaciones.
-        # Esto se hace contando cuántos registros existen para su numero_documento en la tabla aps_persona.
-        # Si count > 1, significa que ha habido al menos una actualización que creó una nueva versión.
-        cantidad_versiones_persona = ApsPersona.query.filter(
-            ApsPersona.numero_documento == persona.numero_documento
-        ).count()
+    # 4. 'N/A' se mantiene para familias sin personas vigentes o sin actualizaciones
+    for familia_id, total_campos_cambiados, hay_actualizaciones in filas:
+        if hay_actualizaciones:
+            resultado[familia_id] = int(total_campos_cambiados or 0)
 
-        if cantidad_versiones_persona > 1:
-            hay_actualizaciones = True
-            # 3. Sumar 'cantidad_campos_cambiados' de su registro de estilo de vida y conducta actual.
-            # Solo sumamos si el registro de estilo de vida existe y el campo no es None.
-            if estilo_vida_conducta and estilo_vida_conducta.cantidad_campos_cambiados is not None:
-                total_campos_cambiados += estilo_vida_conducta.cantidad_campos_cambiados
+    return resultado
 
-    # 4. Retornar el contador o 'N/A' según si hubo actualizaciones
-    return total_campos_cambiados if hay_actualizaciones else 'N/A'
 
-
-def get_descriptions_from_comma_separated_ids(ids_string):
+def get_descriptions_from_comma_separated_ids(ids_string, opciones=None):
     """
     Toma una cadena de IDs separados por comas y devuelve una lista de sus descripciones
     desde la tabla aps_cue_opcion.
+
+    Las descripciones se resuelven contra el catálogo en caché (ver catalog_cache), sin
+    consultar la base de datos. Se conserva el resultado de la consulta original: IDs
+    únicos, en orden ascendente, omitiendo los que no existen.
+
+    Args:
+        ids_string (str): Cadena tipo '1,2,3'.
+        opciones (Mapping, optional): Catálogo {id: descripcion} ya obtenido por el llamador.
+
+    Returns:
+        list[str]: Descripciones de las opciones.
     """
     if not ids_string:
         return []
@@ -71,6 +121,85 @@ def get_descriptions_from_comma_separated_ids(ids_string):
     if not ids:
         return []
 
-    # Consultar la base de datos para obtener las descripciones de esos IDs
-    descriptions = ApsCueOpcion.query.filter(ApsCueOpcion.id.in_(ids)).all()
-    return [d.descripcion for d in descriptions]
\ No newline at end of file
+    if opciones is None:
+        opciones = get_catalog('opciones')
+    return [opciones[i] for i in sorted(set(ids)) if i in opciones]
+
+
+def decode_comma_separated_ids_bulk(ids_strings):
+    """
+    Decodifica en una sola pasada todas las cadenas de IDs separados por comas de una
+    página (p. ej. los campos *_txt de condiciones_habitat_familia). Cada cadena distinta
+    se procesa una sola vez contra el catálogo de opciones en caché.
+
+    Args:
+        ids_strings (iterable[str]): Cadenas a decodificar (puede contener repetidas o None).
+
+    Returns:
+        dict: {cadena: lista de descripciones}. Las listas se comparten entre registros con
+              la misma cadena, no deben modificarse.
+    """
+    opciones = get_catalog('opciones')
+    decodificadas = {}
+    for ids_string in ids_strings:
+        if ids_string not in decodificadas:
+            decodificadas[ids_string] = get_descriptions_from_comma_separated_ids(ids_string, opciones)
+    return decodificadas
+
+
+def encode_sync_cursor(familia_id, as_of, max_visita_id, total, since=None):
+    """
+    Genera el token opaco de paginación por cursor de initial-data.
+
+    El token codifica la clave de la última fila entregada (aps_ficha_familia_id, por la
+    que se ordena la descarga) y el snapshot de la descarga: el instante as_of y el mayor ID de visita existente
+    cuando empezó, para que las páginas siguientes no cambien si otro usuario sincroniza
+    a mitad de la descarga.
+
+    Args:
+        familia_id (int): aps_ficha_familia_id de la última fila de la página.
+        as_of (datetime): Instante de inicio de la descarga.
+        max_visita_id (int): Mayor ID de aps_visita al inicio de la descarga.
+        total (int): Total de familias del snapshot (se conserva entre páginas).
+        since (datetime, optional): Token 'since' de una descarga incremental (GET /changes).
+
+    Returns:
+        str: Token base64 url-safe.
+    """
+    payload = {
+        "f": familia_id,
+        "t": as_of.isoformat(),
+        "v": max_visita_id,
+        "n": total
+    }
+    if since is not None:
+        payload["s"] = since.isoformat()
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_sync_cursor(token):
+    """
+    Decodifica un token generado por encode_sync_cursor.
+
+    Args:
+        token (str): Token recibido en el parámetro 'cursor'.
+
+    Returns:
+        dict: Claves familia_id, as_of, max_visita_id, total y since.
+
+    Raises:
+        ValueError: Si el token no tiene el formato esperado.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+        return {
+            "familia_id": int(payload["f"]),
+            "as_of": datetime.datetime.fromisoformat(payload["t"]),
+            "max_visita_id": int(payload["v"]),
+            "total": int(payload["n"]),
+            "since": datetime.datetime.fromisoformat(payload["s"]) if payload.get("s") else None
+        }
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Cursor inválido: {e}")
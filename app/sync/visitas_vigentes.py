@@ -0,0 +1,188 @@
+# app/sync/visitas_vigentes.py
+from flask import current_app
+from sqlalchemy import func, select, insert, delete, and_, case
+from app.models import db, ApsFichaFamilia, ApsPersona, ApsVisita, ApsUbicacionFamilia, ApsFamiliaVisitaVigente
+from app.sync.table_cache import tables_exist
+
+# Tamaño de los lotes de familias al recalcular (límite del IN y del INSERT ... SELECT)
+LOTE_FAMILIAS = 500
+
+
+def visitas_vigentes_disponible():
+    """
+    Indica si initial-data puede leer de aps_familia_visita_vigente: la tabla debe existir
+    (se crea con `flask sync rebuild-visitas-vigentes`) y SYNC_USE_VISITAS_VIGENTES estar activo.
+    """
+    if not current_app.config.get('SYNC_USE_VISITAS_VIGENTES', True):
+        return False
+    return tables_exist(ApsFamiliaVisitaVigente)
+
+
+def visitas_vigentes_select(familia_ids=None):
+    """
+    SELECT que calcula las filas de aps_familia_visita_vigente a partir de las tablas base:
+    por familia y comuna, la visita activa (estado_ficha == 800) de mayor fecha_visita (en
+    empate, el ID más bajo), si la familia tiene personas con apellidos válidos en visitas
+    activas de esa comuna y si su apellido_familiar es válido.
+
+    Args:
+        familia_ids (list[int], optional): Restringe el cálculo a esas familias.
+
+    Returns:
+        Select: Columnas en el orden de VISITAS_VIGENTES_COLUMNAS.
+    """
+    ranked = select(
+        ApsVisita.aps_ficha_familia_id,
+        ApsUbicacionFamilia.base_comuna_corregimiento_id,
+        ApsVisita.id.label('aps_visita_id'),
+        ApsVisita.fecha_visita,
+        func.row_number().over(
+            partition_by=(ApsVisita.aps_ficha_familia_id, ApsUbicacionFamilia.base_comuna_corregimiento_id),
+            order_by=(ApsVisita.fecha_visita.desc(), ApsVisita.id.asc())
+        ).label('rn')
+    ).join(
+        ApsUbicacionFamilia, ApsUbicacionFamilia.aps_visita_id == ApsVisita.id
+    ).where(
+        ApsVisita.estado_ficha == 800
+    )
+
+    # Familias/comunas con al menos una persona de apellidos válidos en una visita activa
+    visita_persona = db.aliased(ApsVisita)
+    ubicacion_persona = db.aliased(ApsUbicacionFamilia)
+    con_personas = select(
+        ApsPersona.aps_ficha_familia_id,
+        ubicacion_persona.base_comuna_corregimiento_id
+    ).join(
+        visita_persona, ApsPersona.aps_visita_id == visita_persona.id
+    ).join(
+        ubicacion_persona, ubicacion_persona.aps_visita_id == visita_persona.id
+    ).where(
+        visita_persona.estado_ficha == 800,
+        ApsPersona.apellidos != 'NULL'
+    )
+
+    if familia_ids is not None:
+        ranked = ranked.where(ApsVisita.aps_ficha_familia_id.in_(familia_ids))
+        con_personas = con_personas.where(ApsPersona.aps_ficha_familia_id.in_(familia_ids))
+
+    ranked = ranked.subquery()
+    con_personas = con_personas.group_by(
+        ApsPersona.aps_ficha_familia_id, ubicacion_persona.base_comuna_corregimiento_id
+    ).subquery()
+
+    return select(
+        ranked.c.aps_ficha_familia_id,
+        ranked.c.base_comuna_corregimiento_id,
+        ranked.c.aps_visita_id,
+        ranked.c.fecha_visita,
+        case((con_personas.c.aps_ficha_familia_id.isnot(None), True), else_=False).label('tiene_personas'),
+        case((and_(
+            ApsFichaFamilia.apellido_familiar.isnot(None),
+            ApsFichaFamilia.apellido_familiar != '',
+            ApsFichaFamilia.apellido_familiar != 'NULL'
+        ), True), else_=False).label('familia_valida')
+    ).join(
+        ApsFichaFamilia, ApsFichaFamilia.id == ranked.c.aps_ficha_familia_id
+    ).outerjoin(
+        con_personas, and_(
+            con_personas.c.aps_ficha_familia_id == ranked.c.aps_ficha_familia_id,
+            con_personas.c.base_comuna_corregimiento_id == ranked.c.base_comuna_corregimiento_id
+        )
+    ).where(
+        ranked.c.rn == 1
+    )
+
+
+VISITAS_VIGENTES_COLUMNAS = (
+    'aps_ficha_familia_id', 'base_comuna_corregimiento_id', 'aps_visita_id',
+    'fecha_visita', 'tiene_personas', 'familia_valida'
+)
+
+
+def refresh_visitas_vigentes(familia_ids):
+    """
+    Recalcula las filas de aps_familia_visita_vigente de las familias indicadas (DELETE +
+    INSERT ... SELECT por lotes) dentro de la transacción actual. No hace commit.
+
+    Se aplica siempre que la tabla exista (aunque SYNC_USE_VISITAS_VIGENTES esté apagado y
+    sin confiar en un "no existe" cacheado): si no, la tabla quedaría desactualizada para los
+    procesos que sí la leen.
+
+    Args:
+        familia_ids (iterable[int]): Familias afectadas por los cambios.
+    """
+    familia_ids = sorted({fid for fid in familia_ids if fid})
+    if not familia_ids or not tables_exist(ApsFamiliaVisitaVigente, max_age=0):
+        return
+
+    # Las sentencias Core no hacen autoflush: los cambios ORM pendientes deben estar en la base
+    db.session.flush()
+
+    tabla = ApsFamiliaVisitaVigente.__table__
+    for i in range(0, len(familia_ids), LOTE_FAMILIAS):
+        lote = familia_ids[i:i + LOTE_FAMILIAS]
+        db.session.execute(delete(tabla).where(tabla.c.aps_ficha_familia_id.in_(lote)))
+        db.session.execute(insert(tabla).from_select(VISITAS_VIGENTES_COLUMNAS, visitas_vigentes_select(lote)))
+
+
+def rebuild_visitas_vigentes():
+    """
+    Crea aps_familia_visita_vigente si no existe y la recalcula completa en una transacción
+    (los lectores siguen viendo la versión anterior hasta el commit).
+
+    Returns:
+        int: Cantidad de filas generadas.
+    """
+    ApsFamiliaVisitaVigente.__table__.create(db.engine, checkfirst=True)
+
+    tabla = ApsFamiliaVisitaVigente.__table__
+    db.session.execute(delete(tabla))
+    familia_ids = [fid for fid, in db.session.query(ApsFichaFamilia.id).order_by(ApsFichaFamilia.id)]
+    for i in range(0, len(familia_ids), LOTE_FAMILIAS):
+        lote = familia_ids[i:i + LOTE_FAMILIAS]
+        db.session.execute(insert(tabla).from_select(VISITAS_VIGENTES_COLUMNAS, visitas_vigentes_select(lote)))
+    db.session.commit()
+
+    return db.session.query(func.count()).select_from(tabla).scalar()
+
+
+def familias_afectadas(sync_results):
+    """
+    Familias cuyo registro en aps_familia_visita_vigente puede cambiar tras un POST /changes:
+    las de las familias, visitas, personas y ubicaciones creadas, actualizadas o eliminadas.
+
+    Args:
+        sync_results (dict): Resultados de post_changes (se usan los remote_id).
+
+    Returns:
+        set[int]: IDs de aps_ficha_familia.
+    """
+    def remote_ids(tabla):
+        ids = set()
+        for accion in ('created', 'updated', 'deleted'):
+            for resultado in sync_results.get(tabla, {}).get(accion, []):
+                # El remote_id puede venir del móvil como texto
+                if str(resultado.get("remote_id") or '').isdigit():
+                    ids.add(int(resultado["remote_id"]))
+        return ids
+
+    familias = remote_ids('familias')
+
+    visita_ids = remote_ids('visitas')
+    ubicacion_ids = remote_ids('ubicaciones_familia')
+    if ubicacion_ids:
+        visita_ids |= {vid for vid, in db.session.query(ApsUbicacionFamilia.aps_visita_id).filter(
+            ApsUbicacionFamilia.id.in_(ubicacion_ids)
+        )}
+    if visita_ids:
+        familias |= {fid for fid, in db.session.query(ApsVisita.aps_ficha_familia_id).filter(
+            ApsVisita.id.in_(visita_ids)
+        )}
+
+    persona_ids = remote_ids('personas')
+    if persona_ids:
+        familias |= {fid for fid, in db.session.query(ApsPersona.aps_ficha_familia_id).filter(
+            ApsPersona.id.in_(persona_ids)
+        )}
+
+    return familias
@@ -0,0 +1,125 @@
+# benchmarks/serialization.py
+"""
+Compara la serialización de una página de transactional_data:
+
+- json: la ruta actual (jsonify, fechas como texto isoformat)
+- msgpack: MessagePack con fechas como Timestamp nativo
+- y las dos anteriores en formato columnar (app/sync/columnar.py)
+
+Reporta tiempo de codificación (mediana) y tamaño del payload sin comprimir, con gzip y con
+brotli. Las filas son sintéticas pero siguen las columnas de app/sync/schema.py, así que no
+necesita base de datos.
+
+Uso (desde la raíz del proyecto):
+    python benchmarks/serialization.py --familias 500 --repeticiones 20
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+from app.sync.schema import SECTION_COLUMNS, DICTIONARY_COLUMNS
+from app.sync.columnar import encode_columnar
+from app.sync.serialization import msgpack_available, packb
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Filas por familia en cada sección (aproximado a una página real)
+FILAS_POR_FAMILIA = {
+    "familias": 1, "visitas": 1, "ubicaciones_familia": 1, "condiciones_habitat_familia": 1, "personas": 4,
+}
+PERSONAS_POR_FAMILIA = 4
+
+
+def _valor(rnd, seccion, columna, fila_id):
+    if columna == "id":
+        return fila_id
+    if columna.endswith("_at") or columna.startswith("fecha"):
+        return datetime.date(2024, 1, 1) + datetime.timedelta(days=rnd.randint(0, 365))
+    if columna in DICTIONARY_COLUMNS.get(seccion, ()):
+        return rnd.choice(("Médico general", "Enfermería", "Oficina Centro", "Oficina Norte", "Cédula de ciudadanía", ""))
+    if columna.endswith("_id") or columna.endswith("_by") or columna.startswith("numero_"):
+        return rnd.randint(1, 50000)
+    if seccion == "condiciones_habitat_familia" and columna not in ("aps_visita_id", "aps_ficha_familia"):
+        return rnd.sample(("Agua potable", "Alcantarillado", "Gas natural", "Energía eléctrica"), k=2)
+    return f"{columna[:6]}-{rnd.randint(1, 99999)}"
+
+
+def generar_pagina(familias, semilla=1):
+    rnd = random.Random(semilla)
+    pagina = {}
+    for seccion, columnas in SECTION_COLUMNS.items():
+        filas_por_familia = FILAS_POR_FAMILIA.get(seccion, PERSONAS_POR_FAMILIA)
+        pagina[seccion] = [
+            {columna: _valor(rnd, seccion, columna, i) for columna in columnas}
+            for i in range(1, familias * filas_por_familia + 1)
+        ]
+    return pagina
+
+
+def _a_texto(pagina):
+    return {
+        seccion: [{k: v.isoformat() if isinstance(v, datetime.date) else v for k, v in fila.items()} for fila in filas]
+        for seccion, filas in pagina.items()
+    }
+
+
+def _columnar(pagina):
+    return {seccion: encode_columnar(seccion, filas) for seccion, filas in pagina.items()}
+
+
+def medir(codificar, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        datos = codificar()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos) * 1000, datos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--familias", type=int, default=500)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    # Basta una app Flask vacía: jsonify usa el mismo proveedor JSON que la API
+    app = Flask(__name__)
+    pagina = generar_pagina(args.familias)
+
+    # El tiempo de JSON incluye el isoformat() de las fechas, que la ruta actual hace al armar cada fila
+    casos = [
+        ("json", lambda: jsonify({"transactional_data": _a_texto(pagina)}).get_data()),
+        ("json columnar", lambda: jsonify({"transactional_data": _columnar(_a_texto(pagina))}).get_data()),
+    ]
+    if msgpack_available():
+        casos += [
+            ("msgpack", lambda: packb({"transactional_data": pagina})),
+            ("msgpack columnar", lambda: packb({"transactional_data": _columnar(pagina)})),
+        ]
+    else:
+        print("msgpack no está instalado: solo se mide JSON")
+
+    filas = sum(len(v) for v in pagina.values())
+    print(f"{args.familias} familias, {filas} filas, mediana de {args.repeticiones} repeticiones\n")
+    print(f"{'formato':<18}{'encode ms':>10}{'bytes':>12}{'gzip-6':>10}{'br-4':>10}")
+    with app.test_request_context():
+        for nombre, codificar in casos:
+            ms, datos = medir(codificar, args.repeticiones)
+            gzip_len = len(zlib.compress(datos, 6))
+            br_len = len(brotli.compress(datos, quality=4)) if brotli else 0
+            print(f"{nombre:<18}{ms:>10.1f}{len(datos):>12}{gzip_len:>10}{br_len:>10}")
+
+
+if __name__ == "__main__":
+    main()
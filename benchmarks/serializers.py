@@ -0,0 +1,162 @@
+# benchmarks/serializers.py
+"""
+Compara, por tabla, el armado de filas con dicts escritos a mano (la forma anterior de
+build_initial_data_sections) contra los serializadores compilados de app/sync/serializers.py.
+
+Las filas son Row reales de SQLAlchemy leídas de una tabla SQLite en memoria con las columnas
+(y tipos) que selecciona la consulta de cada sección, así que no necesita MySQL.
+
+Uso (desde la raíz del proyecto):
+    python benchmarks/serializers.py --filas 10000 --repeticiones 20
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import Column, Date, DateTime, Integer, MetaData, Table, create_engine, insert, select
+from app.sync.schema import SECCIONES_POR_NOMBRE
+from app.sync.serializers import compile_serializer, serializer_columns
+
+CATALOGOS = {
+    "opciones": {i: f"Opción {i}" for i in range(1, 900)},
+    "tipos_documento": {1: "CC", 2: "TI", 3: "RC"},
+    "comunas": {i: f"Comuna {i}" for i in range(1, 20)},
+    "barrios": {i: f"Barrio {i}" for i in range(1, 200)},
+    "novedades": {i: f"Novedad {i}" for i in range(1, 400)},
+}
+
+
+def generar_filas(seccion, cantidad, semilla=1):
+    rnd = random.Random(semilla)
+    modelo = seccion.modelo
+    columnas = serializer_columns(seccion.campos)
+    tabla = Table("filas", MetaData(), *(Column(c, modelo.__table__.columns[c].type) for c in columnas))
+
+    def valor(tipo):
+        if isinstance(tipo, DateTime):
+            return datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=rnd.randint(0, 500000))
+        if isinstance(tipo, Date):
+            return datetime.date(2024, 1, 1) + datetime.timedelta(days=rnd.randint(0, 365))
+        if isinstance(tipo, Integer):
+            return rnd.randint(1, 800)
+        return f"txt-{rnd.randint(1, 99999)}"
+
+    engine = create_engine("sqlite://")
+    with engine.begin() as conexion:
+        tabla.create(conexion)
+        conexion.execute(insert(tabla), [
+            {c.name: valor(c.type) for c in tabla.columns} for _ in range(cantidad)
+        ])
+        return conexion.execute(select(tabla)).all()
+
+
+# --- Versiones escritas a mano (copiadas de build_initial_data_sections antes del cambio) ---
+def _iso(valor):
+    return valor.isoformat() if valor and hasattr(valor, 'isoformat') else None
+
+
+def _traduccion(catalogo, codigo):
+    return CATALOGOS[catalogo].get(codigo, '') if codigo else ''
+
+
+def persona_manual(p):
+    return {
+        "id": p.id,
+        "aps_ficha_familia_id": p.aps_ficha_familia_id,
+        "fecha_registro": _iso(p.fecha_registro),
+        "nombres": p.nombres,
+        "apellidos": p.apellidos,
+        "numero_documento": p.numero_documento,
+        "tb_tipo_documento_id": p.tb_tipo_documento_id,
+        "tb_tipo_documento_tipo": _traduccion("tipos_documento", p.tb_tipo_documento_id),
+        "sexo_id": p.sexo,
+        "sexo_descripcion": _traduccion("opciones", p.sexo),
+        "etnia_id": p.etnia,
+        "etnia_descripcion": _traduccion("opciones", p.etnia),
+        "edad": p.edad,
+        "fecha_nacimiento": _iso(p.fecha_nacimiento),
+        "created_at": _iso(p.created_at),
+        "updated_at": _iso(p.updated_at),
+        "created_by": p.created_by,
+        "updated_by": p.updated_by,
+        "aps_visita_id": p.aps_visita_id,
+        "novedad": CATALOGOS["novedades"].get(p.id, '')
+    }
+
+
+def ubicacion_manual(uf):
+    return {
+        "id": uf.id,
+        "aps_visita_id": uf.aps_visita_id,
+        "zona": uf.zona,
+        "base_comuna_corregimiento_id": uf.base_comuna_corregimiento_id,
+        "base_comuna_corregimiento_nombre": _traduccion("comunas", uf.base_comuna_corregimiento_id),
+        "base_barrio_vereda_id": uf.base_barrio_vereda_id,
+        "base_barrio_vereda_nombre": _traduccion("barrios", uf.base_barrio_vereda_id),
+        "direccion": uf.direccion,
+        "ficha_catastral": uf.ficha_catastral,
+        "numero_cuadrante": uf.numero_cuadrante,
+        "created_at": _iso(uf.created_at),
+        "updated_at": _iso(uf.updated_at),
+        "created_by": uf.created_by,
+        "updated_by": uf.updated_by
+    }
+
+
+def detalle_manual(detalle):
+    return {
+        "id": detalle.id,
+        "aps_persona_id": detalle.aps_persona_id,
+        "aps_visita_id": detalle.aps_visita_id,
+        "created_at": _iso(detalle.created_at),
+        "updated_at": _iso(detalle.updated_at),
+        "created_by": detalle.created_by,
+        "updated_by": detalle.updated_by
+    }
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--filas", type=int, default=10000)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    casos = [
+        ("personas", persona_manual),
+        ("ubicaciones_familia", ubicacion_manual),
+        ("persona_dato_basico", detalle_manual),
+    ]
+
+    print(f"{args.filas} filas por tabla, mediana de {args.repeticiones} repeticiones\n")
+    print(f"{'tabla':<22}{'manual ms':>11}{'compilado ms':>14}{'speedup':>9}")
+    for nombre, manual in casos:
+        seccion = SECCIONES_POR_NOMBRE[nombre]
+        filas = generar_filas(seccion, args.filas)
+        compilado = compile_serializer(seccion)
+
+        # Misma salida (mismas claves, mismo orden y mismos valores)
+        for fila in filas[:100]:
+            assert list(compilado(fila, CATALOGOS).items()) == list(manual(fila).items()), nombre
+
+        ms_manual = medir(lambda: [manual(fila) for fila in filas], args.repeticiones)
+        ms_compilado = medir(lambda: [compilado(fila, CATALOGOS) for fila in filas], args.repeticiones)
+        print(f"{nombre:<22}{ms_manual:>11.2f}{ms_compilado:>14.2f}{ms_manual / ms_compilado:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# tests/conftest.py
+# Aplicación sobre una base SQLite temporal con un territorio mínimo (una familia con su visita,
+# ubicación, hábitat y una persona con estilos de vida) y, con el fixture `territorio`, varias
+# familias más para las descargas (última visita por familia, personas y paginación).
+import datetime
+
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from app import create_app
+from app.config import Config
+from app.models import db, User, AuthOficina, ComProfesion, BaseComunaCorregimiento, BaseBarrioVereda, \
+                       BaseTipoDocumento, ApsCueOpcion, Equipo, EquipoUser, EquipoComunaCorregimiento, \
+                       ApsFichaFamilia, ApsVisita, ApsUbicacionFamilia, ApsCondicionesHabitatFamilia, ApsPersona, \
+                       ApsPersonaEstilosVidaConducta
+from app.sync.catalog_cache import catalog_cache
+from app.sync.table_cache import forget_tables
+
+FECHA = datetime.date(2024, 1, 5)
+
+
+def _sqlite_con_savepoints(engine):
+    # pysqlite no emite BEGIN y un RELEASE SAVEPOINT fuera de transacción confirma los cambios:
+    # se delega el control de transacciones a SQLAlchemy (receta de la documentación de SQLite)
+    @event.listens_for(engine, 'connect')
+    def _conectar(conexion_dbapi, registro):
+        conexion_dbapi.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def _empezar(conexion):
+        conexion.exec_driver_sql('BEGIN')
+
+
+def seed():
+    """Datos mínimos: catálogos, dos usuarios (user1 con la comuna 1) y la familia 1."""
+    if 'eps' not in db.metadata.tables:
+        # aps_persona_dato_basico.eps_id referencia una tabla que no está en los modelos
+        db.Table('eps', db.metadata, db.Column('id', db.Integer, primary_key=True))
+    db.create_all()
+
+    db.session.add_all([
+        AuthOficina(id=1, nombre='Oficina'), ComProfesion(id=1, tipo='Medico', grupo=1),
+        BaseTipoDocumento(id=1, tipo='CC'),
+        BaseComunaCorregimiento(id=1, codigo='1', nombre='Comuna 1', zona=1),
+        BaseBarrioVereda(id=1, base_comuna_corregimiento=1, codigo='1', nombre='Barrio 1'),
+        ApsCueOpcion(id=1, aps_cue_pregunta=1, descripcion='Opción 1'),
+    ])
+    momento = datetime.datetime(2024, 1, 1)
+    for user_id in (1, 2):
+        db.session.add(User(
+            id=user_id, name=f'Usuario {user_id}', username=f'user{user_id}', com_profesion=1, documento=f'D{user_id}',
+            email=f'user{user_id}@example.com', auth_key='k', password_hash='x', estado=1, auth_oficina=1,
+            created_at=momento, updated_at=momento, created_by=1, updated_by=1
+        ))
+    db.session.add_all([
+        Equipo(id=1, numero_equipo=1, nombre='Equipo 1'), EquipoUser(id=1, equipo_id=1, user_id=1),
+        EquipoComunaCorregimiento(id=1, equipo_id=1, base_comuna_corregimiento_id=1),
+    ])
+    db.session.flush()
+
+    db.session.add(ApsFichaFamilia(
+        id=1, apellido_familiar='Pérez', celular_cabeza_familia='300', estado_ficha=800,
+        created_at=datetime.datetime(2024, 1, 5, 8), updated_at=datetime.datetime(2024, 1, 5, 8), created_by=1, updated_by=1
+    ))
+    db.session.add(ApsVisita(
+        id=1, aps_ficha_familia_id=1, fecha_visita=FECHA, tipo_actividad=1, auth_oficina=1, com_profesion=1, duracion=30,
+        created_at=FECHA, updated_at=FECHA, created_by=1, updated_by=1, estado_ficha=800, valido=True, vigencia_registro=True
+    ))
+    db.session.add(ApsUbicacionFamilia(
+        id=1, aps_visita_id=1, zona=1, base_comuna_corregimiento_id=1, base_barrio_vereda_id=1, direccion='Calle 1',
+        created_at=FECHA, updated_at=FECHA, created_by=FECHA, updated_by=FECHA
+    ))
+    db.session.add(ApsCondicionesHabitatFamilia(
+        id=1, aps_visita_id=1, aps_ficha_familia=1, aps_aspectos_generales_txt='1', aps_condiciones_locativas_txt='',
+        aps_condiciones_agua_txt='', aps_dotacion_sanitaria_txt='', aps_alimentos_txt='', aps_tenencia_animales_txt='',
+        aps_entorno_vivienda_txt='', created_at=FECHA, updated_at=FECHA, created_by=1, updated_by=1
+    ))
+    db.session.add(ApsPersona(
+        id=1, aps_ficha_familia_id=1, aps_visita_id=1, fecha_registro=FECHA, nombres='Ana', apellidos='Pérez',
+        tb_tipo_documento_id=1, numero_documento='100', fecha_nacimiento=datetime.date(1990, 1, 1), edad=34, rango_edad=1,
+        sexo=1, etnia=1, identidad_sexual=1, transgenero='no', vigencia_registro=True,
+        created_at=FECHA, updated_at=FECHA, created_by=1, updated_by=1
+    ))
+    estilos = {'id': 1, 'aps_persona_id': 1, 'aps_visita_id': 1, 'created_at': FECHA, 'updated_at': FECHA,
+               'created_by': 1, 'updated_by': 1}
+    for columna in ApsPersonaEstilosVidaConducta.__table__.columns:
+        if not columna.nullable and not columna.primary_key and columna.name not in estilos:
+            estilos[columna.name] = '' if isinstance(columna.type, db.String) else 0
+    db.session.add(ApsPersonaEstilosVidaConducta(**estilos))
+    db.session.commit()
+
+
+def agregar_visita(visita_id, familia_id, fecha, estado_ficha=800, valido=True, comuna=1):
+    """Visita con su ubicación (mismo ID) en la comuna indicada."""
+    db.session.add(ApsVisita(
+        id=visita_id, aps_ficha_familia_id=familia_id, fecha_visita=fecha, tipo_actividad=1, auth_oficina=1,
+        com_profesion=1, duracion=30, created_at=fecha, updated_at=fecha, created_by=1, updated_by=1,
+        estado_ficha=estado_ficha, valido=valido, vigencia_registro=True
+    ))
+    db.session.add(ApsUbicacionFamilia(
+        id=visita_id, aps_visita_id=visita_id, zona=1, base_comuna_corregimiento_id=comuna, base_barrio_vereda_id=1,
+        direccion=f'Calle {visita_id}', created_at=fecha, updated_at=fecha, created_by=fecha, updated_by=fecha
+    ))
+
+
+def agregar_persona(persona_id, familia_id, visita_id, documento, vigente=True, apellidos='Apellido',
+                    campos_cambiados=None, fecha=FECHA):
+    """Persona; con campos_cambiados se agrega su registro de estilos de vida."""
+    db.session.add(ApsPersona(
+        id=persona_id, aps_ficha_familia_id=familia_id, aps_visita_id=visita_id, fecha_registro=fecha,
+        nombres=f'Persona {persona_id}', apellidos=apellidos, tb_tipo_documento_id=1, numero_documento=documento,
+        fecha_nacimiento=datetime.date(1990, 1, 1), edad=34, rango_edad=1, sexo=1, etnia=1, identidad_sexual=1,
+        transgenero='no', vigencia_registro=vigente, created_at=fecha, updated_at=fecha, created_by=1, updated_by=1
+    ))
+    if campos_cambiados is not None:
+        estilos = {'id': persona_id, 'aps_persona_id': persona_id, 'aps_visita_id': visita_id, 'created_at': fecha,
+                   'updated_at': fecha, 'created_by': 1, 'updated_by': 1}
+        for columna in ApsPersonaEstilosVidaConducta.__table__.columns:
+            if not columna.nullable and not columna.primary_key and columna.name not in estilos:
+                estilos[columna.name] = '' if isinstance(columna.type, db.String) else 0
+        estilos['cantidad_campos_cambiados'] = campos_cambiados
+        db.session.add(ApsPersonaEstilosVidaConducta(**estilos))
+
+
+def seed_territorio():
+    """
+    Familias 2 a 8 además de la 1 de seed(). Válidas (con su última visita y personas vigentes):
+
+        1: visita 1; persona 1 (documento 100)
+        2: visitas 2 y 3 -> 3; personas 3 (documento 200, versión nueva de la 2) y 4 (documento 201)
+        3: visitas 4 y 5 (más reciente pero inactiva e inválida) -> 4; persona 5
+        4: visita 6; su única persona (6) con vigencia_registro = 0. aps_ficha_familia no tiene
+           vigencia_registro en el modelo: una familia eliminada es la que solo tiene personas no
+           vigentes, y el cálculo original no la excluye
+        7: visitas 9 y 10 con la misma fecha -> 9 (empate por ID menor); persona 10 (documento 700,
+           versión de la 9 con la misma fecha de visita y mayor ID)
+
+    Excluidas: 5 (apellido_familiar vacío), 6 (visita en la comuna 2, fuera del territorio de
+    user1) y 8 (solo personas con apellidos 'NULL').
+    """
+    db.session.add(BaseComunaCorregimiento(id=2, codigo='2', nombre='Comuna 2', zona=1))
+    momento = datetime.datetime(2024, 1, 5, 8)
+    for familia_id, apellido in ((2, 'Gómez'), (3, 'López'), (4, 'Ruiz'), (5, ''), (6, 'Otro'), (7, 'Mora'), (8, 'Vega')):
+        db.session.add(ApsFichaFamilia(
+            id=familia_id, apellido_familiar=apellido, estado_ficha=800,
+            created_at=momento, updated_at=momento, created_by=1, updated_by=2
+        ))
+    agregar_visita(2, 2, datetime.date(2024, 1, 10))
+    agregar_visita(3, 2, datetime.date(2024, 2, 1))
+    agregar_visita(4, 3, datetime.date(2024, 3, 1))
+    agregar_visita(5, 3, datetime.date(2024, 4, 1), estado_ficha=900, valido=False)
+    agregar_visita(6, 4, datetime.date(2024, 1, 20))
+    agregar_visita(7, 5, datetime.date(2024, 1, 20))
+    agregar_visita(8, 6, datetime.date(2024, 1, 20), comuna=2)
+    agregar_visita(9, 7, datetime.date(2024, 5, 1))
+    agregar_visita(10, 7, datetime.date(2024, 5, 1))
+    agregar_visita(11, 8, datetime.date(2024, 5, 1))
+
+    agregar_persona(2, 2, 2, '200', vigente=False, campos_cambiados=9)
+    agregar_persona(3, 2, 3, '200', campos_cambiados=4)
+    agregar_persona(4, 2, 2, '201', campos_cambiados=7)
+    agregar_persona(5, 3, 4, '300', campos_cambiados=2)
+    agregar_persona(6, 4, 6, '400', vigente=False)
+    agregar_persona(7, 5, 7, '500')
+    agregar_persona(8, 6, 8, '600')
+    agregar_persona(9, 7, 9, '700', vigente=False)
+    agregar_persona(10, 7, 10, '700')
+    agregar_persona(11, 8, 11, '800', apellidos='NULL')
+    db.session.commit()
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'sync.db'}"
+        SYNC_JOBS_DIR = str(tmp_path / 'sync_jobs')
+        CATALOG_CACHE_STAMP_DIR = str(tmp_path / 'catalog_cache')
+
+    app = create_app(TestConfig)
+    forget_tables()
+    catalog_cache.invalidate()
+    with app.app_context():
+        _sqlite_con_savepoints(db.engine)
+        seed()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def territorio(app):
+    with app.app_context():
+        seed_territorio()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(app):
+    with app.app_context():
+        return {'Authorization': f"Bearer {create_access_token(identity='user1')}"}
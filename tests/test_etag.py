@@ -0,0 +1,76 @@
+# tests/test_etag.py
+# ETag / If-None-Match de GET /api/v1/sync/initial-data: 304 mientras el territorio no cambie y
+# un ETag nuevo tras un POST /changes del mismo día (los updated_at DATE no lo distinguen).
+import pytest
+
+from app.models import db, SyncTerritoryVersion
+from app.sync.table_cache import forget_tables
+from app.sync.visitas_vigentes import rebuild_visitas_vigentes
+
+URL = '/api/v1/sync/initial-data'
+
+
+@pytest.fixture(autouse=True)
+def visitas_vigentes(territorio):
+    with territorio.app_context():
+        rebuild_visitas_vigentes()
+
+
+def _renombrar_persona(client, auth_headers, nombres):
+    respuesta = client.post('/api/v1/sync/changes', json={
+        "personas": {
+            "updated": [{"id": "p-5", "remote_id": 5, "nombres": nombres, "last_modified_at": "2099-01-01"}],
+        },
+    }, headers=auth_headers)
+    assert respuesta.status_code == 200, respuesta.get_json()
+
+
+def test_304_mientras_el_territorio_no_cambia(territorio, client, auth_headers):
+    primera = client.get(URL, headers=auth_headers)
+    assert primera.status_code == 200 and primera.headers['ETag']
+
+    segunda = client.get(URL, headers={**auth_headers, 'If-None-Match': primera.headers['ETag']})
+    assert segunda.status_code == 304
+    assert segunda.headers['ETag'] == primera.headers['ETag']
+    assert segunda.data == b''
+
+
+def test_cambio_del_mismo_dia_genera_etag_nuevo(territorio, client, auth_headers):
+    etag = client.get(URL, headers=auth_headers).headers['ETag']
+
+    # La persona 5 cambia dos veces el mismo día: después del primer cambio ni COUNT, ni
+    # MAX(id), ni MAX(updated_at) DATE distinguen el segundo
+    for nombres in ('Rosa', 'Rosa Elena'):
+        _renombrar_persona(client, auth_headers, nombres)
+        respuesta = client.get(URL, headers={**auth_headers, 'If-None-Match': etag})
+        assert respuesta.status_code == 200
+        assert respuesta.headers['ETag'] != etag
+        etag = respuesta.headers['ETag']
+        personas = {p['id']: p for p in respuesta.get_json()['transactional_data']['personas']}
+        assert personas[5]['nombres'] == nombres
+
+    assert client.get(URL, headers={**auth_headers, 'If-None-Match': etag}).status_code == 304
+    with territorio.app_context():
+        assert db.session.get(SyncTerritoryVersion, 1).version == 2
+
+
+def test_sin_tabla_de_versiones_no_se_emite_etag(territorio, client, auth_headers):
+    with territorio.app_context():
+        SyncTerritoryVersion.__table__.drop(db.engine)
+    forget_tables()
+    respuesta = client.get(URL, headers={**auth_headers, 'If-None-Match': '"cualquiera"'})
+    assert respuesta.status_code == 200
+    assert 'ETag' not in respuesta.headers
+
+
+def test_cambio_en_tabla_de_detalle_incrementa_la_version(territorio, client, auth_headers):
+    # Los detalles de persona no pasan por familias_afectadas: la familia se resuelve por su visita
+    respuesta = client.post('/api/v1/sync/changes', json={
+        "persona_estilos_vida_conducta": {
+            "updated": [{"id": "e-5", "remote_id": 5, "peso": "70.5", "last_modified_at": "2099-01-01"}],
+        },
+    }, headers=auth_headers)
+    assert respuesta.status_code == 200, respuesta.get_json()
+    with territorio.app_context():
+        assert db.session.get(SyncTerritoryVersion, 1).version == 1
+        assert db.session.get(SyncTerritoryVersion, 2) is None
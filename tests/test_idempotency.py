@@ -0,0 +1,82 @@
+# tests/test_idempotency.py
+# Idempotencia de POST /api/v1/sync/changes: lotes con Idempotency-Key (sync_batch) y registros
+# creados con client_uuid (sync_item).
+import pytest
+
+from app.models import db, ApsFichaFamilia, ApsVisita, ApsPersona, SyncBatch, SyncItem
+
+URL = '/api/v1/sync/changes'
+
+LOTE = {
+    "familias": {"created": [
+        {"id": "f-1", "client_uuid": "0b7c6a0e-0000-4000-8000-000000000001", "apellido_familiar": "Gómez",
+         "celular_cabeza_familia": "301", "estado_ficha": 800, "created_at": "2024-03-01T10:00:00",
+         "created_by": 1, "updated_by": 1},
+    ]},
+    "visitas": {"created": [
+        {"id": "v-1", "client_uuid": "0b7c6a0e-0000-4000-8000-000000000002", "aps_ficha_familia_local_id": "f-1",
+         "fecha_visita": "2024-03-01", "created_at": "2024-03-01", "tipo_actividad": 2, "auth_oficina": 1,
+         "com_profesion": 1, "duracion": 20, "created_by": 1, "updated_by": 1, "estado_ficha": 800,
+         "valido": True, "vigencia_registro": True},
+    ]},
+    "personas": {"updated": [{"id": "p-1", "remote_id": 1, "nombres": "Ana María", "last_modified_at": "2099-01-01"}]},
+}
+
+
+def _cantidades(app):
+    with app.app_context():
+        return {modelo.__tablename__: db.session.query(modelo).count()
+                for modelo in (ApsFichaFamilia, ApsVisita, ApsPersona, SyncBatch, SyncItem)}
+
+
+def _enviar(client, auth_headers, lote, clave=None):
+    headers = {**auth_headers, 'Idempotency-Key': clave} if clave else auth_headers
+    return client.post(URL, json=lote, headers=headers)
+
+
+def test_reintento_con_la_misma_clave_devuelve_el_resultado_guardado(app, client, auth_headers):
+    primera = _enviar(client, auth_headers, LOTE, 'lote-1')
+    assert primera.status_code == 200
+    assert 'Idempotent-Replayed' not in primera.headers
+    cantidades = _cantidades(app)
+    assert cantidades['sync_batch'] == 1 and cantidades['sync_item'] == 2
+
+    segunda = _enviar(client, auth_headers, LOTE, 'lote-1')
+    assert segunda.status_code == 200
+    assert segunda.headers['Idempotent-Replayed'] == 'true'
+    assert segunda.get_json()['sync_results'] == primera.get_json()['sync_results']
+    assert _cantidades(app) == cantidades
+
+
+def test_misma_clave_con_otro_cuerpo_se_rechaza(app, client, auth_headers):
+    assert _enviar(client, auth_headers, LOTE, 'lote-1').status_code == 200
+    cantidades = _cantidades(app)
+
+    otro = {"personas": {"updated": [{"id": "p-1", "remote_id": 1, "nombres": "Otra", "last_modified_at": "2099-01-01"}]}}
+    respuesta = _enviar(client, auth_headers, otro, 'lote-1')
+    assert respuesta.status_code == 422
+    assert respuesta.get_json()['error'] == 'idempotency_key_reused'
+    assert _cantidades(app) == cantidades
+    with app.app_context():
+        assert db.session.get(ApsPersona, 1).nombres == 'Ana María'
+
+
+@pytest.mark.parametrize('clave', [None, 'lote-2'], ids=['sin_clave', 'otra_clave'])
+def test_client_uuid_repetido_en_otro_lote_no_crea_registros(app, client, auth_headers, clave):
+    primera = _enviar(client, auth_headers, LOTE, 'lote-1').get_json()['sync_results']
+    cantidades = _cantidades(app)
+
+    # El móvil no recibió la respuesta y reenvía los registros en un lote nuevo
+    segunda = _enviar(client, auth_headers, LOTE, clave)
+    assert segunda.status_code == 200
+    resultados = segunda.get_json()['sync_results']
+    for seccion in ('familias', 'visitas'):
+        creado, = resultados[seccion]['created']
+        assert creado['status'] == 'success' and creado['replayed'] is True
+        assert creado['remote_id'] == primera[seccion]['created'][0]['remote_id']
+
+    cantidades['sync_batch'] += 1 if clave else 0
+    assert _cantidades(app) == cantidades
+    with app.app_context():
+        visita = db.session.get(ApsVisita, primera['visitas']['created'][0]['remote_id'])
+        assert visita.aps_ficha_familia_id == primera['familias']['created'][0]['remote_id']
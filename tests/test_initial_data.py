@@ -0,0 +1,132 @@
+# tests/test_initial_data.py
+# GET /api/v1/sync/initial-data sobre el territorio de conftest.seed_territorio: familias válidas,
+# última visita por familia, versión vigente de cada persona y total de campos actualizados,
+# frente a lo que calculaba el recorrido en Python original.
+import pytest
+from sqlalchemy import select
+
+from app.models import db, ApsVisita, ApsUbicacionFamilia, ApsPersona
+from app.sync.queries import fetch_concurrently
+from app.sync.visitas_vigentes import rebuild_visitas_vigentes
+
+URL = '/api/v1/sync/initial-data'
+
+# {familia: (última visita, personas en su última versión, total_campos_actualizados_ultima_visita)}
+ESPERADO = {
+    1: (1, [1], 'N/A'),
+    2: (3, [3, 4], 4),
+    3: (4, [5], 'N/A'),
+    4: (6, [6], 'N/A'),
+    7: (9, [10], 0),
+}
+FAMILIAS = sorted(ESPERADO)
+
+
+@pytest.fixture(params=['tablas_base', 'tabla_lectura', 'detalles_en_paralelo'])
+def modo(request, territorio):
+    """Misma descarga calculada sobre las tablas base, sobre aps_familia_visita_vigente y con
+    las consultas de detalle en paralelo."""
+    territorio.config['SYNC_USE_VISITAS_VIGENTES'] = request.param == 'tabla_lectura'
+    territorio.config['SYNC_DETAIL_FETCH_WORKERS'] = 4 if request.param == 'detalles_en_paralelo' else 1
+    if request.param == 'tabla_lectura':
+        with territorio.app_context():
+            rebuild_visitas_vigentes()
+    return request.param
+
+
+def _pagina(client, auth_headers, **params):
+    respuesta = client.get(URL, query_string=params, headers=auth_headers)
+    assert respuesta.status_code == 200, respuesta.get_json()
+    return respuesta.get_json()
+
+
+def _ids(filas, clave='id'):
+    return sorted(fila[clave] for fila in filas)
+
+
+def assert_pagina(datos, familias):
+    """Las secciones de la página corresponden exactamente a `familias` (ver ESPERADO)."""
+    secciones = datos['transactional_data']
+    visitas = [ESPERADO[f][0] for f in familias]
+    personas = sorted(p for f in familias for p in ESPERADO[f][1])
+
+    assert _ids(secciones['familias']) == familias
+    assert {f['id']: f['total_campos_actualizados_ultima_visita'] for f in secciones['familias']} == {
+        f: ESPERADO[f][2] for f in familias
+    }
+    assert _ids(secciones['visitas']) == sorted(visitas)
+    # Las ubicaciones tienen el ID de su visita (ver conftest.agregar_visita)
+    assert _ids(secciones['ubicaciones_familia']) == sorted(visitas)
+    assert _ids(secciones['personas']) == personas
+    assert _ids(secciones['persona_estilos_vida_conducta'], 'aps_persona_id') == [
+        p for p in personas if p in (1, 3, 4, 5)
+    ]
+
+
+@pytest.mark.usefixtures('modo')
+def test_paginas_de_initial_data(client, auth_headers):
+    for page, familias, has_next in ((1, [1, 2], True), (2, [3, 4], True), (3, [7], False)):
+        datos = _pagina(client, auth_headers, page=page, per_page=2)
+        assert_pagina(datos, familias)
+        assert datos['pagination_meta'] == {
+            "page": page, "per_page": 2, "total": 5, "pages": 3, "has_next": has_next, "has_prev": page > 1
+        }
+
+
+@pytest.mark.usefixtures('modo')
+def test_pagina_unica_y_pagina_fuera_de_rango(client, auth_headers):
+    assert_pagina(_pagina(client, auth_headers), FAMILIAS)
+
+    datos = _pagina(client, auth_headers, page=4, per_page=2)
+    assert all(filas == [] for filas in datos['transactional_data'].values())
+    assert datos['pagination_meta'] == {
+        "page": 4, "per_page": 2, "total": 5, "pages": 3, "has_next": False, "has_prev": True
+    }
+
+
+@pytest.mark.usefixtures('modo')
+def test_ultima_version_de_cada_persona(client, auth_headers):
+    personas = {p['id']: p for p in _pagina(client, auth_headers)['transactional_data']['personas']}
+    # Documento 200: la versión de la visita 3 (la más reciente) y no la de la visita 2
+    assert personas[3]['numero_documento'] == '200' and 2 not in personas
+    # Documento 700: dos versiones con la misma fecha de visita, gana la de mayor ID
+    assert personas[10]['aps_visita_id'] == 10 and 9 not in personas
+
+
+def test_territorio_sin_familias_validas(territorio, client, auth_headers):
+    with territorio.app_context():
+        # Ninguna visita activa: hay visitas en el territorio pero ninguna familia válida
+        db.session.execute(db.text('UPDATE aps_visita SET estado_ficha = 900'))
+        db.session.commit()
+    datos = _pagina(client, auth_headers, per_page=2)
+    assert datos['message'].startswith('No hay visitas válidas')
+    assert datos['pagination_meta'] == {
+        "page": 1, "per_page": 2, "total": 0, "pages": 0, "has_next": False, "has_prev": False
+    }
+
+
+def test_detalles_en_paralelo_iguales_a_en_serie(territorio, client, auth_headers):
+    territorio.config['SYNC_USE_VISITAS_VIGENTES'] = False
+    secciones = {}
+    for workers in (1, 4):
+        territorio.config['SYNC_DETAIL_FETCH_WORKERS'] = workers
+        secciones[workers] = _pagina(client, auth_headers)['transactional_data']
+    assert secciones[4] == secciones[1]
+    assert all(secciones[1][nombre] for nombre in ('ubicaciones_familia', 'condiciones_habitat_familia',
+                                                    'persona_estilos_vida_conducta'))
+
+
+def test_fetch_concurrently_mismas_filas_en_paralelo_y_en_serie(territorio):
+    consultas = {
+        "visitas": select(ApsVisita.id, ApsVisita.fecha_visita).order_by(ApsVisita.id),
+        "ubicaciones": select(ApsUbicacionFamilia.id, ApsUbicacionFamilia.direccion).order_by(ApsUbicacionFamilia.id),
+        "personas": select(ApsPersona.id, ApsPersona.numero_documento).order_by(ApsPersona.id),
+    }
+    filas = {}
+    with territorio.app_context():
+        for workers in (1, 4):
+            territorio.config['SYNC_DETAIL_FETCH_WORKERS'] = workers
+            filas[workers] = {nombre: [tuple(f) for f in resultado]
+                              for nombre, resultado in fetch_concurrently(consultas).items()}
+    assert filas[4] == filas[1]
+    assert [f[0] for f in filas[1]["personas"]] == list(range(1, 12))
@@ -0,0 +1,176 @@
+# tests/test_jobs.py
+# Trabajos asíncronos de POST /changes (app/sync/jobs.py) sobre una cola en el directorio
+# temporal del fixture `app` (SYNC_JOBS_DIR).
+import json
+import os
+import threading
+import time
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app.models import db, User, ApsFichaFamilia, SyncBatch
+from app.sync import jobs
+from app.sync.idempotency import finish_batch
+
+LOTE = {
+    "familias": {"created": [
+        {"id": "f-1", "apellido_familiar": "Gómez", "celular_cabeza_familia": "301", "estado_ficha": 800,
+         "created_at": "2024-03-01T10:00:00", "created_by": 1, "updated_by": 1},
+    ]},
+}
+
+
+class _SinEjecutar:
+    # Pool que no ejecuta nada: los trabajos quedan en cola y el test llama a run_changes_job
+    def submit(self, *args, **kwargs):
+        return None
+
+
+@pytest.fixture
+def cola(app, monkeypatch):
+    monkeypatch.setattr(jobs, '_get_executor', lambda workers: _SinEjecutar())
+    return app
+
+
+def _encolar(app, cuerpo=None):
+    with app.app_context():
+        user = db.session.get(User, 1)
+        datos = cuerpo if cuerpo is not None else json.dumps(LOTE).encode('utf-8')
+        return jobs.submit_changes_job(datos, 'application/json', user, items=1)
+
+
+def _familias(app):
+    with app.app_context():
+        return db.session.query(ApsFichaFamilia).count()
+
+
+def test_trabajo_ya_confirmado_por_otro_worker_no_se_aplica_dos_veces(cola):
+    trabajo = _encolar(cola)
+    lote_id = trabajo['lote_id']
+    assert lote_id
+
+    # Otro worker aplicó y confirmó el trabajo, pero murió antes de retirarlo de la cola (o este
+    # worker lo retomó tras vencer el lease): su commit marcó el lote como terminado
+    resultados = {"familias": {"created": [{"local_id": "f-1", "remote_id": 2, "status": "success"}]}}
+    with cola.app_context():
+        assert finish_batch(lote_id, resultados, trabajo['job_id'])
+        db.session.commit()
+    familias = _familias(cola)
+
+    with cola.app_context():
+        jobs.run_changes_job(trabajo['job_id'])
+        estado = jobs.read_job(trabajo['job_id'])
+        assert not finish_batch(lote_id, resultados, trabajo['job_id'])
+
+    assert _familias(cola) == familias
+    assert estado['status'] == jobs.ESTADO_TERMINADO
+    assert estado['sync_results'] == resultados
+
+
+def _esperar(client, headers, job_id, segundos=10):
+    limite = time.monotonic() + segundos
+    while True:
+        respuesta = client.get(f'/api/v1/sync/jobs/{job_id}', headers=headers)
+        assert respuesta.status_code == 200, respuesta.get_json()
+        if respuesta.get_json()['status'] in (jobs.ESTADO_TERMINADO, jobs.ESTADO_FALLIDO) or time.monotonic() > limite:
+            return respuesta
+        time.sleep(0.05)
+
+
+def test_post_asincrono_responde_202_y_se_consulta_en_jobs(app, client, auth_headers):
+    app.config['SYNC_ASYNC_MIN_ITEMS'] = 1
+    familias = _familias(app)
+
+    respuesta = client.post('/api/v1/sync/changes?async=1', json=LOTE, headers=auth_headers)
+    assert respuesta.status_code == 202
+    datos = respuesta.get_json()
+    assert datos['status'] == jobs.ESTADO_EN_COLA
+    assert respuesta.headers['Location'] == datos['status_url'] == f"/api/v1/sync/jobs/{datos['job_id']}"
+
+    terminado = _esperar(client, auth_headers, datos['job_id'])
+    resultado = terminado.get_json()
+    assert resultado['status'] == jobs.ESTADO_TERMINADO, resultado
+    assert 'Retry-After' not in terminado.headers
+    assert resultado['sync_results']['familias']['created'][0]['status'] == 'success'
+    assert resultado['started_at'] and resultado['finished_at']
+    assert _familias(app) == familias + 1
+
+    # Un usuario solo ve sus propios trabajos
+    with app.app_context():
+        otro = {'Authorization': f"Bearer {create_access_token(identity='user2')}"}
+    assert client.get(datos['status_url'], headers=otro).status_code == 404
+    assert client.get('/api/v1/sync/jobs/no-existe', headers=auth_headers).status_code == 404
+
+
+def test_trabajo_en_cola_se_consulta_con_retry_after(cola, client, auth_headers):
+    trabajo = _encolar(cola)
+    respuesta = client.get(f"/api/v1/sync/jobs/{trabajo['job_id']}", headers=auth_headers)
+    assert respuesta.get_json()['status'] == jobs.ESTADO_EN_COLA
+    assert respuesta.headers['Retry-After'] == '5'
+
+
+def test_un_trabajo_se_toma_una_sola_vez(cola):
+    trabajo = _encolar(cola)
+    with cola.app_context():
+        en_proceso = jobs._tomar(trabajo['job_id'])
+        assert en_proceso and os.path.exists(en_proceso)
+        assert jobs._tomar(trabajo['job_id']) is None
+        # Tomado: pending_jobs no lo ofrece y run_changes_job lo ignora
+        assert jobs.pending_jobs() == []
+        jobs.run_changes_job(trabajo['job_id'])
+        assert jobs.read_job(trabajo['job_id'])['status'] == jobs.ESTADO_EN_COLA
+
+
+def test_lease_vencido_vuelve_a_la_cola(cola):
+    cola.config['SYNC_JOB_LEASE'] = 60
+    vencido, vigente = _encolar(cola), _encolar(cola)
+    familias = _familias(cola)
+    with cola.app_context():
+        # Dos trabajos tomados: uno cuyo worker dejó de renovar el lease y otro que lo renueva
+        abandonado = jobs._tomar(vencido['job_id'])
+        jobs._tomar(vigente['job_id'])
+        antes = time.time() - 120
+        os.utime(abandonado, (antes, antes))
+        assert jobs.pending_jobs() == []
+
+        assert jobs.pending_jobs(incluir_en_proceso=True) == [vencido['job_id']]
+        assert not os.path.exists(abandonado)
+        assert jobs.read_job(vencido['job_id'])['status'] == jobs.ESTADO_EN_COLA
+
+        jobs.run_changes_job(vencido['job_id'])
+        estado = jobs.read_job(vencido['job_id'])
+        assert estado['status'] == jobs.ESTADO_TERMINADO
+        assert db.session.get(SyncBatch, estado['lote_id']).status == 'done'
+    assert _familias(cola) == familias + 1
+
+
+def test_latido_renueva_el_lease(tmp_path):
+    en_proceso = tmp_path / 'trabajo.running.1-a'
+    en_proceso.write_bytes(b'{}')
+    antes = time.time() - 120
+    os.utime(en_proceso, (antes, antes))
+
+    detener = threading.Event()
+    latido = threading.Thread(target=jobs._latido, args=(str(en_proceso), 0.01, detener))
+    latido.start()
+    time.sleep(0.1)
+    detener.set()
+    latido.join()
+    assert os.path.getmtime(en_proceso) > antes + 60
+
+
+def test_fallo_libera_el_lote(cola, client, auth_headers):
+    trabajo = _encolar(cola, b'{"familias": {"created": [')
+    familias = _familias(cola)
+    with cola.app_context():
+        jobs.run_changes_job(trabajo['job_id'])
+        estado = jobs.read_job(trabajo['job_id'])
+        # El lote se borra para que un reintento vuelva a procesar el cuerpo
+        assert db.session.get(SyncBatch, trabajo['lote_id']) is None
+        assert not os.path.exists(jobs._ruta(trabajo['job_id'], 'body'))
+
+    assert estado['status'] == jobs.ESTADO_FALLIDO and estado['error']
+    assert _familias(cola) == familias
+    respuesta = client.get(f"/api/v1/sync/jobs/{trabajo['job_id']}", headers=auth_headers).get_json()
+    assert respuesta['status'] == jobs.ESTADO_FALLIDO and respuesta['error'] == estado['error']
@@ -0,0 +1,125 @@
+# tests/test_pagination.py
+# Paginación de GET /initial-data y GET /changes: validación de per_page y recorrido por cursor
+# sobre el territorio de conftest.seed_territorio.
+import datetime
+
+import pytest
+
+from app.models import db, ApsFichaFamilia
+from app.sync.visitas_vigentes import rebuild_visitas_vigentes, refresh_visitas_vigentes
+from tests.conftest import agregar_visita, agregar_persona
+
+INITIAL_DATA = '/api/v1/sync/initial-data'
+CHANGES = '/api/v1/sync/changes'
+
+
+@pytest.fixture(params=['tablas_base', 'tabla_lectura'])
+def modo(request, territorio):
+    """Descarga calculada sobre las tablas base o sobre aps_familia_visita_vigente."""
+    territorio.config['SYNC_USE_VISITAS_VIGENTES'] = request.param == 'tabla_lectura'
+    if request.param == 'tabla_lectura':
+        with territorio.app_context():
+            rebuild_visitas_vigentes()
+    return request.param
+
+
+@pytest.mark.parametrize('url, params', [
+    (INITIAL_DATA, {}),
+    (INITIAL_DATA, {'cursor': ''}),
+    (INITIAL_DATA, {'pages': '1-2'}),
+    (CHANGES, {'since': '2024-01-01T00:00:00'}),
+])
+@pytest.mark.parametrize('per_page', [0, -1])
+def test_per_page_menor_que_uno(territorio, client, auth_headers, url, params, per_page):
+    respuesta = client.get(url, query_string={**params, 'per_page': per_page}, headers=auth_headers)
+    assert respuesta.status_code == 400
+    assert respuesta.get_json()['error'] == 'invalid_per_page'
+
+
+@pytest.mark.parametrize('url, params', [
+    (INITIAL_DATA, {}),
+    (INITIAL_DATA, {'cursor': ''}),
+    (CHANGES, {'since': '2024-01-01T00:00:00'}),
+])
+@pytest.mark.usefixtures('modo')
+def test_per_page_se_recorta_al_maximo(territorio, client, auth_headers, url, params):
+    territorio.config['SYNC_MAX_PER_PAGE'] = 2
+    datos = client.get(url, query_string={**params, 'per_page': 1000}, headers=auth_headers).get_json()
+    assert datos['pagination_meta']['per_page'] == 2
+    assert len(datos['transactional_data']['familias']) == 2
+    assert datos['pagination_meta']['has_next'] is True
+
+
+def _recorrer(client, auth_headers, url, params, al_pasar_pagina=None):
+    """Sigue next_cursor desde la primera página hasta has_next falso; devuelve las páginas."""
+    paginas = []
+    cursor = ''
+    while True:
+        respuesta = client.get(url, query_string={**params, 'cursor': cursor, 'per_page': 2}, headers=auth_headers)
+        assert respuesta.status_code == 200, respuesta.get_json()
+        datos = respuesta.get_json()
+        paginas.append(datos)
+        meta = datos['pagination_meta']
+        if not meta['has_next']:
+            assert meta['next_cursor'] is None
+            return paginas
+        assert len(paginas) <= 10
+        if al_pasar_pagina:
+            al_pasar_pagina(len(paginas))
+        cursor = meta['next_cursor']
+
+
+def _familias(paginas):
+    return [f['id'] for datos in paginas for f in datos['transactional_data']['familias']]
+
+
+@pytest.mark.usefixtures('modo')
+def test_recorrido_por_cursor_de_initial_data(client, auth_headers):
+    paginas = _recorrer(client, auth_headers, INITIAL_DATA, {})
+    assert [[f['id'] for f in datos['transactional_data']['familias']] for datos in paginas] == [[1, 2], [3, 4], [7]]
+    assert all(datos['pagination_meta']['total'] == 5 for datos in paginas)
+    # Todas las páginas pertenecen al snapshot de la primera
+    assert len({datos['pagination_meta']['as_of'] for datos in paginas}) == 1
+
+
+@pytest.mark.usefixtures('modo')
+def test_cursor_no_mueve_familias_con_visitas_nuevas(territorio, client, auth_headers):
+    def sincroniza_otro_usuario(pagina):
+        if pagina != 1:
+            return
+        with territorio.app_context():
+            # Visita más reciente de la familia 3 (aún no entregada) con una versión nueva de su
+            # persona, otra de la familia 1 (ya entregada) y una familia nueva en el territorio
+            agregar_visita(12, 3, datetime.date(2024, 6, 1))
+            agregar_persona(12, 3, 12, '300', fecha=datetime.date(2024, 6, 1))
+            agregar_visita(13, 1, datetime.date(2024, 6, 1))
+            db.session.add(ApsFichaFamilia(
+                id=9, apellido_familiar='Nueva', estado_ficha=800, created_at=datetime.datetime(2024, 6, 1),
+                updated_at=datetime.datetime(2024, 6, 1), created_by=1, updated_by=1
+            ))
+            agregar_visita(14, 9, datetime.date(2024, 6, 1))
+            agregar_persona(13, 9, 14, '900')
+            refresh_visitas_vigentes([1, 3, 9])
+            db.session.commit()
+
+    paginas = _recorrer(client, auth_headers, INITIAL_DATA, {}, sincroniza_otro_usuario)
+    assert _familias(paginas) == [1, 2, 3, 4, 7]
+    secciones = paginas[1]['transactional_data']
+    assert sorted(v['id'] for v in secciones['visitas']) == [4, 6]
+    assert sorted(p['id'] for p in secciones['personas']) == [5, 6]
+
+    # Una descarga nueva sí ve los cambios
+    assert _familias(_recorrer(client, auth_headers, INITIAL_DATA, {})) == [1, 2, 3, 4, 7, 9]
+
+
+@pytest.mark.usefixtures('modo')
+def test_recorrido_por_cursor_de_changes(client, auth_headers):
+    params = {'since': '2024-01-01T00:00:00'}
+    completa = client.get(CHANGES, query_string={**params, 'per_page': 100}, headers=auth_headers).get_json()
+    esperadas = [f['id'] for f in completa['transactional_data']['familias']]
+    assert len(esperadas) > 2
+
+    paginas = _recorrer(client, auth_headers, CHANGES, params)
+    familias = _familias(paginas)
+    assert familias == sorted(esperadas) and len(set(familias)) == len(familias)
+    assert all(datos['pagination_meta']['since'] == '2024-01-01T00:00:00' for datos in paginas)
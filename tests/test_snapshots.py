@@ -0,0 +1,61 @@
+# tests/test_snapshots.py
+# Snapshot nocturno de initial-data (`flask sync build-snapshots`) servido con snapshot=1.
+import gzip
+import json
+
+import pytest
+
+from app.sync.snapshots import build_snapshot, snapshot_path
+from app.sync.visitas_vigentes import rebuild_visitas_vigentes
+
+URL = '/api/v1/sync/initial-data?snapshot=1'
+
+
+@pytest.fixture
+def snapshot(territorio, tmp_path):
+    territorio.config['SYNC_SNAPSHOT_DIR'] = str(tmp_path / 'snapshots')
+    with territorio.app_context():
+        rebuild_visitas_vigentes()
+        ruta, total = build_snapshot((1,), per_page=2)
+        assert ruta == snapshot_path([1]) and total == 5
+    with open(ruta, 'rb') as archivo:
+        return archivo.read()
+
+
+def _familias(documento):
+    return [f['id'] for pagina in documento['pages'] for f in pagina['transactional_data']['familias']]
+
+
+def test_snapshot_con_gzip_se_envia_tal_como_esta_en_disco(snapshot, client, auth_headers):
+    respuesta = client.get(URL, headers={**auth_headers, 'Accept-Encoding': 'gzip'})
+    assert respuesta.status_code == 200
+    assert respuesta.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in respuesta.headers['Vary']
+    assert respuesta.data == snapshot
+
+    documento = json.loads(gzip.decompress(respuesta.data))
+    assert _familias(documento) == [1, 2, 3, 4, 7]
+    assert documento['snapshot']['comunas'] == [1]
+
+
+def test_snapshot_sin_gzip_se_descomprime(snapshot, client, auth_headers):
+    respuesta = client.get(URL, headers={**auth_headers, 'Accept-Encoding': 'identity'})
+    assert respuesta.status_code == 200
+    assert 'Content-Encoding' not in respuesta.headers
+    assert respuesta.data == gzip.decompress(snapshot)
+    assert _familias(json.loads(respuesta.data)) == [1, 2, 3, 4, 7]
+
+
+def test_snapshot_ignora_range(snapshot, client, auth_headers):
+    # Un rango del archivo comprimido no es un fragmento válido del JSON
+    respuesta = client.get(URL, headers={**auth_headers, 'Accept-Encoding': 'gzip', 'Range': 'bytes=0-99'})
+    assert respuesta.status_code == 200
+    assert 'Content-Range' not in respuesta.headers and 'Accept-Ranges' not in respuesta.headers
+    assert respuesta.data == snapshot
+
+
+def test_snapshot_responde_304_al_revalidar(snapshot, client, auth_headers):
+    headers = {**auth_headers, 'Accept-Encoding': 'gzip'}
+    etag = client.get(URL, headers=headers).headers['ETag']
+    respuesta = client.get(URL, headers={**headers, 'If-None-Match': etag})
+    assert respuesta.status_code == 304 and respuesta.data == b''
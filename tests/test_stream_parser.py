@@ -0,0 +1,126 @@
+# tests/test_stream_parser.py
+# Lectura incremental del cuerpo de POST /changes (app/sync/stream_parser.py).
+import io
+import json
+
+import pytest
+
+from app.sync.stream_parser import InvalidChangesBody, count_stream_items, iter_change_items
+
+CUERPO = {
+    "familias": {
+        "created": [
+            {"local_id": 1, "apellido_familiar": "Muñoz \"el viejo\"\n", "estrato": 3},
+            {"local_id": 2, "apellido_familiar": "é😀", "latitud": -75.5612, "altitud": 1.5e-3},
+        ],
+        "updated": [{"remote_id": 10, "vigencia_registro": True, "observaciones": None}],
+    },
+    "visitas": {"created": [{"local_id": 7, "aps_ficha_familia_local_id": 1, "peso": -2500.25, "talla": 1E+2}]},
+    "personas": {"deleted": []},
+}
+
+
+class _Stream(io.BytesIO):
+    """BytesIO que cuenta las lecturas."""
+
+    lecturas = 0
+
+    def read(self, n=-1):
+        self.lecturas += 1
+        return super().read(n)
+
+
+def _esperados(cuerpo):
+    return [
+        (seccion, accion, item)
+        for seccion, acciones in cuerpo.items()
+        for accion, items in acciones.items()
+        for item in items
+    ]
+
+
+def _leer(datos, chunk_bytes=64 * 1024, **kwargs):
+    return list(iter_change_items(io.BytesIO(datos), chunk_bytes, **kwargs))
+
+
+@pytest.mark.parametrize('chunk_bytes', [1, 2, 3, 7, 64])
+@pytest.mark.parametrize('ensure_ascii', [True, False])
+def test_valores_cortados_entre_bloques(chunk_bytes, ensure_ascii):
+    # Cadenas, escapes \uXXXX, números, literales y caracteres multibyte cortados en cualquier punto
+    datos = json.dumps(CUERPO, ensure_ascii=ensure_ascii).encode('utf-8')
+    assert _leer(datos, chunk_bytes) == _esperados(CUERPO)
+
+
+def test_todos_los_cortes_de_un_item():
+    datos = json.dumps(CUERPO).encode('utf-8')
+    for corte in range(1, len(datos)):
+        partes = iter([datos[:corte], datos[corte:]])
+        stream = type('S', (), {'read': lambda self, n: next(partes, b'')})()
+        assert list(iter_change_items(stream, len(datos))) == _esperados(CUERPO), corte
+
+
+def test_secciones_con_forma_inesperada_se_ignoran():
+    cuerpo = {"familias": [1, 2], "visitas": {"created": {"a": 1}, "updated": [{"remote_id": 3}]}, "x": "y"}
+    assert _leer(json.dumps(cuerpo).encode('utf-8'), 3) == [("visitas", "updated", {"remote_id": 3})]
+
+
+@pytest.mark.parametrize('datos', [
+    b'{"familias": {"created": [{"local_id": 1,, "estrato": 3}]}}',
+    b'{"familias": {"created": [{"local_id" 1}]}}',
+    b'{"familias": {"created": [{"local_id": 01}]}}',
+    b'{"familias": {"created": [{"local_id": 1.}]}}',
+    b'{"familias": {"created": [{"apellido": "a\\x"}]}}',
+    b'{"familias": {"created": [{"apellido": "a\x01"}]}}',
+    b'{"familias": {"created": [tru]}}',
+    b'{"familias": {"created": [{"local_id": 1} {"local_id": 2}]}}',
+    b'{"familias": {"created": [{"local_id": 1}',
+    b'{"familias": {"created": [{"apellido": "sin cerrar',
+    b'{"familias": {"created": [{"apellido": "\xff"}]}}',
+    b'[{"local_id": 1}]',
+    b'',
+])
+def test_items_mal_formados(datos):
+    with pytest.raises(InvalidChangesBody):
+        _leer(datos, 4)
+
+
+def test_item_mal_formado_falla_sin_leer_el_resto():
+    # El error está en medio del buffer: no se lee el resto del cuerpo buscando completarlo
+    datos = b'{"familias": {"created": [{"local_id": 1,, "estrato": 3}' + b', {"local_id": 2}' * 100000 + b']}}'
+    stream = _Stream(datos)
+    with pytest.raises(InvalidChangesBody):
+        list(iter_change_items(stream, 1024))
+    assert stream.lecturas <= 2
+
+
+@pytest.mark.parametrize('datos', [
+    b'{"familias": {"created": [{"local_id": 1}]}} {"otro": 1}',
+    b'{"familias": {"created": [{"local_id": 1}]}}]',
+    b'{"familias": {"created": [{"local_id": 1}]}}x',
+])
+def test_contenido_despues_del_documento(datos):
+    with pytest.raises(InvalidChangesBody):
+        _leer(datos, 5)
+
+
+def test_espacios_despues_del_documento():
+    assert _leer(b'{"familias": {"created": [{"local_id": 1}]}}\r\n  \n', 5) == [
+        ("familias", "created", {"local_id": 1})
+    ]
+
+
+def test_maximo_por_valor():
+    grande = {"familias": {"created": [{"local_id": 1, "observaciones": "x" * 5000}]}}
+    datos = json.dumps(grande).encode('utf-8')
+    assert len(_leer(datos, 256, max_item_bytes=10000)) == 1
+
+    stream = _Stream(json.dumps({"familias": {"created": [{"observaciones": "x" * 10 ** 6}]}}).encode('utf-8'))
+    with pytest.raises(InvalidChangesBody, match='máximo'):
+        list(iter_change_items(stream, 256, max_item_bytes=4096))
+    assert stream.lecturas < 30
+
+
+def test_count_stream_items_deja_el_archivo_al_inicio():
+    archivo = io.BytesIO(json.dumps(CUERPO).encode('utf-8'))
+    assert count_stream_items(archivo) == len(_esperados(CUERPO))
+    assert archivo.tell() == 0
@@ -0,0 +1,217 @@
+# tests/test_sync_changes.py
+# POST /api/v1/sync/changes aplicado con el registro de entidades (app/sync/entities.py) frente a
+# los sync_results que devolvía el procesamiento escrito a mano por sección.
+import copy
+import datetime
+import re
+
+import pytest
+
+from app.models import db, ApsFichaFamilia, ApsVisita, ApsCondicionesHabitatFamilia, ApsPersona, \
+                       ApsPersonaEstilosVidaConducta
+from app.sync.entities import ENTIDADES, ENTIDADES_POR_SECCION
+
+URL = '/api/v1/sync/changes'
+
+LOTE = {
+    "familias": {
+        "created": [{"id": "f-1", "apellido_familiar": "Gómez", "celular_cabeza_familia": "301", "estado_ficha": 800,
+                     "created_at": "2024-03-01T10:00:00", "created_by": 1, "updated_by": 1, "remote_id": None, "is_synced": 0}],
+        "updated": [
+            {"id": "f-2", "remote_id": 1, "apellido_familiar": "Pérez Ruiz", "last_modified_at": "2024-03-02T09:00:00"},
+            {"id": "f-3", "apellido_familiar": "Sin remoto"},
+            {"id": "f-4", "remote_id": 999, "apellido_familiar": "No existe", "last_modified_at": "2024-03-02T09:00:00"},
+        ],
+        "deleted": [{"id": "f-5"}],
+    },
+    "visitas": {
+        "created": [
+            {"id": "v-1", "aps_ficha_familia_id": 1, "fecha_visita": "2024-03-01", "created_at": "2024-03-01",
+             "tipo_actividad": 2, "auth_oficina": 1, "com_profesion": 1, "duracion": 20, "created_by": 1, "updated_by": 1,
+             "estado_ficha": 800, "valido": True, "vigencia_registro": True, "remote_id": None, "is_synced": 0,
+             "last_modified_at": "2024-03-01"},
+            {"id": "v-2", "aps_ficha_familia_id": 1, "fecha_visita": "2024-03-01", "created_at": "2024-03-01",
+             "tipo_actividad": 2, "auth_oficina": 1, "com_profesion": 1, "duracion": 20, "created_by": None, "updated_by": 1,
+             "estado_ficha": 800, "valido": True, "vigencia_registro": True},
+        ],
+        "updated": [
+            {"id": "v-3", "remote_id": 1, "duracion": 45, "last_modified_at": "2024-01-01"},
+            {"id": "v-4", "duracion": 45},
+        ],
+        "deleted": [{"id": "v-5", "remote_id": 1}, {"id": "v-6", "remote_id": 999}],
+    },
+    "personas": {
+        "updated": [{"id": "p-2", "remote_id": 1, "nombres": "Ana María", "last_modified_at": "2024-03-02"}],
+    },
+    "condiciones_habitat_familia": {
+        "created": [{"id": "h-1", "aps_visita_id": 1, "aps_ficha_familia": 1, "aps_aspectos_generales_txt": "1,2",
+                     "aps_condiciones_locativas_txt": "", "aps_condiciones_agua_txt": "", "aps_dotacion_sanitaria_txt": "",
+                     "aps_alimentos_txt": "", "aps_tenencia_animales_txt": "", "aps_entorno_vivienda_txt": "",
+                     "created_at": "2024-03-01", "created_by": 1, "updated_by": 1}],
+    },
+    "persona_estilos_vida_conducta": {
+        "updated": [{"id": "e-1", "remote_id": 1, "peso": "61.5", "talla": "1.62", "last_modified_at": "2024-03-02"}],
+        "deleted": [{"id": "e-2"}],
+    },
+    "seccion_desconocida": {"created": [{"id": "x-1"}]},
+}
+
+HOY = '<hoy>'
+AHORA = '<ahora>'
+ERROR_BD = '<IntegrityError>'
+
+# sync_results del procesamiento por sección anterior al registro de entidades para LOTE, con
+# las fechas del servidor y los errores de la base normalizados (ver _normalizar)
+RESULTADOS_BASE = {
+    "familias": {
+        "created": [{"local_id": "f-1", "remote_id": 2, "new_last_modified_at": AHORA, "status": "success"}],
+        "updated": [
+            {"local_id": "f-2", "remote_id": 1, "new_last_modified_at": AHORA, "status": "success",
+             "conflict_resolved": "LWW"},
+            {"local_id": "f-3", "status": "failed", "error": "No remote_id provided for update"},
+            {"local_id": "f-4", "remote_id": 999, "status": "failed", "error": "Record not found on server"},
+        ],
+        "deleted": [{"local_id": "f-5", "status": "failed", "error": "No remote_id provided for deletion"}],
+    },
+    "visitas": {
+        "created": [
+            {"local_id": "v-1", "remote_id": 2, "new_last_modified_at": HOY, "status": "success"},
+            {"local_id": "v-2", "status": "failed", "error": ERROR_BD},
+        ],
+        "updated": [
+            {"local_id": "v-3", "remote_id": 1, "new_last_modified_at": "2024-01-05", "status": "success",
+             "conflict_resolved": "skipped_older_mobile_version"},
+            {"local_id": "v-4", "status": "failed", "error": "No remote_id provided"},
+        ],
+        "deleted": [
+            {"local_id": "v-5", "remote_id": 1, "new_last_modified_at": HOY, "status": "success", "action": "soft_deleted"},
+            {"local_id": "v-6", "remote_id": 999, "status": "failed", "error": "Record not found on server for deletion"},
+        ],
+    },
+    "personas": {
+        "created": [],
+        "updated": [{"local_id": "p-2", "remote_id": 1, "new_last_modified_at": HOY, "status": "success",
+                     "conflict_resolved": "LWW"}],
+        "deleted": [],
+    },
+    "ubicaciones_familia": {"created": [], "updated": [], "deleted": []},
+    # Antes se ignoraba esta sección; ahora se aplica como las demás (ver RESULTADOS_HABITAT)
+    "condiciones_habitat_familia": {"created": [], "updated": [], "deleted": []},
+    "persona_antecedente_medico": {"created": [], "updated": [], "deleted": []},
+    "persona_componente_mental": {"created": [], "updated": [], "deleted": []},
+    "persona_condiciones_salud": {"created": [], "updated": [], "deleted": []},
+    "persona_dato_basico": {"created": [], "updated": [], "deleted": []},
+    "persona_estilos_vida_conducta": {
+        "created": [],
+        "updated": [{"local_id": "e-1", "remote_id": 1, "new_last_modified_at": HOY, "status": "success",
+                     "conflict_resolved": "LWW"}],
+        "deleted": [{"local_id": "e-2", "status": "failed", "error": "No remote_id provided"}],
+    },
+    "persona_maternidad": {"created": [], "updated": [], "deleted": []},
+    "persona_practicas_salud_salud_sexual": {"created": [], "updated": [], "deleted": []},
+}
+
+RESULTADOS_HABITAT = {
+    "created": [{"local_id": "h-1", "remote_id": 2, "new_last_modified_at": HOY, "status": "success"}],
+    "updated": [],
+    "deleted": [],
+}
+
+
+def _normalizar(sync_results):
+    # Fechas del servidor -> <hoy>/<ahora>; errores de la base -> <clase de la excepción>
+    hoy = datetime.date.today().isoformat()
+    resultados = copy.deepcopy(sync_results)
+    for acciones in resultados.values():
+        for items in acciones.values():
+            for item in items:
+                fecha = item.get('new_last_modified_at')
+                if fecha == hoy:
+                    item['new_last_modified_at'] = HOY
+                elif fecha and fecha.startswith(hoy + 'T'):
+                    item['new_last_modified_at'] = AHORA
+                error = re.match(r'\((?:\w+\.)*(\w+)\)', item.get('error', ''))
+                if error:
+                    item['error'] = f"<{error.group(1)}>"
+    return resultados
+
+
+def _esperados():
+    esperados = copy.deepcopy(RESULTADOS_BASE)
+    esperados['condiciones_habitat_familia'] = copy.deepcopy(RESULTADOS_HABITAT)
+    return esperados
+
+
+@pytest.mark.parametrize('incremental', [False, True], ids=['request.json', 'stream'])
+def test_lote_igual_al_procesamiento_por_seccion(app, client, auth_headers, incremental):
+    if incremental:
+        app.config.update(SYNC_STREAM_MIN_BODY_BYTES=0, SYNC_STREAM_BUFFER_ITEMS=1)
+
+    respuesta = client.post(URL, json=copy.deepcopy(LOTE), headers=auth_headers)
+
+    assert respuesta.status_code == 200
+    assert _normalizar(respuesta.get_json()['sync_results']) == _esperados()
+
+    with app.app_context():
+        assert db.session.get(ApsFichaFamilia, 1).apellido_familiar == 'Pérez Ruiz'
+        assert db.session.get(ApsFichaFamilia, 2).apellido_familiar == 'Gómez'
+        visita = db.session.get(ApsVisita, 1)
+        assert (visita.duracion, visita.valido, visita.invalidated_by) == (30, False, 1)
+        assert db.session.get(ApsVisita, 2).fecha_visita == datetime.date(2024, 3, 1)
+        assert db.session.get(ApsVisita, 3) is None
+        assert db.session.get(ApsPersona, 1).nombres == 'Ana María'
+        estilos = db.session.get(ApsPersonaEstilosVidaConducta, 1)
+        assert (float(estilos.peso), float(estilos.talla)) == (61.5, 1.62)
+        habitat = db.session.get(ApsCondicionesHabitatFamilia, 2)
+        assert (habitat.aps_visita_id, habitat.aps_ficha_familia) == (1, 1)
+
+
+def test_referencias_locales_en_el_mismo_lote(app, client, auth_headers):
+    # Los hijos llegan antes que sus padres en el documento: se aplican en orden de dependencia
+    lote = {
+        "condiciones_habitat_familia": {"created": [
+            {"id": "h-1", "aps_visita_local_id": "v-1", "aps_ficha_familia_local_id": "f-1",
+             "aps_aspectos_generales_txt": "", "aps_condiciones_locativas_txt": "", "aps_condiciones_agua_txt": "",
+             "aps_dotacion_sanitaria_txt": "", "aps_alimentos_txt": "", "aps_tenencia_animales_txt": "",
+             "aps_entorno_vivienda_txt": "", "created_at": "2024-03-01", "created_by": 1, "updated_by": 1},
+        ]},
+        "ubicaciones_familia": {"created": [
+            {"id": "u-2", "aps_visita_local_id": "v-no-existe", "zona": 1, "base_comuna_corregimiento_id": 1,
+             "base_barrio_vereda_id": 1, "direccion": "Calle 3", "created_at": "2024-03-01",
+             "created_by": "2024-03-01", "updated_by": "2024-03-01"},
+        ]},
+        "visitas": {"created": [
+            {"id": "v-1", "aps_ficha_familia_local_id": "f-1", "fecha_visita": "2024-03-01", "created_at": "2024-03-01",
+             "tipo_actividad": 2, "auth_oficina": 1, "com_profesion": 1, "duracion": 20, "created_by": 1,
+             "updated_by": 1, "estado_ficha": 800, "valido": True, "vigencia_registro": True},
+        ]},
+        "familias": {"created": [
+            {"id": "f-1", "apellido_familiar": "Gómez", "celular_cabeza_familia": "301", "estado_ficha": 800,
+             "created_at": "2024-03-01T10:00:00", "created_by": 1, "updated_by": 1},
+        ]},
+    }
+
+    respuesta = client.post(URL, json=lote, headers=auth_headers)
+
+    assert respuesta.status_code == 200
+    resultados = respuesta.get_json()['sync_results']
+    fallido, = resultados['ubicaciones_familia']['created']
+    assert fallido['status'] == 'failed' and 'v-no-existe' in fallido['error']
+    familia_id = resultados['familias']['created'][0]['remote_id']
+    visita_id = resultados['visitas']['created'][0]['remote_id']
+    with app.app_context():
+        assert db.session.get(ApsVisita, visita_id).aps_ficha_familia_id == familia_id
+        habitat = db.session.get(ApsCondicionesHabitatFamilia, resultados['condiciones_habitat_familia']['created'][0]['remote_id'])
+        assert (habitat.aps_visita_id, habitat.aps_ficha_familia) == (visita_id, familia_id)
+
+
+def test_clave_local_de_la_familia_es_la_misma_en_todas_las_secciones():
+    # condiciones_habitat_familia.aps_ficha_familia no termina en _id como las demás FK
+    claves = {
+        entidad.seccion: clave_local
+        for entidad in ENTIDADES
+        for _, clave_local, seccion_padre in entidad.referencias if seccion_padre == 'familias'
+    }
+    assert claves == dict.fromkeys(('visitas', 'personas', 'condiciones_habitat_familia'), 'aps_ficha_familia_local_id')
+    assert ('aps_ficha_familia', 'aps_ficha_familia_local_id', 'familias') in \
+        ENTIDADES_POR_SECCION['condiciones_habitat_familia'].referencias